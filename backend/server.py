@@ -1,16 +1,49 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Query, Request, Response
+from fastapi.responses import JSONResponse, ORJSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReplaceOne
+from pymongo.errors import DuplicateKeyError, OperationFailure
 import os
+import asyncio
+import importlib.util
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Callable, Awaitable, Set, Tuple, AsyncIterator, Iterator
 import uuid
-from datetime import datetime
+import secrets
+import hashlib
+import json
+import time
+import random
+import bisect
+import unicodedata
+import contextlib
+import codecs
+import re
+import sys
+import gzip
+import mmap
+import tempfile
+import xml.etree.ElementTree as ElementTree
+from collections import OrderedDict, Counter, deque
+from collections.abc import Sequence
+from array import array
+from datetime import datetime, timedelta
 import httpx
-from urllib.parse import urlencode
+from urllib.parse import urlencode, urljoin
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -21,7 +54,7 @@ client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
 
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse if orjson is not None else JSONResponse)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -33,253 +66,3560 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# ==================== MODELS ====================
+# ==================== MODELS ====================
+
+class LoginRequest(BaseModel):
+    username: str
+    password: str
+
+class LoginResponse(BaseModel):
+    success: bool
+    token: Optional[str] = None
+    expires_at: Optional[int] = None
+    user_info: Optional[Dict[str, Any]] = None
+    server_info: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+class Category(BaseModel):
+    category_id: str
+    category_name: str
+    parent_id: Optional[int] = 0
+
+class LiveStream(BaseModel):
+    stream_id: int
+    num: int
+    name: str
+    stream_type: str
+    stream_icon: Optional[str] = None
+    epg_channel_id: Optional[str] = None
+    added: Optional[str] = None
+    is_adult: Optional[str] = "0"
+    category_id: Optional[str] = None
+    custom_sid: Optional[str] = None
+    tv_archive: Optional[int] = 0
+    direct_source: Optional[str] = None
+    tv_archive_duration: Optional[int] = 0
+
+class CredentialsRequest(BaseModel):
+    """Body of routes that take a bearer token or, from older clients, credentials"""
+    username: Optional[str] = None
+    password: Optional[str] = None
+
+class EpgBatchRequest(BaseModel):
+    username: Optional[str] = None
+    password: Optional[str] = None
+    stream_ids: List[int] = Field(..., min_length=1, max_length=200)
+    limit: int = 10
+
+class StreamUrlRequest(BaseModel):
+    username: Optional[str] = None
+    password: Optional[str] = None
+    stream_id: int
+    extension: str = "m3u8"
+    # Follow the panel's redirect server-side and return the edge URL (PLAYBACK_RESOLVE when unset)
+    resolve: Optional[bool] = None
+
+# ==================== JSON ====================
+
+def json_dumps(data: Any) -> bytes:
+    """Compact JSON bytes, through orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(data, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, default=str, ensure_ascii=False, separators=(',', ':')).encode()
+
+def compact_record(item: Any) -> Any:
+    """Share key strings and short repeated values (ids, types, extensions) across records"""
+    if not isinstance(item, dict):
+        return item
+    return {
+        sys.intern(k): sys.intern(v) if isinstance(v, str) and len(v) <= 32 else v
+        for k, v in item.items()
+    }
+
+class JsonArrayReader:
+    """Incremental reader for a streamed top-level JSON array.
+
+    Feed raw chunks and get back each element as soon as it is complete,
+    so a large catalog is never held as one bytes blob plus one object
+    graph. Only the unfinished tail of the array is buffered.
+    """
+
+    _SKIP = re.compile(r'[\s,]*')
+
+    def __init__(self, compact: Callable[[Any], Any] = compact_record):
+        self._text = ''
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._decoder = json.JSONDecoder()
+        self._compact = compact
+        self._opened = False
+        self._closed = False
+
+    def feed(self, chunk: bytes) -> List[Any]:
+        self._text += self._utf8.decode(chunk)
+        return self._drain(final=False)
+
+    def close(self) -> List[Any]:
+        self._text += self._utf8.decode(b'', final=True)
+        items = self._drain(final=True)
+        if not self._closed:
+            raise ValueError("Truncated JSON array")
+        return items
+
+    def _drain(self, final: bool) -> List[Any]:
+        items = []
+        text, pos = self._text, 0
+        while not self._closed:
+            pos = self._SKIP.match(text, pos).end()
+            if pos >= len(text):
+                break
+            if not self._opened:
+                if text[pos] != '[':
+                    raise ValueError("Expected a JSON array")
+                self._opened = True
+                pos += 1
+                continue
+            if text[pos] == ']':
+                self._closed = True
+                pos += 1
+                break
+            try:
+                item, end = self._decoder.raw_decode(text, pos)
+            except json.JSONDecodeError:
+                if final:
+                    raise
+                break
+            # A number or literal at the very end of the buffer may continue in the next chunk
+            if end == len(text) and not final and not isinstance(item, (dict, list, str)):
+                break
+            items.append(self._compact(item))
+            pos = end
+        self._text = text[pos:]
+        return items
+
+# ==================== XTREAM CODES API HELPER ====================
+
+# Upstream connection pool settings (shared by every XtreamCodesAPI call)
+XTREAM_MAX_CONNECTIONS = int(os.environ.get('XTREAM_MAX_CONNECTIONS', '100'))
+XTREAM_MAX_KEEPALIVE = int(os.environ.get('XTREAM_MAX_KEEPALIVE', '20'))
+XTREAM_KEEPALIVE_EXPIRY = float(os.environ.get('XTREAM_KEEPALIVE_EXPIRY', '30'))
+XTREAM_PER_HOST_CONCURRENCY = int(os.environ.get('XTREAM_PER_HOST_CONCURRENCY', '32'))
+XTREAM_HTTP2 = os.environ.get('XTREAM_HTTP2', 'false').lower() in ('1', 'true', 'yes')
+XTREAM_TIMEOUT = float(os.environ.get('XTREAM_TIMEOUT', '30'))
+# Upstream governor: the panel bans clients that burst, so requests are paced and the
+# concurrency limit adapts between XTREAM_MIN_CONCURRENCY and XTREAM_PER_HOST_CONCURRENCY
+XTREAM_MIN_CONCURRENCY = int(os.environ.get('XTREAM_MIN_CONCURRENCY', '2'))
+XTREAM_RATE = float(os.environ.get('XTREAM_RATE', '20'))
+XTREAM_BURST = int(os.environ.get('XTREAM_BURST', '40'))
+XTREAM_LATENCY_TARGET = float(os.environ.get('XTREAM_LATENCY_TARGET', '2.0'))
+XTREAM_ACTION_CONCURRENCY = int(os.environ.get('XTREAM_ACTION_CONCURRENCY', '16'))
+# Per-action overrides, e.g. "get_vod_streams=2,get_series=2,xmltv=1"
+XTREAM_ACTION_LIMITS = {
+    action.strip(): int(limit)
+    for action, _, limit in (part.partition('=') for part in os.environ.get(
+        'XTREAM_ACTION_LIMITS', 'get_live_streams=4,get_vod_streams=2,get_series=2,xmltv=1'
+    ).split(','))
+    if action.strip() and limit.strip().isdigit()
+}
+
+class TokenBucket:
+    """Request pacing: `rate` tokens per second, bursting up to `burst`"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def take(self):
+        if self.rate <= 0:
+            return
+        # One waiter at a time, so tokens go out in arrival order
+        async with self._lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+class AdaptiveLimit:
+    """Concurrency limit tuned by AIMD.
+
+    Each request finishing under the latency target grows the limit by
+    1/limit, which adds about one slot per round trip. A failure, a 429/5xx,
+    or a slow response cuts the limit by `backoff`, at most once per
+    `cooldown` seconds, so one burst of failures counts as one signal.
+    """
+
+    def __init__(self, minimum: int, maximum: int, latency_target: float, backoff: float = 0.7, cooldown: Optional[float] = None):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(maximum)
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.cooldown = latency_target if cooldown is None else cooldown
+        self.in_flight = 0
+        self._waiters: deque = deque()
+        self._decreased_at = 0.0
+        self.increases = 0
+        self.decreases = 0
+
+    async def acquire(self):
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Woken and cancelled in the same tick: pass the slot on
+                self.in_flight -= 1
+                self._wake()
+            else:
+                self._waiters.remove(waiter)
+            raise
+
+    def release(self, latency: float, failed: bool):
+        self.in_flight -= 1
+        now = time.monotonic()
+        if failed or latency > self.latency_target:
+            if now - self._decreased_at >= self.cooldown:
+                self.limit = max(self.minimum, self.limit * self.backoff)
+                self._decreased_at = now
+                self.decreases += 1
+        elif self.limit < self.maximum:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.increases += 1
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+class GovernorTicket:
+    """One admitted upstream request; callers record the response status when headers arrive"""
+
+    __slots__ = ('action', 'admitted_at', 'responded_at', 'status')
+
+    def __init__(self, action: str):
+        self.action = action
+        self.admitted_at = time.monotonic()
+        self.responded_at: Optional[float] = None
+        self.status: Optional[int] = None
+
+    def responded(self, status: int):
+        self.status = status
+        self.responded_at = time.monotonic()
+
+    @property
+    def latency(self) -> float:
+        """Time to the response headers; reading a large body is not panel congestion"""
+        return (self.responded_at or time.monotonic()) - self.admitted_at
+
+class UpstreamGovernor:
+    """Admission control for every request to the panel.
+
+    A request passes, in order, its action's semaphore (so one heavy
+    catalog pull cannot take every slot), the adaptive global limit and
+    the token bucket. Time spent queueing is tracked per action, and the
+    adaptive limit is fed time to response headers, so streaming a large
+    catalog or guide does not count as congestion.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = XTREAM_PER_HOST_CONCURRENCY,
+        min_concurrency: int = XTREAM_MIN_CONCURRENCY,
+        rate: float = XTREAM_RATE,
+        burst: int = XTREAM_BURST,
+        latency_target: float = XTREAM_LATENCY_TARGET,
+        action_concurrency: int = XTREAM_ACTION_CONCURRENCY,
+        action_limits: Optional[Dict[str, int]] = None,
+    ):
+        self.limit = AdaptiveLimit(min(min_concurrency, max_concurrency), max_concurrency, latency_target)
+        self.bucket = TokenBucket(rate, burst)
+        self.action_concurrency = action_concurrency
+        self.action_limits = XTREAM_ACTION_LIMITS if action_limits is None else action_limits
+        self._action_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._actions: Dict[str, Dict[str, Any]] = {}
+
+    def _action(self, action: str) -> Dict[str, Any]:
+        stats = self._actions.get(action)
+        if stats is None:
+            stats = self._actions[action] = {
+                'requests': 0, 'errors': 0, 'in_flight': 0, 'waiting': 0,
+                'waits': deque(maxlen=500), 'latencies': deque(maxlen=500),
+            }
+            self._action_semaphores[action] = asyncio.Semaphore(self.action_limits.get(action, self.action_concurrency))
+        return stats
+
+    @contextlib.asynccontextmanager
+    async def admit(self, action: str):
+        stats = self._action(action)
+        semaphore = self._action_semaphores[action]
+        queued_at = time.monotonic()
+        stats['waiting'] += 1
+        try:
+            await semaphore.acquire()
+            try:
+                await self.limit.acquire()
+                try:
+                    await self.bucket.take()
+                except BaseException:
+                    self.limit.release(0, failed=False)
+                    raise
+            except BaseException:
+                semaphore.release()
+                raise
+        finally:
+            stats['waiting'] -= 1
+
+        ticket = GovernorTicket(action)
+        stats['waits'].append(ticket.admitted_at - queued_at)
+        stats['requests'] += 1
+        stats['in_flight'] += 1
+        failed = False
+        try:
+            yield ticket
+        except Exception:
+            failed = True
+            raise
+        finally:
+            latency = ticket.latency
+            failed = failed or ticket.status is not None and (ticket.status == 429 or ticket.status >= 500)
+            stats['latencies'].append(latency)
+            stats['in_flight'] -= 1
+            if failed:
+                stats['errors'] += 1
+            self.limit.release(latency, failed)
+            semaphore.release()
+
+    @staticmethod
+    def _percentiles(values) -> Dict[str, Optional[float]]:
+        ordered = sorted(values)
+        if not ordered:
+            return {'p50_ms': None, 'p95_ms': None, 'max_ms': None}
+        pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+        return {'p50_ms': pick(0.5), 'p95_ms': pick(0.95), 'max_ms': round(ordered[-1] * 1000, 2)}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'concurrency_limit': round(self.limit.limit, 2),
+            'concurrency_bounds': [self.limit.minimum, self.limit.maximum],
+            'in_flight': self.limit.in_flight,
+            'waiting': self.limit.waiting,
+            'limit_increases': self.limit.increases,
+            'limit_decreases': self.limit.decreases,
+            'rate': self.bucket.rate,
+            'tokens': round(self.bucket.tokens, 2),
+            'actions': {
+                action: {
+                    'requests': s['requests'],
+                    'errors': s['errors'],
+                    'in_flight': s['in_flight'],
+                    'waiting': s['waiting'],
+                    'queue_wait': self._percentiles(s['waits']),
+                    'latency': self._percentiles(s['latencies']),
+                }
+                for action, s in self._actions.items()
+            },
+        }
+
+    def latency_quantile(self, action: str, q: float, min_samples: int = 20) -> Optional[float]:
+        """Recent latency quantile of an action in seconds, or None with too few samples"""
+        stats = self._actions.get(action)
+        if stats is None or len(stats['latencies']) < min_samples:
+            return None
+        ordered = sorted(stats['latencies'])
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+# Circuit breaker: an action failing this many times in a row is cut off for
+# XTREAM_BREAKER_COOLDOWN seconds, then a single probe decides whether it closes
+XTREAM_BREAKER_FAILURES = int(os.environ.get('XTREAM_BREAKER_FAILURES', '5'))
+XTREAM_BREAKER_COOLDOWN = float(os.environ.get('XTREAM_BREAKER_COOLDOWN', '30'))
+# Retries of idempotent calls, with full-jitter exponential backoff
+XTREAM_RETRIES = int(os.environ.get('XTREAM_RETRIES', '2'))
+XTREAM_RETRY_BACKOFF = float(os.environ.get('XTREAM_RETRY_BACKOFF', '0.25'))
+# Deadline of one player_api.php JSON attempt; catalog streams rely on the read timeout
+XTREAM_ATTEMPT_TIMEOUT = float(os.environ.get('XTREAM_ATTEMPT_TIMEOUT', '8'))
+# A second JSON attempt is sent when the first is slower than the action's p95
+# (or XTREAM_HEDGE_DELAY until enough latencies are known)
+XTREAM_HEDGE_DELAY = float(os.environ.get('XTREAM_HEDGE_DELAY', '1.5'))
+XTREAM_HEDGE_MIN_DELAY = float(os.environ.get('XTREAM_HEDGE_MIN_DELAY', '0.2'))
+# Hops followed when resolving a playback URL to its edge
+XTREAM_MAX_REDIRECTS = int(os.environ.get('XTREAM_MAX_REDIRECTS', '5'))
+# Relayed segments come from the edges and scale with viewers, so they bypass the governor
+# (whose rate and latency target are tuned for player_api) and have limits of their own
+XTREAM_SEGMENT_CONCURRENCY = int(os.environ.get('XTREAM_SEGMENT_CONCURRENCY', '32'))
+XTREAM_SEGMENT_TIMEOUT = float(os.environ.get('XTREAM_SEGMENT_TIMEOUT', '20'))
+
+RETRYABLE_STATUS = frozenset({429, 500, 502, 503, 504})
+
+class UpstreamUnavailable(Exception):
+    """Raised without contacting the panel while an action's circuit is open"""
+
+def is_retryable(error: BaseException) -> bool:
+    """Transport failures, timeouts and throttling/5xx responses are worth another attempt"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRYABLE_STATUS
+    return isinstance(error, (httpx.TransportError, asyncio.TimeoutError))
+
+class CircuitBreaker:
+    """Closed, open or half-open state of one upstream action.
+
+    Closed passes everything. After `failures` consecutive failures it
+    opens and rejects calls for `cooldown` seconds; then it is half-open
+    and lets one probe through, which closes it on success or reopens it.
+    """
+
+    def __init__(self, failures: int = XTREAM_BREAKER_FAILURES, cooldown: float = XTREAM_BREAKER_COOLDOWN):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return 'open'
+        return 'half_open'
+
+    def check(self, action: str):
+        state = self.state
+        if state == 'closed':
+            return
+        if state == 'half_open' and not self.probing:
+            self.probing = True
+            return
+        self.rejected += 1
+        raise UpstreamUnavailable(f"Upstream {action} unavailable (circuit open)")
+
+    def record(self, failed: bool):
+        self.probing = False
+        if not failed:
+            self.consecutive_failures = 0
+            self.opened_at = None
+            return
+        self.consecutive_failures += 1
+        if self.opened_at is not None or self.consecutive_failures >= self.failures:
+            if self.opened_at is None or self.state == 'half_open':
+                self.opened += 1
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'state': self.state,
+            'consecutive_failures': self.consecutive_failures,
+            'opened': self.opened,
+            'rejected': self.rejected,
+        }
+
+class XtreamCodesAPI:
+    def __init__(
+        self,
+        base_url: str = "https://s.luxuztv.com:443",
+        max_connections: int = XTREAM_MAX_CONNECTIONS,
+        max_keepalive_connections: int = XTREAM_MAX_KEEPALIVE,
+        keepalive_expiry: float = XTREAM_KEEPALIVE_EXPIRY,
+        per_host_concurrency: int = XTREAM_PER_HOST_CONCURRENCY,
+        http2: bool = XTREAM_HTTP2,
+        timeout: float = XTREAM_TIMEOUT,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        governor: Optional['UpstreamGovernor'] = None,
+        retries: int = XTREAM_RETRIES,
+        retry_backoff: float = XTREAM_RETRY_BACKOFF,
+        attempt_timeout: float = XTREAM_ATTEMPT_TIMEOUT,
+        hedge_delay: Optional[float] = XTREAM_HEDGE_DELAY,
+        segment_concurrency: int = XTREAM_SEGMENT_CONCURRENCY,
+        segment_timeout: float = XTREAM_SEGMENT_TIMEOUT,
+    ):
+        self.base_url = base_url.rstrip('/')
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        # HTTP/2 needs the optional "h2" package; fall back to HTTP/1.1 keep-alive without it
+        self.http2 = http2 and importlib.util.find_spec('h2') is not None
+        if http2 and not self.http2:
+            logger.warning("XTREAM_HTTP2 requested but the 'h2' package is not installed, using HTTP/1.1")
+        self.per_host_concurrency = per_host_concurrency
+        self.timeout = timeout
+        self.transport = transport
+        self.governor = governor if governor is not None else UpstreamGovernor(max_concurrency=per_host_concurrency)
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.attempt_timeout = attempt_timeout
+        self.hedge_delay = hedge_delay
+        self.segment_timeout = segment_timeout
+        self._segment_slots = asyncio.Semaphore(segment_concurrency)
+        self._segment_stats = {'requests': 0, 'errors': 0, 'in_flight': 0, 'waiting': 0, 'bytes': 0}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._client: Optional[httpx.AsyncClient] = None
+        self._stats = {
+            'requests_total': 0,
+            'errors_total': 0,
+            'retries': 0,
+            'hedges': 0,
+            'hedge_wins': 0,
+            'in_flight': 0,
+            'peak_in_flight': 0,
+            'waiting': 0,
+            'clients_created': 0,
+        }
+        self._host_in_flight: Dict[str, int] = {}
+
+    def _new_client(self) -> httpx.AsyncClient:
+        self._stats['clients_created'] += 1
+        return httpx.AsyncClient(
+            verify=False,
+            timeout=self.timeout,
+            limits=self.limits,
+            http2=self.http2,
+            transport=self.transport,
+        )
+
+    async def start(self):
+        """Create the shared upstream client (called on app startup)"""
+        if self._client is None or self._client.is_closed:
+            self._client = self._new_client()
+
+    async def close(self):
+        """Close the shared upstream client and its pooled connections"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            # Lazily created when used outside the FastAPI lifecycle (scripts, tests)
+            self._client = self._new_client()
+        return self._client
+
+    @staticmethod
+    def _action(url: httpx.URL) -> str:
+        if url.path.endswith('/player_api.php'):
+            return url.params.get('action', 'auth')
+        if url.path.startswith(('/live/', '/movie/', '/series/')):
+            return 'playback'
+        return url.path.rsplit('/', 1)[-1].split('.')[0] or 'other'
+
+    @contextlib.asynccontextmanager
+    async def _slot(self, url: str, action: Optional[str] = None):
+        """Hold an upstream request slot, granted by the governor, for the duration of a request"""
+        parsed = httpx.URL(url)
+        host = parsed.host
+        action = action or self._action(parsed)
+        breaker = self._breaker(action)
+        # An open circuit fails fast instead of queueing behind the governor
+        breaker.check(action)
+        stats = self._stats
+        stats['waiting'] += 1
+        admitted = False
+        failed = True
+        try:
+            async with self.governor.admit(action) as ticket:
+                stats['waiting'] -= 1
+                admitted = True
+                stats['requests_total'] += 1
+                stats['in_flight'] += 1
+                stats['peak_in_flight'] = max(stats['peak_in_flight'], stats['in_flight'])
+                self._host_in_flight[host] = self._host_in_flight.get(host, 0) + 1
+                try:
+                    yield ticket
+                    failed = ticket.status in RETRYABLE_STATUS
+                except Exception:
+                    stats['errors_total'] += 1
+                    raise
+                finally:
+                    stats['in_flight'] -= 1
+                    self._host_in_flight[host] -= 1
+        except asyncio.CancelledError:
+            # A cancelled attempt (e.g. the losing hedge) says nothing about the panel
+            failed = None
+            raise
+        finally:
+            if not admitted:
+                stats['waiting'] -= 1
+            if failed is None:
+                breaker.probing = False
+            else:
+                breaker.record(failed)
+
+    def _breaker(self, action: str) -> CircuitBreaker:
+        breaker = self._breakers.get(action)
+        if breaker is None:
+            breaker = self._breakers[action] = CircuitBreaker()
+        return breaker
+
+    async def _retrying(self, attempt: Callable[[], Awaitable[Any]]) -> Any:
+        """Run an idempotent call, retrying retryable failures with full-jitter backoff"""
+        for n in range(self.retries + 1):
+            try:
+                return await attempt()
+            except Exception as e:
+                if n == self.retries or not is_retryable(e):
+                    raise
+                self._stats['retries'] += 1
+                await asyncio.sleep(random.uniform(0, self.retry_backoff * 2 ** n))
+
+    async def _hedged(self, action: str, attempt: Callable[[], Awaitable[Any]]) -> Any:
+        """Start a second attempt when the first outlives the action's usual latency; first success wins"""
+        if self.hedge_delay is None:
+            return await attempt()
+        p95 = self.governor.latency_quantile(action, 0.95)
+        delay = max(XTREAM_HEDGE_MIN_DELAY, p95) if p95 is not None else self.hedge_delay
+        tasks = [asyncio.ensure_future(attempt())]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                self._stats['hedges'] += 1
+                tasks.append(asyncio.ensure_future(attempt()))
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not tasks[0]:
+                            self._stats['hedge_wins'] += 1
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _request(self, method: str, url: str, deadline: Optional[float] = None, action: Optional[str] = None, **kwargs) -> httpx.Response:
+        """Send a request through the pooled client, admitted by the upstream governor.
+
+        deadline bounds the whole exchange once admitted, not just each read.
+        """
+        async with self._slot(url, action=action) as ticket:
+            response = await asyncio.wait_for(self.client.request(method, url, **kwargs), deadline)
+            ticket.responded(response.status_code)
+            return response
+
+    async def _stream(self, url: str, chunk_size: int = 64 * 1024, read_timeout: Optional[float] = None) -> AsyncIterator[bytes]:
+        """Yield a GET response body in chunks without buffering it"""
+        async with self._slot(url) as ticket:
+            async with self.client.stream('GET', url, timeout=httpx.Timeout(self.timeout, read=read_timeout)) as response:
+                ticket.responded(response.status_code)
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes(chunk_size):
+                    yield chunk
+
+    async def _player_api(self, username: str, password: str, **params) -> Any:
+        """Call player_api.php and return the decoded JSON body"""
+        query = {'username': username, 'password': password, **params}
+        url = f"{self.base_url}/player_api.php?{urlencode(query)}"
+        action = params.get('action', 'auth')
+        
+        async def attempt():
+            response = await self._request('GET', url, deadline=self.attempt_timeout)
+            response.raise_for_status()
+            return response.json()
+        
+        return await self._retrying(lambda: self._hedged(action, attempt))
+    
+    async def _player_api_items(self, username: str, password: str, **params) -> List[Any]:
+        """Call a player_api.php list action, decoding the array element by element as it arrives"""
+        query = {'username': username, 'password': password, **params}
+        url = f"{self.base_url}/player_api.php?{urlencode(query)}"
+        
+        # Catalogs are too large to hedge; a failed pull is retried from the start
+        async def attempt():
+            reader = JsonArrayReader()
+            items = []
+            async for chunk in self._stream(url, read_timeout=self.timeout):
+                items.extend(reader.feed(chunk))
+            items.extend(reader.close())
+            return items
+        
+        return await self._retrying(attempt)
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """Connection pool utilization for the shared upstream client"""
+        open_connections = None
+        pool = getattr(getattr(self._client, '_transport', None), '_pool', None)
+        if pool is not None:
+            open_connections = len(pool.connections)
+        max_connections = self.limits.max_connections
+        return {
+            **self._stats,
+            'open_connections': open_connections,
+            'max_connections': max_connections,
+            'max_keepalive_connections': self.limits.max_keepalive_connections,
+            'keepalive_expiry': self.limits.keepalive_expiry,
+            'per_host_concurrency': self.per_host_concurrency,
+            'per_host_in_flight': dict(self._host_in_flight),
+            'governor': self.governor.stats(),
+            'breakers': {action: breaker.stats() for action, breaker in self._breakers.items()},
+            'segments': dict(self._segment_stats),
+            'http2': self.http2,
+            'utilization': round(self._stats['in_flight'] / max_connections, 3) if max_connections else None,
+        }
+    
+    async def authenticate(self, username: str, password: str) -> Dict[str, Any]:
+        """Authenticate user and get account info"""
+        try:
+            data = await self._player_api(username, password)
+            
+            if data.get('user_info', {}).get('auth') == 1 or data.get('user_info', {}).get('status') == 'Active':
+                return {
+                    'success': True,
+                    'user_info': data.get('user_info', {}),
+                    'server_info': data.get('server_info', {})
+                }
+            else:
+                return {
+                    'success': False,
+                    'error': 'Invalid credentials'
+                }
+        except Exception as e:
+            logger.error(f"Authentication error: {str(e)}")
+            return {
+                'success': False,
+                'error': str(e),
+                # The panel could not answer, which says nothing about the credentials
+                'unavailable': True,
+            }
+    
+    async def get_live_categories(self, username: str, password: str, raise_errors: bool = False) -> List[Dict[str, Any]]:
+        """Get all live TV categories"""
+        try:
+            return await self._player_api(username, password, action='get_live_categories')
+        except Exception as e:
+            logger.error(f"Get categories error: {str(e)}")
+            if raise_errors:
+                raise
+            return []
+    
+    async def get_live_streams(self, username: str, password: str, category_id: Optional[str] = None, raise_errors: bool = False) -> List[Dict[str, Any]]:
+        """Get live streams, optionally filtered by category"""
+        try:
+            params = {'action': 'get_live_streams'}
+            if category_id:
+                params['category_id'] = category_id
+            return await self._player_api_items(username, password, **params)
+        except Exception as e:
+            logger.error(f"Get live streams error: {str(e)}")
+            if raise_errors:
+                raise
+            return []
+    
+    def xmltv(self, username: str, password: str) -> AsyncIterator[bytes]:
+        """Stream the full XMLTV guide in chunks"""
+        url = f"{self.base_url}/xmltv.php?{urlencode({'username': username, 'password': password})}"
+        return self._stream(url)
+    
+    def get_stream_url(self, username: str, password: str, stream_id: int, extension: str = "m3u8") -> str:
+        """Generate stream URL for playback"""
+        return f"{self.base_url}/live/{username}/{password}/{stream_id}.{extension}"
+    
+    async def get_epg(self, username: str, password: str, stream_id: int, limit: int = 10, raise_errors: bool = False) -> List[Dict[str, Any]]:
+        """Get EPG data for a specific stream"""
+        try:
+            data = await self._player_api(
+                username, password, action='get_short_epg', stream_id=stream_id, limit=limit
+            )
+            return data.get('epg_listings', [])
+        except Exception as e:
+            logger.error(f"Get EPG error: {str(e)}")
+            if raise_errors:
+                raise
+            return []
+    
+    async def get_vod_categories(self, username: str, password: str, raise_errors: bool = False) -> List[Dict[str, Any]]:
+        """Get all VOD categories"""
+        try:
+            return await self._player_api(username, password, action='get_vod_categories')
+        except Exception as e:
+            logger.error(f"Get VOD categories error: {str(e)}")
+            if raise_errors:
+                raise
+            return []
+    
+    async def get_vod_streams(self, username: str, password: str, category_id: Optional[str] = None, raise_errors: bool = False) -> List[Dict[str, Any]]:
+        """Get VOD streams, optionally filtered by category"""
+        try:
+            params = {'action': 'get_vod_streams'}
+            if category_id:
+                params['category_id'] = category_id
+            return await self._player_api_items(username, password, **params)
+        except Exception as e:
+            logger.error(f"Get VOD streams error: {str(e)}")
+            if raise_errors:
+                raise
+            return []
+    
+    async def get_series_categories(self, username: str, password: str, raise_errors: bool = False) -> List[Dict[str, Any]]:
+        """Get all series categories"""
+        try:
+            return await self._player_api(username, password, action='get_series_categories')
+        except Exception as e:
+            logger.error(f"Get series categories error: {str(e)}")
+            if raise_errors:
+                raise
+            return []
+    
+    async def get_series(self, username: str, password: str, category_id: Optional[str] = None, raise_errors: bool = False) -> List[Dict[str, Any]]:
+        """Get series, optionally filtered by category"""
+        try:
+            params = {'action': 'get_series'}
+            if category_id:
+                params['category_id'] = category_id
+            return await self._player_api_items(username, password, **params)
+        except Exception as e:
+            logger.error(f"Get series error: {str(e)}")
+            if raise_errors:
+                raise
+            return []
+    
+    async def get_series_info(self, username: str, password: str, series_id: int, raise_errors: bool = False) -> Dict[str, Any]:
+        """Get series info with seasons and episodes"""
+        try:
+            return await self._player_api(username, password, action='get_series_info', series_id=series_id)
+        except Exception as e:
+            logger.error(f"Get series info error: {str(e)}")
+            if raise_errors:
+                raise
+            return {}
+    
+    async def resolve_redirects(self, url: str, max_redirects: int = XTREAM_MAX_REDIRECTS) -> str:
+        """Follow a playback URL's redirect chain and return where it ends, without reading the media"""
+        for _ in range(max_redirects + 1):
+            # Every hop, including the edge, counts as one 'playback' request to the governor
+            async with self._slot(url, action='playback') as ticket:
+                request = self.client.build_request('GET', url)
+                response = await asyncio.wait_for(self.client.send(request, stream=True), self.attempt_timeout)
+                ticket.responded(response.status_code)
+                await response.aclose()
+            if not response.is_redirect:
+                response.raise_for_status()
+                return url
+            url = str(response.url.join(response.headers['location']))
+        raise httpx.TooManyRedirects(f"More than {max_redirects} redirects", request=request)
+    
+    async def fetch_playlist(self, url: str) -> Tuple[str, str]:
+        """GET an HLS playlist, following redirects; returns its text and final URL"""
+        response = await self._request(
+            'GET', url, deadline=self.attempt_timeout, action='hls', follow_redirects=True
+        )
+        response.raise_for_status()
+        return response.text, str(response.url)
+    
+    async def fetch_segment(self, url: str) -> bytes:
+        """GET a media segment (or key) in full, following redirects, under the segment limit rather than the governor"""
+        stats = self._segment_stats
+        stats['waiting'] += 1
+        try:
+            await self._segment_slots.acquire()
+        finally:
+            stats['waiting'] -= 1
+        stats['requests'] += 1
+        stats['in_flight'] += 1
+        try:
+            response = await asyncio.wait_for(self.client.get(url, follow_redirects=True), self.segment_timeout)
+            response.raise_for_status()
+            stats['bytes'] += len(response.content)
+            return response.content
+        except Exception:
+            stats['errors'] += 1
+            raise
+        finally:
+            stats['in_flight'] -= 1
+            self._segment_slots.release()
+    
+    def get_vod_url(self, username: str, password: str, vod_id: int, extension: str = "mp4") -> str:
+        """Generate VOD URL for playback"""
+        return f"{self.base_url}/movie/{username}/{password}/{vod_id}.{extension}"
+    
+    def get_series_url(self, username: str, password: str, episode_id: int, extension: str = "mp4") -> str:
+        """Generate series episode URL for playback"""
+        return f"{self.base_url}/series/{username}/{password}/{episode_id}.{extension}"
+
+# Initialize API client
+xtream_api = XtreamCodesAPI()
+
+# ==================== CACHE LAYER ====================
+
+def index_options(options: Dict[str, Any]) -> Dict[str, Any]:
+    """Options of an index spec or index_information() entry other than its keys and TTL"""
+    return {k: v for k, v in options.items() if k not in ('key', 'v', 'ns', 'name', 'background', 'expireAfterSeconds')}
+
+async def create_index(collection, keys, **options) -> str:
+    """create_index that updates an existing index whose options changed.
+
+    A changed TTL alone is applied in place with collMod, so workers
+    configured with different retentions never rebuild the index; any
+    other change drops and recreates it.
+    """
+    try:
+        return await collection.create_index(keys, **options)
+    except OperationFailure as e:
+        # 85/86: an index on these keys exists with other options
+        if e.code not in (85, 86) and 'already exists with different options' not in str(e):
+            raise
+        spec = [(keys, 1)] if isinstance(keys, str) else list(keys)
+        for name, info in (await collection.index_information()).items():
+            if name == '_id_' or [tuple(k) for k in info['key']] != [tuple(k) for k in spec]:
+                continue
+            if 'expireAfterSeconds' in options and 'expireAfterSeconds' in info and index_options(options) == index_options(info):
+                try:
+                    await collection.database.command({
+                        'collMod': collection.name,
+                        'index': {'name': name, 'expireAfterSeconds': options['expireAfterSeconds']},
+                    })
+                    logger.info(f"Changed TTL of index {name} on {collection.name} to {options['expireAfterSeconds']}s")
+                    return name
+                except NotImplementedError:
+                    # mongomock has no collMod
+                    pass
+            logger.info(f"Replacing index {name} on {collection.name}")
+            await collection.drop_index(name)
+        return await collection.create_index(keys, **options)
+
+CACHE_MEMORY_BYTES = int(os.environ.get('CACHE_MEMORY_BYTES', str(256 * 1024 * 1024)))
+# How long one worker may hold the right to refill a cache key before others take over
+CACHE_LEASE_SECONDS = float(os.environ.get('CACHE_LEASE_SECONDS', '45'))
+# Past its ttl an entry is served while refreshing in the background, and on upstream errors
+CACHE_STALE_WHILE_REVALIDATE = float(os.environ.get('CACHE_STALE_WHILE_REVALIDATE', '86400'))
+CACHE_STALE_IF_ERROR = float(os.environ.get('CACHE_STALE_IF_ERROR', '259200'))
+
+# Freshness windows in seconds
+CATEGORIES_TTL = 3600
+CATALOG_TTL = 1800
+SERIES_INFO_TTL = 3600
+# EPG listings stay fresh until the current programme ends, within these bounds
+EPG_MIN_TTL = 30
+EPG_MAX_TTL = 3600
+EPG_EMPTY_TTL = 300
+EPG_STALE_SECONDS = 120
+
+# Key prefix -> function(key, data) building the in-memory form of a value stored raw in Mongo
+CACHE_DECODERS: Dict[str, Callable[[str, Any], Any]] = {}
+# Key prefixes whose values never legitimately empty out (catalogs and category lists), so an
+# empty fetch is an upstream glitch; EPG listings and the like may really become empty
+CACHE_KEEP_NONEMPTY: Tuple[str, ...] = ('catalog_', 'categories_', 'vod_categories_', 'series_categories_')
+
+class CacheEntry:
+    """A cached value; size also counts memory its decoded form grew since (extra)"""
+
+    __slots__ = ('data', 'timestamp', 'size', 'ttl', 'extra')
+
+    def __init__(self, data: Any, timestamp: datetime, size: int, ttl: Optional[float] = None):
+        self.data = data
+        self.timestamp = timestamp
+        self.size = size
+        self.ttl = ttl
+        self.extra = 0
+
+class SingleFlight:
+    """Collapse concurrent calls for the same key into one in-process task"""
+
+    def __init__(self):
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.coalesced = 0
+
+    def running(self, key: str) -> bool:
+        return key in self._tasks
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        else:
+            self.coalesced += 1
+        # Shielded so a cancelled caller does not cancel the fetch other waiters share
+        return await asyncio.shield(task)
+
+class MongoLease:
+    """Cross-worker lease on a cache key, stored as one document per key"""
+
+    def __init__(self, collection, lease_seconds: float = CACHE_LEASE_SECONDS):
+        self.collection = collection
+        self.lease_seconds = lease_seconds
+        self.owner = uuid.uuid4().hex
+
+    async def ensure_indexes(self):
+        await create_index(self.collection, 'expires_at', expireAfterSeconds=0)
+
+    @staticmethod
+    def takeover_filter(key: str, now: datetime) -> Dict[str, Any]:
+        """Matches only a missing or expired lease on key; a live one makes the upsert collide on _id"""
+        return {'_id': key, 'expires_at': {'$lt': now}}
+
+    async def acquire(self, key: str, seconds: Optional[float] = None) -> bool:
+        """Take the lease unless another worker holds an unexpired one"""
+        now = datetime.utcnow()
+        seconds = self.lease_seconds if seconds is None else seconds
+        try:
+            await self.collection.update_one(
+                self.takeover_filter(key, now),
+                {'$set': {'owner': self.owner, 'expires_at': now + timedelta(seconds=seconds)}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+
+    async def release(self, key: str):
+        await self.collection.delete_one({'_id': key, 'owner': self.owner})
+
+    async def is_held(self, key: str) -> bool:
+        lease = await self.collection.find_one({'_id': key})
+        return lease is not None and lease['expires_at'] > datetime.utcnow()
+
+def is_empty(data: Any) -> bool:
+    """True for values an upstream glitch typically yields: None, [] or {}"""
+    return data is None or (isinstance(data, (list, dict)) and not data)
+
+class EmptyUpstreamResult(Exception):
+    """Raised when the panel answers with nothing where a good value is already held"""
+
+class TwoTierCache:
+    """Bounded in-memory LRU in front of the Mongo cache collection.
+
+    Entries younger than their ttl are fresh. For stale_while_revalidate
+    seconds after that they are still served while a background refresh
+    runs, and for stale_if_error seconds they are served when a refetch
+    fails. For keys matching a CACHE_KEEP_NONEMPTY prefix an empty value
+    never replaces a non-empty one. Values held in memory are shared
+    between requests and must be treated as read-only by callers. Keys
+    matching a CACHE_DECODERS prefix are held in memory in decoded form.
+    """
+
+    def __init__(
+        self,
+        collection,
+        leases: Optional[MongoLease] = None,
+        max_bytes: int = CACHE_MEMORY_BYTES,
+        lease_poll_interval: float = 0.2,
+        stale_while_revalidate: float = CACHE_STALE_WHILE_REVALIDATE,
+        stale_if_error: float = CACHE_STALE_IF_ERROR,
+    ):
+        self.collection = collection
+        self.leases = leases
+        self.max_bytes = max_bytes
+        self.lease_poll_interval = lease_poll_interval
+        self.stale_while_revalidate = stale_while_revalidate
+        self.stale_if_error = stale_if_error
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._bytes = 0
+        self._flight = SingleFlight()
+        self._refreshes: set = set()
+        self._stats = {
+            'memory_hits': 0,
+            'mongo_hits': 0,
+            'mongo_rechecks': 0,
+            'misses': 0,
+            'sets': 0,
+            'evictions': 0,
+            'fetches': 0,
+            'lease_waits': 0,
+            'lease_peer_fills': 0,
+            'stale_served': 0,
+            'stale_if_error_served': 0,
+            'empty_rejected': 0,
+            'background_refreshes': 0,
+            'background_refresh_errors': 0,
+            'fill_seconds_last': None,
+            'fill_seconds_max': 0.0,
+            'fill_seconds_total': 0.0,
+        }
+
+    async def ensure_indexes(self):
+        """Unique lookup index on key and a TTL index so Mongo drops expired entries"""
+        await create_index(self.collection, 'key', unique=True)
+        await create_index(self.collection, 'expires_at', expireAfterSeconds=0)
+        # Entries written before expires_at was stored would never age out; drop them once
+        legacy = await self.collection.delete_many({'expires_at': {'$exists': False}})
+        if legacy.deleted_count:
+            logger.info(f"Dropped {legacy.deleted_count} cache entries without expires_at")
+        if self.leases is not None:
+            await self.leases.ensure_indexes()
+
+    @staticmethod
+    def _age(timestamp: datetime) -> float:
+        return (datetime.utcnow() - timestamp).total_seconds()
+
+    @staticmethod
+    def _sizeof(data: Any) -> int:
+        return len(json_dumps(data))
+
+    def _decode(self, key: str, data: Any) -> Any:
+        for prefix, decoder in CACHE_DECODERS.items():
+            if key.startswith(prefix):
+                return decoder(key, data)
+        return data
+
+    def _remember(self, key: str, data: Any, timestamp: datetime, ttl: Optional[float] = None) -> CacheEntry:
+        # Decoded while the previous value is still held, so decoders can build on it
+        decoded = self._decode(key, data)
+        self._forget(key)
+        size = self._sizeof(data)
+        entry = CacheEntry(decoded, timestamp, size, ttl)
+        if size > self.max_bytes:
+            return entry
+        self._entries[key] = entry
+        self._bytes += size
+        self._evict()
+        return entry
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+            self._stats['evictions'] += 1
+
+    def _measure(self, entry: CacheEntry):
+        """Charge memory a decoded value built after it was stored (rendered catalog pages)"""
+        memory_bytes = getattr(entry.data, 'memory_bytes', None)
+        if memory_bytes is None:
+            return
+        extra = memory_bytes()
+        if extra != entry.extra:
+            entry.size += extra - entry.extra
+            self._bytes += extra - entry.extra
+            entry.extra = extra
+            self._evict()
+
+    @staticmethod
+    def _ttl(entry: CacheEntry, ttl: float) -> float:
+        """An entry's own ttl when it was stored with one, else the caller's"""
+        return entry.ttl if entry.ttl is not None else ttl
+
+    def held(self, key: str) -> Optional[Any]:
+        """The value this worker holds in memory for key, whatever its age, without a lookup"""
+        entry = self._entries.get(key)
+        return entry.data if entry is not None else None
+
+    def _forget(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    async def _lookup(self, key: str, ttl: float):
+        """Find the newest entry for key, fresh or not, and the tier it came from"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self._measure(entry)
+            if self._age(entry.timestamp) < self._ttl(entry, ttl):
+                return entry, 'memory'
+        
+        # A stale memory copy may have been refreshed in Mongo by another worker; compare
+        # timestamps first so a stale window does not reread a multi-MB catalog per request
+        if entry is not None:
+            self._stats['mongo_rechecks'] += 1
+            newer = await self.collection.find_one({'key': key, 'timestamp': {'$gt': entry.timestamp}}, {'_id': 1})
+            if newer is None:
+                return entry, 'memory'
+        cached = await self.collection.find_one({'key': key})
+        if cached and (entry is None or cached['timestamp'] > entry.timestamp):
+            return self._remember(key, cached['data'], cached['timestamp'], cached.get('ttl')), 'mongo'
+        return entry, 'memory'
+
+    async def get(self, key: str, ttl: float) -> Optional[Any]:
+        """Return a value younger than ttl seconds, or None"""
+        entry, tier = await self._lookup(key, ttl)
+        if entry is not None and self._age(entry.timestamp) < self._ttl(entry, ttl):
+            self._stats[f'{tier}_hits'] += 1
+            return entry.data
+        self._stats['misses'] += 1
+        return None
+
+    async def peek(self, key: str) -> Optional[Any]:
+        """Return the newest value for key regardless of age, without counting a lookup"""
+        entry, _ = await self._lookup(key, 0)
+        return entry.data if entry is not None else None
+
+    async def touch(self, key: str, ttl: float):
+        """Mark an unchanged value as freshly fetched without rewriting its data"""
+        now = datetime.utcnow()
+        retain = ttl + max(self.stale_while_revalidate, self.stale_if_error)
+        await self.collection.update_one(
+            {'key': key},
+            {'$set': {'timestamp': now, 'ttl': ttl, 'expires_at': now + timedelta(seconds=retain)}}
+        )
+        entry = self._entries.get(key)
+        if entry is not None:
+            entry.timestamp = now
+            entry.ttl = ttl
+
+    async def set(self, key: str, data: Any, ttl: float) -> Any:
+        """Store a value in both tiers and return its in-memory form.
+
+        Mongo keeps the value until the stale windows end. Under a
+        CACHE_KEEP_NONEMPTY prefix an empty value does not replace a
+        non-empty one; the held value is returned and stays stale, so the
+        next lookup fetches again.
+        """
+        if is_empty(data) and key.startswith(CACHE_KEEP_NONEMPTY):
+            previous = await self.peek(key)
+            if not is_empty(previous):
+                self._stats['empty_rejected'] += 1
+                logger.warning(f"Keeping cached {key}: upstream returned an empty value")
+                return previous
+        now = datetime.utcnow()
+        retain = ttl + max(self.stale_while_revalidate, self.stale_if_error)
+        await self.collection.update_one(
+            {'key': key},
+            {'$set': {'key': key, 'data': data, 'timestamp': now, 'ttl': ttl, 'expires_at': now + timedelta(seconds=retain)}},
+            upsert=True
+        )
+        entry = self._remember(key, data, now, ttl)
+        self._stats['sets'] += 1
+        return entry.data
+
+    async def get_or_fetch(
+        self,
+        key: str,
+        ttl: float,
+        fetcher: Callable[[], Awaitable[Any]],
+        ttl_for: Optional[Callable[[Any], float]] = None,
+        stale_while_revalidate: Optional[float] = None,
+    ) -> Any:
+        """Return the cached value or fetch, store and return a fresh one.
+
+        Concurrent misses for the same key share a single fetch. Stale
+        entries are served immediately while a background refresh runs.
+        ttl_for derives the ttl from freshly fetched data instead of ttl.
+        """
+        if stale_while_revalidate is None:
+            stale_while_revalidate = self.stale_while_revalidate
+        entry, tier = await self._lookup(key, ttl)
+        age = self._age(entry.timestamp) if entry is not None else None
+        entry_ttl = self._ttl(entry, ttl) if entry is not None else ttl
+        if age is not None and age < entry_ttl:
+            self._stats[f'{tier}_hits'] += 1
+            return entry.data
+        if age is not None and age < entry_ttl + stale_while_revalidate:
+            self._stats['stale_served'] += 1
+            self._revalidate(key, ttl, fetcher, ttl_for)
+            return entry.data
+        
+        self._stats['misses'] += 1
+        try:
+            return await self._flight.do(key, lambda: self._fill(key, ttl, fetcher, ttl_for))
+        except Exception as e:
+            if age is not None and age < entry_ttl + self.stale_if_error:
+                logger.warning(f"Serving stale {key} after refresh error: {str(e)}")
+                self._stats['stale_if_error_served'] += 1
+                return entry.data
+            raise
+
+    def _revalidate(self, key: str, ttl: float, fetcher: Callable[[], Awaitable[Any]], ttl_for=None):
+        """Refresh a stale key in the background unless a fetch is already running"""
+        if self._flight.running(key):
+            return
+        self._stats['background_refreshes'] += 1
+        task = asyncio.ensure_future(self._flight.do(key, lambda: self._fill(key, ttl, fetcher, ttl_for)))
+        self._refreshes.add(task)
+        task.add_done_callback(self._refresh_done)
+
+    def _refresh_done(self, task: asyncio.Task):
+        self._refreshes.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self._stats['background_refresh_errors'] += 1
+            logger.error(f"Background cache refresh error: {str(task.exception())}")
+
+    async def _fill(self, key: str, ttl: float, fetcher: Callable[[], Awaitable[Any]], ttl_for=None) -> Any:
+        acquired = self.leases is None or await self.leases.acquire(key)
+        if not acquired:
+            # Another worker is already fetching this key; wait for it to store the result
+            self._stats['lease_waits'] += 1
+            data = await self._wait_for_peer(key, ttl)
+            if data is not None:
+                self._stats['lease_peer_fills'] += 1
+                return data
+        started = time.perf_counter()
+        try:
+            self._stats['fetches'] += 1
+            data = await fetcher()
+            return await self.set(key, data, ttl_for(data) if ttl_for else ttl)
+        finally:
+            elapsed = time.perf_counter() - started
+            self._stats['fill_seconds_last'] = round(elapsed, 4)
+            self._stats['fill_seconds_max'] = round(max(self._stats['fill_seconds_max'], elapsed), 4)
+            self._stats['fill_seconds_total'] += elapsed
+            if acquired and self.leases is not None:
+                await self.leases.release(key)
+
+    async def _wait_for_peer(self, key: str, ttl: float) -> Optional[Any]:
+        deadline = asyncio.get_running_loop().time() + self.leases.lease_seconds
+        while asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(self.lease_poll_interval)
+            cached = await self.collection.find_one({'key': key})
+            if cached and self._age(cached['timestamp']) < (cached.get('ttl') or ttl):
+                return self._remember(key, cached['data'], cached['timestamp'], cached.get('ttl')).data
+            if not await self.leases.is_held(key):
+                return None
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self._stats['memory_hits'] + self._stats['mongo_hits'] + self._stats['misses']
+        hits = self._stats['memory_hits'] + self._stats['mongo_hits']
+        return {
+            **self._stats,
+            'fill_seconds_total': round(self._stats['fill_seconds_total'], 4),
+            'hit_ratio': round(hits / lookups, 3) if lookups else None,
+            'coalesced': self._flight.coalesced,
+            'refreshing': len(self._refreshes),
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'max_bytes': self.max_bytes,
+        }
+
+cache = TwoTierCache(db.cache, leases=MongoLease(db.cache_leases))
+
+# ==================== PAGINATION ====================
+
+def paginate(
+    items: List[Dict[str, Any]],
+    response: Response,
+    limit: Optional[int] = None,
+    offset: int = 0,
+    fields: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """Slice a cached catalog and project each item to the requested fields"""
+    total = len(items)
+    end = total if limit is None else offset + limit
+    page = items[offset:end]
+    if fields:
+        keys = [f.strip() for f in fields.split(',') if f.strip()]
+        page = [{k: item[k] for k in keys if k in item} for item in page]
+    response.headers['X-Total-Count'] = str(total)
+    if end < total:
+        response.headers['X-Next-Offset'] = str(end)
+    return page
+
+# Bodies smaller than this are not worth compressing
+COMPRESS_MIN_BYTES = 1024
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '5'))
+
+COMPRESSORS: Dict[str, Callable[[bytes], bytes]] = {
+    'gzip': lambda body: gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0),
+}
+if brotli is not None:
+    COMPRESSORS['br'] = lambda body: brotli.compress(body, quality=BROTLI_QUALITY)
+
+class RenderedPage:
+    """A rendered JSON body with its content hash and compressed encodings.
+
+    Encodings are computed at most once per page and then served as is.
+    """
+
+    __slots__ = ('body', 'size', 'etag', '_encoded')
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the body and its encodings"""
+        return (len(self.body) if self.body is not None else 0) + sum(map(len, self._encoded.values()))
+
+    def __init__(self, body: bytes):
+        self.body: Optional[bytes] = body
+        self.size = len(body)
+        self.etag = f'"{hashlib.sha1(body).hexdigest()[:24]}"'
+        self._encoded: Dict[str, bytes] = {}
+
+    def encoded(self, encoding: Optional[str]) -> bytes:
+        if encoding is None:
+            # Identity is rare for large pinned pages, so those keep only the gzip copy
+            return self.body if self.body is not None else gzip.decompress(self._encoded['gzip'])
+        body = self._encoded.get(encoding)
+        if body is None:
+            body = self._encoded[encoding] = COMPRESSORS[encoding](self.encoded(None))
+        return body
+
+    def compress_all(self, keep_body: bool = True) -> 'RenderedPage':
+        if self.size >= COMPRESS_MIN_BYTES:
+            for encoding in COMPRESSORS:
+                self.encoded(encoding)
+            if not keep_body:
+                self.body = None
+        return self
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header lists this ETag (weak comparison)"""
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(',')]
+    return '*' in tags or etag in [t[2:] if t.startswith('W/') else t for t in tags]
+
+def negotiate_encoding(accept_encoding: Optional[str], size: int) -> Optional[str]:
+    """Best stored encoding the client accepts: brotli, then gzip"""
+    if not accept_encoding or size < COMPRESS_MIN_BYTES:
+        return None
+    accepted = set()
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        if params.strip().replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        accepted.add(name.strip().lower())
+    for encoding in ('br', 'gzip'):
+        if encoding in COMPRESSORS and (encoding in accepted or '*' in accepted):
+            return encoding
+    return None
+
+def catalog_response(
+    request: Request,
+    view: 'CatalogView',
+    items: 'CatalogRows',
+    limit: Optional[int] = None,
+    offset: int = 0,
+    fields: Optional[str] = None,
+) -> Response:
+    """paginate() for cached catalogs: ETag-versioned, pre-rendered and pre-compressed"""
+    scratch = Response()
+    page = paginate(items, scratch, limit, offset)
+    rendered = view.render(page, fields)
+    headers = {k: v for k, v in scratch.headers.items() if k.startswith('x-')}
+    headers.update({'X-Catalog-Version': view.version, 'ETag': rendered.etag, 'Vary': 'Accept-Encoding', 'Cache-Control': 'private, no-cache'})
+    if etag_matches(request.headers.get('if-none-match'), rendered.etag):
+        return Response(status_code=304, headers=headers)
+    encoding = negotiate_encoding(request.headers.get('accept-encoding'), rendered.size)
+    if encoding is not None:
+        headers['Content-Encoding'] = encoding
+    return Response(rendered.encoded(encoding), media_type='application/json', headers=headers)
+
+# ==================== SHARED CATALOG ====================
+
+# Upstream actions per catalog kind, plus the per-user cache key of its categories
+CATALOG_SOURCES = {
+    'live': {'categories': 'get_live_categories', 'items': 'get_live_streams', 'categories_key': 'categories_{username}', 'id_field': 'stream_id'},
+    'vod': {'categories': 'get_vod_categories', 'items': 'get_vod_streams', 'categories_key': 'vod_categories_{username}', 'id_field': 'stream_id'},
+    'series': {'categories': 'get_series_categories', 'items': 'get_series', 'categories_key': 'series_categories_{username}', 'id_field': 'series_id'},
+}
+
+def catalog_fingerprint(categories: List[Dict[str, Any]]) -> str:
+    """Identify a provider package by the set of categories it exposes.
+
+    Xtream panels assign categories per bouquet, so subscribers that see the
+    same category set on the same server see the same catalog.
+    """
+    ids = sorted(str(c.get('category_id')) for c in categories)
+    raw = f"{xtream_api.base_url}|{','.join(ids)}"
+    return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+def entitled_categories(categories: List[Dict[str, Any]]) -> Optional[frozenset]:
+    """Category ids a user may see, or None when unknown"""
+    return frozenset(str(c.get('category_id')) for c in categories) if categories else None
+
+async def get_user_categories(
+    kind: str, username: str, password: str, stale_while_revalidate: Optional[float] = None
+) -> List[Dict[str, Any]]:
+    """Get a user's categories for a catalog kind (cached per user)"""
+    source = CATALOG_SOURCES[kind]
+    cache_key = source['categories_key'].format(username=username)
+    return await cache.get_or_fetch(
+        cache_key,
+        CATEGORIES_TTL,
+        lambda: getattr(xtream_api, source['categories'])(username, password, raise_errors=True),
+        stale_while_revalidate=stale_while_revalidate,
+    )
+
+def catalog_cache_key(kind: str, username: str, categories: List[Dict[str, Any]]) -> str:
+    """Cache key of the shared catalog a user's categories map to"""
+    if categories:
+        fingerprint = catalog_fingerprint(categories)
+    else:
+        # Without categories we cannot tell the package apart, so keep the catalog private
+        fingerprint = 'user-' + hashlib.sha1(username.encode()).hexdigest()[:16]
+    return f"catalog_{kind}_{fingerprint}"
+
+def item_category_ids(item: Dict[str, Any]) -> List[str]:
+    """All category ids of a catalog item (newer panels also send category_ids)"""
+    ids = [str(cid) for cid in item.get('category_ids') or []]
+    if item.get('category_id') is not None and str(item['category_id']) not in ids:
+        ids.insert(0, str(item['category_id']))
+    return ids
+
+# Rendered pages kept per catalog view, by count and by bytes
+CATALOG_PAGE_CACHE = int(os.environ.get('CATALOG_PAGE_CACHE', '64'))
+CATALOG_PAGE_CACHE_BYTES = int(os.environ.get('CATALOG_PAGE_CACHE_BYTES', str(8 * 1024 * 1024)))
+
+class CompactCatalog:
+    """Column-backed table of catalog items.
+
+    Each key is stored as one column instead of one dict per item. Rows
+    reference a shared table of key layouts, so items keep exactly the
+    keys (and key order) they arrived with. Category ids and the directory
+    part of image URLs are stored once and referenced by index, and
+    columns that only hold ints become arrays.
+    """
+
+    INDEXED_FIELDS = ('category_id',)
+    URL_FIELDS = ('stream_icon', 'cover')
+
+    def __init__(self, items: List[Dict[str, Any]]):
+        self.layouts: List[Tuple[str, ...]] = []
+        layout_ids: Dict[Tuple[str, ...], int] = {}
+        row_layouts = []
+        for item in items:
+            layout = tuple(item)
+            layout_id = layout_ids.get(layout)
+            if layout_id is None:
+                layout_id = layout_ids[layout] = len(self.layouts)
+                self.layouts.append(tuple(sys.intern(k) for k in layout))
+            row_layouts.append(layout_id)
+        self.row_layouts = array('I', row_layouts)
+        
+        # Shared values of indexed fields; URL prefix 0 means "stored whole"
+        self.values: Dict[str, List[Any]] = {}
+        self.prefixes: List[Optional[str]] = [None]
+        self.url_prefix: Dict[str, array] = {}
+        self.columns: Dict[str, Any] = {}
+        prefix_ids: Dict[str, int] = {}
+        keys = dict.fromkeys(k for layout in self.layouts for k in layout)
+        for key in keys:
+            column = [item.get(key) for item in items]
+            if key in self.INDEXED_FIELDS:
+                # Keyed by type as well, so equal values of different types (1, True, 1.0) stay apart
+                ids: Dict[Tuple[type, Any], int] = {}
+                values: List[Any] = []
+                refs = array('I')
+                for v in column:
+                    ref = ids.get((type(v), v))
+                    if ref is None:
+                        ref = ids[(type(v), v)] = len(values)
+                        values.append(v)
+                    refs.append(ref)
+                column = refs
+                self.values[key] = values
+            elif key in self.URL_FIELDS:
+                prefixes = array('I', bytes(4 * len(column)))
+                for row, value in enumerate(column):
+                    cut = value.rfind('/') + 1 if isinstance(value, str) else 0
+                    if cut:
+                        prefix = value[:cut]
+                        prefix_id = prefix_ids.get(prefix)
+                        if prefix_id is None:
+                            prefix_id = prefix_ids[prefix] = len(self.prefixes)
+                            self.prefixes.append(prefix)
+                        prefixes[row] = prefix_id
+                        column[row] = value[cut:]
+                self.url_prefix[key] = prefixes
+            elif all(type(v) is int for v in column):
+                try:
+                    column = array('q', column)
+                except OverflowError:
+                    pass
+            else:
+                # One object per distinct value (type, extension, rating, ...), keyed by type as above
+                try:
+                    shared = {(type(v), v): v for v in column}
+                except TypeError:
+                    shared = None
+                if shared is not None and len(shared) < len(column):
+                    column = [shared[(type(v), v)] for v in column]
+            self.columns[key] = column
+        
+        # Per layout: its keys, their columns and the columns needing a lookup
+        self._readers = [
+            (
+                layout,
+                [self.columns[k] for k in layout],
+                [(k, self.values.get(k), self.url_prefix.get(k)) for k in layout if k in self.values or k in self.url_prefix],
+            )
+            for layout in self.layouts
+        ]
+
+    def __len__(self) -> int:
+        return len(self.row_layouts)
+
+    def _unpack(self, row: int, value: Any, values: Optional[List[Any]], prefixes: Optional[array]) -> Any:
+        if values is not None:
+            return values[value]
+        prefix = self.prefixes[prefixes[row]]
+        return value if prefix is None else prefix + value
+
+    def _unpack_many(self, rows, column: List[Any], values: Optional[List[Any]], prefixes: Optional[array]) -> List[Any]:
+        if values is not None:
+            return [values[v] for v in column]
+        table = self.prefixes
+        return [v if table[p] is None else table[p] + v for p, v in zip([prefixes[r] for r in rows], column)]
+
+    def get(self, row: int, key: str, default: Any = None) -> Any:
+        """One field of a row, without building the whole item"""
+        if key not in self.layouts[self.row_layouts[row]]:
+            return default
+        value = self.columns[key][row]
+        if key in self.values or key in self.url_prefix:
+            return self._unpack(row, value, self.values.get(key), self.url_prefix.get(key))
+        return value
+
+    def row(self, row: int) -> Dict[str, Any]:
+        """Build the API representation of a row"""
+        keys, columns, lookups = self._readers[self.row_layouts[row]]
+        item = dict(zip(keys, [column[row] for column in columns]))
+        for key, values, prefixes in lookups:
+            item[key] = self._unpack(row, item[key], values, prefixes)
+        return item
+
+    def rows(self, rows) -> Iterator[Dict[str, Any]]:
+        """Build many rows, a column at a time when they share one layout"""
+        if len(self.layouts) != 1:
+            yield from map(self.row, rows)
+            return
+        keys, columns, lookups = self._readers[0]
+        if isinstance(rows, range) and rows.step == 1:
+            gathered = [column[rows.start:rows.stop] for column in columns]
+        else:
+            gathered = [[column[r] for r in rows] for column in columns]
+        for key, values, prefixes in lookups:
+            i = keys.index(key)
+            gathered[i] = self._unpack_many(rows, gathered[i], values, prefixes)
+        for record in zip(*gathered):
+            yield dict(zip(keys, record))
+
+    def column(self, key: str) -> List[Any]:
+        """Every row's value of one field (None where absent)"""
+        column = self.columns.get(key)
+        if column is None:
+            return [None] * len(self)
+        if key in self.values or key in self.url_prefix:
+            return self._unpack_many(range(len(self)), column, self.values.get(key), self.url_prefix.get(key))
+        return list(column)
+
+class CatalogRows(Sequence):
+    """A lazy list of catalog items: row numbers into a CompactCatalog.
+
+    Slicing keeps it lazy; items are built only when iterated. The key
+    names the selection, so rendered pages can be reused.
+    """
+
+    __slots__ = ('table', 'rows', 'key')
+
+    def __init__(self, table: CompactCatalog, rows, key: Tuple = ()):
+        self.table = table
+        self.rows = rows
+        self.key = key
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return CatalogRows(self.table, self.rows[index], (self.key, index.start, index.stop, index.step))
+        return self.table.row(self.rows[index])
+
+    def __iter__(self):
+        return self.table.rows(self.rows)
+
+class CatalogView:
+    """A full catalog with a precomputed category -> items index.
+
+    Built once per cached catalog version, so category switches and
+    entitlement filtering never go back upstream. Items live in a
+    CompactCatalog; indexes hold row numbers. search indexes item names
+    and is freed with the view.
+    """
+
+    def __init__(self, items: List[Dict[str, Any]], id_field: str = 'stream_id'):
+        self.version = catalog_version(items)
+        self.table = CompactCatalog(items)
+        self.id_field = id_field
+        self.by_id: Dict[Any, int] = dict(zip(self.table.column(id_field), range(len(self.table))))
+        self.by_category: Dict[str, array] = {}
+        for row, cids in enumerate(self._category_ids()):
+            for cid in cids:
+                rows = self.by_category.get(cid)
+                if rows is None:
+                    rows = self.by_category[cid] = array('I')
+                rows.append(row)
+        self.items = CatalogRows(self.table, range(len(self.table)), ('all',))
+        self._entitled: Dict[frozenset, CatalogRows] = {}
+        self._pages: OrderedDict = OrderedDict()
+        self._full: Optional[RenderedPage] = None
+        self.search = SearchIndex()
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def category_ids(self, row: int) -> List[str]:
+        return item_category_ids({
+            'category_id': self.table.get(row, 'category_id'),
+            'category_ids': self.table.get(row, 'category_ids'),
+        })
+
+    def _category_ids(self) -> Iterator[List[str]]:
+        """category_ids() of every row, read column-wise"""
+        for cid, cids in zip(self.table.column('category_id'), self.table.column('category_ids')):
+            yield item_category_ids({'category_id': cid, 'category_ids': cids})
+
+    def get(self, item_id: Any) -> Optional[Dict[str, Any]]:
+        row = self.by_id.get(item_id)
+        return None if row is None else self.table.row(row)
+
+    def select(self, allowed: Optional[frozenset] = None, category_id: Optional[str] = None) -> CatalogRows:
+        """Items of one category, or the whole catalog, limited to allowed categories"""
+        if category_id is not None:
+            if allowed is not None and category_id not in allowed:
+                return CatalogRows(self.table, range(0), ('none',))
+            return CatalogRows(self.table, self.by_category.get(category_id, range(0)), ('category', category_id))
+        if allowed is None:
+            return self.items
+        entitled = self._entitled.get(allowed)
+        if entitled is None:
+            # Users sharing a catalog share its category set, so this rarely holds more than one entry
+            rows = array('I', (r for r, cids in enumerate(self._category_ids()) if allowed.intersection(cids)))
+            entitled = self.items if len(rows) == len(self.table) else CatalogRows(self.table, rows, ('entitled', allowed))
+            self._entitled = {allowed: entitled}
+        return entitled
+
+    def memory_bytes(self) -> int:
+        """Rendered bodies and encodings this view holds, beyond the catalog itself"""
+        pages = sum(page.nbytes for page in self._pages.values())
+        return pages + (self._full.nbytes if self._full is not None else 0)
+
+    def render(self, items: CatalogRows, fields: Optional[str] = None) -> RenderedPage:
+        """A selection of this view as JSON, reusing recently rendered pages"""
+        if items.key == self.items.key and fields is None and self._full is not None:
+            return self._full
+        key = (items.key, fields)
+        page = self._pages.get(key)
+        if page is not None:
+            self._pages.move_to_end(key)
+            return page
+        if fields:
+            keys = [f.strip() for f in fields.split(',') if f.strip()]
+            page = RenderedPage(json_dumps([{k: item[k] for k in keys if k in item} for item in items]))
+        else:
+            page = RenderedPage(json_dumps(list(items)))
+        self._pages[key] = page
+        held = sum(p.nbytes for p in self._pages.values())
+        while self._pages and (len(self._pages) > CATALOG_PAGE_CACHE or held > CATALOG_PAGE_CACHE_BYTES):
+            _, evicted = self._pages.popitem(last=False)
+            held -= evicted.nbytes
+        return page
+
+    def render_full(self) -> RenderedPage:
+        """Render and compress the whole catalog, which stays pinned for this version"""
+        if self._full is None:
+            self._full = RenderedPage(json_dumps(list(self.items))).compress_all(keep_body=False)
+        return self._full
+
+def decode_catalog(key: str, items: List[Dict[str, Any]]) -> CatalogView:
+    """Build the in-memory view of a cached catalog and bring its search index up to date"""
+    kind = key.split('_')[1]
+    view = CatalogView(items, CATALOG_SOURCES[kind]['id_field'])
+    previous = cache.held(key)
+    if isinstance(previous, CatalogView):
+        # Carried over from the version this one replaces, so only changed names are re-indexed
+        view.search = previous.search
+    view.search.sync(view)
+    # The full-catalog body and its encodings are prepared once per version, off the event loop
+    try:
+        rendering = asyncio.get_running_loop().run_in_executor(None, view.render_full)
+    except RuntimeError:
+        view.render_full()
+    else:
+        rendering.add_done_callback(
+            lambda f: f.exception() and logger.error(f"Catalog render error: {str(f.exception())}")
+        )
+    return view
+
+CACHE_DECODERS['catalog_'] = decode_catalog
+
+def diff_catalog(old: List[Dict[str, Any]], new: List[Dict[str, Any]], id_field: str) -> Dict[str, list]:
+    """Compare two catalog snapshots by item id"""
+    old_by_id = {item.get(id_field): item for item in old}
+    new_by_id = {item.get(id_field): item for item in new}
+    return {
+        'added': [item for item_id, item in new_by_id.items() if item_id not in old_by_id],
+        'removed': [item_id for item_id in old_by_id if item_id not in new_by_id],
+        'modified': [
+            item for item_id, item in new_by_id.items()
+            if item_id in old_by_id and old_by_id[item_id] != item
+        ],
+    }
+
+async def get_catalog_view(kind: str, username: str, password: str) -> Tuple[str, CatalogView, Optional[frozenset]]:
+    """Get the cache key, shared view and entitled category ids of a user's catalog"""
+    categories = await get_user_categories(kind, username, password)
+    cache_key = catalog_cache_key(kind, username, categories)
+    
+    async def fetch():
+        items, _ = await fetch_catalog(kind, cache_key, username, password)
+        return items
+    
+    # Always the full catalog; category views come from its local index
+    view = await cache.get_or_fetch(cache_key, CATALOG_TTL, fetch)
+    return cache_key, view, entitled_categories(categories)
+
+async def get_shared_catalog(kind: str, username: str, password: str, category_id: Optional[str] = None) -> Tuple[CatalogView, List[Dict[str, Any]]]:
+    """Get a catalog shared by every user on the same package and its items this user is entitled to"""
+    _, view, allowed = await get_catalog_view(kind, username, password)
+    return view, view.select(allowed, category_id)
+
+# ==================== CATALOG VERSIONS ====================
+
+# How long version history is kept; clients older than this reload in full
+CATALOG_VERSION_RETENTION = int(os.environ.get('CATALOG_VERSION_RETENTION', str(7 * 86400)))
+
+def catalog_version(items: List[Dict[str, Any]]) -> str:
+    """Content hash identifying one upstream snapshot of a catalog"""
+    return hashlib.sha1(json_dumps(items)).hexdigest()[:16]
+
+class CatalogVersionLog:
+    """History of catalog snapshots as id-level diffs.
+
+    Each changed snapshot appends one entry holding the ids added, removed
+    and modified since the snapshot before it, so a client that names the
+    version it holds can be sent just the items that differ.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def ensure_indexes(self):
+        await create_index(self.collection, [('key', 1), ('seq', -1)], unique=True)
+        await create_index(self.collection, 'created_at', expireAfterSeconds=CATALOG_VERSION_RETENTION)
+
+    async def record(self, key: str, previous: Optional['CatalogView'], items: List[Dict[str, Any]], id_field: str) -> Optional[Dict[str, list]]:
+        """Log a fetched snapshot; returns its diff against previous, or None if identical"""
+        version = catalog_version(items)
+        if previous is not None and previous.version == version:
+            return None
+        changes = diff_catalog(previous.items if previous is not None else [], items, id_field)
+        entry = {
+            'key': key,
+            'version': version,
+            'previous': previous.version if previous is not None else None,
+            'created_at': datetime.utcnow(),
+            'added': [item.get(id_field) for item in changes['added']] if previous is not None else [],
+            'removed': changes['removed'] if previous is not None else [],
+            'modified': [item.get(id_field) for item in changes['modified']],
+        }
+        try:
+            latest = await self.collection.find_one({'key': key}, sort=[('seq', -1)])
+            entry['seq'] = latest['seq'] + 1 if latest else 1
+            await self.collection.insert_one(entry)
+        except DuplicateKeyError:
+            # Another worker logged a snapshot at the same moment
+            pass
+        except Exception as e:
+            logger.error(f"Catalog version log error: {str(e)}")
+        return changes
+
+    async def changes(self, key: str, view: 'CatalogView', since: str) -> Optional[Dict[str, list]]:
+        """Net changes from version since to the view's version, or None if since is unknown"""
+        if since == view.version:
+            return {'added': [], 'removed': [], 'modified': []}
+        pending = []
+        reached_view = found = False
+        async for entry in self.collection.find({'key': key}).sort('seq', -1):
+            # Entries newer than the view this worker serves are left for a later sync
+            if not reached_view:
+                if entry['version'] != view.version:
+                    continue
+                reached_view = True
+            elif entry['version'] == since:
+                found = True
+                break
+            if entry['previous'] is None:
+                break
+            pending.append(entry)
+        if not found:
+            return None
+        
+        # An id's first event after `since` tells whether the client has it
+        first_event: Dict[Any, str] = {}
+        for entry in reversed(pending):
+            for name in ('added', 'removed', 'modified'):
+                for item_id in entry[name]:
+                    first_event.setdefault(item_id, name)
+        result = {'added': [], 'removed': [], 'modified': []}
+        for item_id, event in first_event.items():
+            item = view.get(item_id)
+            if event == 'added':
+                if item is not None:
+                    result['added'].append(item)
+            elif item is None:
+                result['removed'].append(item_id)
+            else:
+                result['modified'].append(item)
+        return result
+
+catalog_versions = CatalogVersionLog(db.catalog_versions)
+
+async def fetch_catalog(kind: str, cache_key: str, username: str, password: str) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, list]]]:
+    """Pull a full catalog upstream and log it as a new version if it changed"""
+    source = CATALOG_SOURCES[kind]
+    items = await getattr(xtream_api, source['items'])(username, password, raise_errors=True)
+    previous = await cache.peek(cache_key)
+    if not items and previous is not None and len(previous.items):
+        # A catalog does not empty out overnight; treat it as a failed pull, not a version
+        raise EmptyUpstreamResult(f"Upstream returned an empty {kind} catalog")
+    changes = await catalog_versions.record(cache_key, previous, items, source['id_field'])
+    return items, changes
+
+# ==================== SEARCH ====================
+
+# Letters NFKD does not decompose into a base letter plus accent
+_FOLD_EXTRA = str.maketrans({'đ': 'd', 'ø': 'o', 'ł': 'l', 'æ': 'ae', 'œ': 'oe', 'ı': 'i'})
+
+def normalize_text(text: str) -> str:
+    """Lowercase, strip accents and reduce punctuation to single spaces"""
+    decomposed = unicodedata.normalize('NFKD', str(text).casefold().translate(_FOLD_EXTRA))
+    chars = [c if c.isalnum() else ' ' for c in decomposed if not unicodedata.combining(c)]
+    return ' '.join(''.join(chars).split())
+
+def trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class SearchIndex:
+    """Inverted index over catalog item names.
+
+    Words map to the ids containing them; a trigram index over the word
+    vocabulary (not over documents) drives fuzzy matching, which keeps it
+    small. Only ids and names are held here; results are resolved against
+    the current CatalogView. sync() re-indexes just the items whose name
+    changed since the last catalog version.
+    """
+
+    # Very common words can match most of the catalog; rank at most this many ids
+    MAX_CANDIDATES = 1000
+
+    def __init__(self):
+        self.names: Dict[Any, str] = {}
+        self.doc_tokens: Dict[Any, Tuple[str, ...]] = {}
+        self.token_postings: Dict[str, Set[Any]] = {}
+        self.trigram_tokens: Dict[str, Set[str]] = {}
+        self.sorted_tokens: List[str] = []
+        self.syncs = 0
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def add(self, doc_id: Any, name: str, keep_sorted: bool = True):
+        self.remove(doc_id)
+        tokens = tuple(normalize_text(name).split())
+        self.names[doc_id] = name
+        self.doc_tokens[doc_id] = tokens
+        for token in set(tokens):
+            postings = self.token_postings.get(token)
+            if postings is None:
+                postings = self.token_postings[token] = set()
+                if keep_sorted:
+                    bisect.insort(self.sorted_tokens, token)
+                for gram in trigrams(token):
+                    self.trigram_tokens.setdefault(gram, set()).add(token)
+            postings.add(doc_id)
+
+    def remove(self, doc_id: Any):
+        if doc_id not in self.names:
+            return
+        del self.names[doc_id]
+        for token in set(self.doc_tokens.pop(doc_id)):
+            postings = self.token_postings[token]
+            postings.discard(doc_id)
+            if postings:
+                continue
+            del self.token_postings[token]
+            del self.sorted_tokens[bisect.bisect_left(self.sorted_tokens, token)]
+            for gram in trigrams(token):
+                words = self.trigram_tokens[gram]
+                words.discard(token)
+                if not words:
+                    del self.trigram_tokens[gram]
+
+    def sync(self, view: 'CatalogView'):
+        """Apply the name changes between the indexed snapshot and a new catalog version"""
+        current = {doc_id: str(view.table.get(row, 'name') or '') for doc_id, row in view.by_id.items()}
+        for doc_id in [d for d in self.names if d not in current]:
+            self.remove(doc_id)
+        changed = [(doc_id, name) for doc_id, name in current.items() if self.names.get(doc_id) != name]
+        # Large batches (the first build) sort the vocabulary once instead of per new word
+        bulk = len(changed) > 1000
+        for doc_id, name in changed:
+            self.add(doc_id, name, keep_sorted=not bulk)
+        if bulk:
+            self.sorted_tokens = sorted(self.token_postings)
+        self.syncs += 1
+
+    def _expand(self, token: str, fuzzy: bool, min_similarity: float) -> Dict[str, float]:
+        """Vocabulary words a query word may stand for, with their match weight"""
+        lo = bisect.bisect_left(self.sorted_tokens, token)
+        hi = bisect.bisect_left(self.sorted_tokens, token + '\U0010ffff')
+        words = {word: 0.8 for word in sorted(self.sorted_tokens[lo:hi], key=len)}
+        if token in words:
+            words[token] = 1.0
+        if words or not fuzzy:
+            return words
+        
+        grams = trigrams(token)
+        shared: Counter = Counter()
+        for gram in grams:
+            shared.update(self.trigram_tokens.get(gram, ()))
+        for word, count in shared.items():
+            similarity = count / (len(grams) + len(word) + 1 - count)
+            if similarity >= min_similarity:
+                words[word] = 0.6 * similarity
+        return words
+
+    def search(self, query: str, fuzzy: bool = True, min_similarity: float = 0.4) -> List[Tuple[float, Any]]:
+        """Rank ids whose words match every query word by exact, prefix or fuzzy match"""
+        normalized = normalize_text(query)
+        tokens = normalized.split()
+        if not tokens:
+            return []
+        expansions = [self._expand(token, fuzzy, min_similarity) for token in tokens]
+        if not all(expansions):
+            return []
+        
+        # Ids matching every query word, cheapest word first
+        expansions.sort(key=lambda words: sum(len(self.token_postings[w]) for w in words))
+        matched: Set[Any] = set()
+        for n, words in enumerate(expansions):
+            ids = set().union(*(self.token_postings[w] for w in words))
+            matched = ids if n == 0 else matched & ids
+            if not matched:
+                return []
+        
+        # Rank at most MAX_CANDIDATES ids, taking those reached through the best matching words first
+        anchor, others = expansions[0], expansions[1:]
+        candidates: Dict[Any, float] = {}
+        for word in sorted(anchor, key=lambda w: -anchor[w]):
+            for doc_id in self.token_postings[word]:
+                if doc_id in matched and doc_id not in candidates:
+                    candidates[doc_id] = anchor[word]
+                    if len(candidates) >= self.MAX_CANDIDATES:
+                        break
+            if len(candidates) >= self.MAX_CANDIDATES:
+                break
+        
+        ranked = []
+        for doc_id, score in candidates.items():
+            doc_tokens = self.doc_tokens[doc_id]
+            for words in others:
+                best = max((words.get(t, 0.0) for t in doc_tokens), default=0.0)
+                if not best:
+                    break
+                score += best
+            else:
+                score /= len(tokens)
+                if ' '.join(doc_tokens).startswith(normalized):
+                    score += 0.2
+                ranked.append((score, doc_id))
+        
+        ranked.sort(key=lambda pair: (-pair[0], len(self.names[pair[1]]), self.names[pair[1]]))
+        return ranked
+
+# ==================== EPG ====================
+
+EPG_BATCH_CONCURRENCY = int(os.environ.get('EPG_BATCH_CONCURRENCY', '8'))
+
+def epg_ttl(listings: List[Dict[str, Any]]) -> float:
+    """Seconds until the next programme boundary in a short EPG listing"""
+    now = time.time()
+    boundaries = []
+    for listing in listings:
+        for field in ('start_timestamp', 'stop_timestamp'):
+            try:
+                boundary = float(listing.get(field) or 0)
+            except (TypeError, ValueError):
+                continue
+            if boundary > now:
+                boundaries.append(boundary)
+    if not boundaries:
+        return EPG_EMPTY_TTL
+    return min(max(min(boundaries) - now, EPG_MIN_TTL), EPG_MAX_TTL)
+
+async def get_channel_epg(username: str, password: str, stream_id: int, limit: int = 10) -> List[Dict[str, Any]]:
+    """Short EPG for one channel, cached until its current programme ends"""
+    return await cache.get_or_fetch(
+        f"epg_{stream_id}_{limit}",
+        EPG_MAX_TTL,
+        lambda: xtream_api.get_epg(username, password, stream_id, limit, raise_errors=True),
+        ttl_for=epg_ttl,
+        stale_while_revalidate=EPG_STALE_SECONDS,
+    )
+
+# ==================== XMLTV GUIDE ====================
+
+# Programmes this far around now are kept in memory; the rest stay in Mongo only
+EPG_GUIDE_PAST_HOURS = float(os.environ.get('EPG_GUIDE_PAST_HOURS', '6'))
+EPG_GUIDE_FUTURE_HOURS = float(os.environ.get('EPG_GUIDE_FUTURE_HOURS', '48'))
+EPG_GUIDE_BATCH = 1000
+# Programmes are dropped from Mongo this long after they end
+EPG_GUIDE_RETENTION = 24 * 3600
+# How often a worker checks whether another worker ingested a newer guide
+EPG_GUIDE_RELOAD_CHECK = 60
+# Ingests run one at a time across workers; the lease outlasts the slowest expected ingest
+EPG_GUIDE_INGEST_LEASE = float(os.environ.get('EPG_GUIDE_INGEST_LEASE', '1800'))
+
+def parse_xmltv_time(value: str) -> Optional[datetime]:
+    """Parse an XMLTV timestamp like "20240101120000 +0100" into naive UTC"""
+    value = (value or '').strip()
+    try:
+        parsed = datetime.strptime(value[:14], '%Y%m%d%H%M%S')
+    except ValueError:
+        return None
+    offset = value[14:].strip()
+    if len(offset) == 5 and offset[0] in '+-' and offset[1:].isdigit():
+        delta = timedelta(hours=int(offset[1:3]), minutes=int(offset[3:5]))
+        parsed = parsed - delta if offset[0] == '+' else parsed + delta
+    return parsed
+
+class XmltvParser:
+    """Incremental XMLTV reader; memory stays flat however large the document.
+
+    Feed raw chunks and collect finished <channel> and <programme>
+    records; each element is discarded as soon as it has been read.
+    """
+
+    def __init__(self):
+        self._parser = ElementTree.XMLPullParser(events=('start', 'end'))
+        self._root = None
+
+    def feed(self, chunk: bytes) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        self._parser.feed(chunk)
+        channels, programmes = [], []
+        for event, elem in self._parser.read_events():
+            if event == 'start':
+                if self._root is None:
+                    self._root = elem
+                continue
+            if elem.tag == 'programme':
+                start = parse_xmltv_time(elem.get('start'))
+                stop = parse_xmltv_time(elem.get('stop'))
+                if start is not None and stop is not None and elem.get('channel'):
+                    programmes.append({
+                        'channel': elem.get('channel'),
+                        'start': start,
+                        'stop': stop,
+                        'title': elem.findtext('title') or '',
+                        'desc': elem.findtext('desc') or '',
+                    })
+            elif elem.tag == 'channel':
+                icon = elem.find('icon')
+                channels.append({
+                    'channel': elem.get('id'),
+                    'name': elem.findtext('display-name') or '',
+                    'icon': icon.get('src') if icon is not None else None,
+                })
+            else:
+                continue
+            # Drop the finished element and everything the root has accumulated
+            elem.clear()
+            self._root.clear()
+        return channels, programmes
+
+    def close(self):
+        self._parser.close()
+
+class EpgGuide:
+    """Full XMLTV guide stored in Mongo and indexed in memory per channel.
+
+    Each channel keeps its programmes sorted by start time next to a
+    parallel list of start timestamps, so now/next and time-window lookups
+    are a bisect per channel. Every ingest writes a new generation tagged
+    with its ingest_id; readers only load the generation published in meta.
+    """
+
+    def __init__(self, programmes_collection, meta_collection, leases: Optional[MongoLease] = None,
+                 lease_poll_interval: float = 1.0):
+        self.programmes = programmes_collection
+        self.meta = meta_collection
+        self.leases = leases
+        self.lease_poll_interval = lease_poll_interval
+        self.ingest_id: Optional[str] = None
+        self.channel_names: Dict[str, Dict[str, Any]] = {}
+        self._starts: Dict[str, List[float]] = {}
+        self._entries: Dict[str, List[Tuple[float, float, str, str]]] = {}
+        self._checked_at = 0.0
+        self._ingesting: Optional[asyncio.Task] = None
+        self._stats = {
+            'ingests': 0,
+            'ingest_errors': 0,
+            'last_ingest_at': None,
+            'last_ingest_seconds': None,
+            'last_ingest_programmes': 0,
+            'lease_waits': 0,
+            'reloads': 0,
+        }
+
+    async def ensure_indexes(self):
+        await create_index(self.programmes, [('channel', 1), ('start', 1)])
+        await create_index(self.programmes, [('ingest_id', 1), ('start', 1), ('stop', 1)])
+        await create_index(self.programmes, 'stop', expireAfterSeconds=EPG_GUIDE_RETENTION)
+
+    @staticmethod
+    def _window() -> Tuple[datetime, datetime]:
+        now = datetime.utcnow()
+        return now - timedelta(hours=EPG_GUIDE_PAST_HOURS), now + timedelta(hours=EPG_GUIDE_FUTURE_HOURS)
+
+    @staticmethod
+    def _epoch(value: datetime) -> float:
+        return (value - datetime(1970, 1, 1)).total_seconds()
+
+    def _index(self, programmes: List[Dict[str, Any]]):
+        """Rebuild the per-channel interval lists"""
+        entries: Dict[str, List[Tuple[float, float, str, str]]] = {}
+        for p in programmes:
+            entries.setdefault(p['channel'], []).append(
+                (self._epoch(p['start']), self._epoch(p['stop']), p['title'], p['desc'])
+            )
+        for channel_entries in entries.values():
+            channel_entries.sort()
+        self._entries = entries
+        self._starts = {channel: [e[0] for e in items] for channel, items in entries.items()}
+
+    async def ingest(self, chunks: AsyncIterator[bytes]) -> Dict[str, Any]:
+        """Stream-parse an XMLTV document into Mongo, then swap it in.
+
+        Waits for an ingest running on any worker to finish first.
+        """
+        if self.leases is None:
+            return await self._ingest(chunks)
+        while not await self.leases.acquire('epg_ingest', seconds=EPG_GUIDE_INGEST_LEASE):
+            self._stats['lease_waits'] += 1
+            await asyncio.sleep(self.lease_poll_interval)
+        try:
+            return await self._ingest(chunks)
+        finally:
+            await self.leases.release('epg_ingest')
+
+    async def _ingest(self, chunks: AsyncIterator[bytes]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        ingest_id = uuid.uuid4().hex
+        window_start, window_end = self._window()
+        parser = XmltvParser()
+        channels: Dict[str, Dict[str, Any]] = {}
+        in_window: List[Dict[str, Any]] = []
+        batch: List[Dict[str, Any]] = []
+        total = 0
+        
+        async def flush():
+            if batch:
+                await self.programmes.insert_many(batch, ordered=False)
+                batch.clear()
+        
+        async for chunk in chunks:
+            new_channels, programmes = parser.feed(chunk)
+            for channel in new_channels:
+                channels[channel['channel']] = channel
+            for programme in programmes:
+                total += 1
+                if programme['stop'] >= window_start and programme['start'] <= window_end:
+                    in_window.append(programme)
+                batch.append({**programme, 'ingest_id': ingest_id})
+            if len(batch) >= EPG_GUIDE_BATCH:
+                await flush()
+        parser.close()
+        await flush()
+        
+        # The new generation is complete; publish it, then retire the one it replaces.
+        # Generations left by failed ingests are never published and age out with the TTL index
+        previous = await self.meta.find_one_and_update(
+            {'_id': 'xmltv'},
+            {'$set': {'ingest_id': ingest_id, 'channels': list(channels.values()),
+                      'programmes': total, 'finished_at': datetime.utcnow()}},
+            projection={'ingest_id': 1},
+            upsert=True
+        )
+        if previous is not None and previous.get('ingest_id') != ingest_id:
+            await self.programmes.delete_many({'ingest_id': previous['ingest_id']})
+        self.channel_names = channels
+        self._index(in_window)
+        self.ingest_id = ingest_id
+        self._checked_at = time.monotonic()
+        
+        elapsed = time.perf_counter() - started
+        self._stats['ingests'] += 1
+        self._stats['last_ingest_at'] = datetime.utcnow().isoformat()
+        self._stats['last_ingest_seconds'] = round(elapsed, 3)
+        self._stats['last_ingest_programmes'] = total
+        return {'ingest_id': ingest_id, 'channels': len(channels), 'programmes': total}
+
+    async def ingest_from_upstream(self, username: str, password: str) -> Dict[str, Any]:
+        try:
+            return await self.ingest(xtream_api.xmltv(username, password))
+        except Exception:
+            self._stats['ingest_errors'] += 1
+            raise
+
+    def start_ingest(self, username: str, password: str) -> bool:
+        """Run an ingest in the background unless one is already running"""
+        if self._ingesting is not None and not self._ingesting.done():
+            return False
+        self._ingesting = asyncio.ensure_future(self.ingest_from_upstream(username, password))
+        self._ingesting.add_done_callback(self._ingest_done)
+        return True
+
+    def _ingest_done(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"XMLTV ingest error: {str(task.exception())}")
+
+    async def ensure_loaded(self):
+        """Load the newest ingested guide from Mongo if this worker does not hold it"""
+        if time.monotonic() - self._checked_at < EPG_GUIDE_RELOAD_CHECK and self.ingest_id is not None:
+            return
+        self._checked_at = time.monotonic()
+        meta = await self.meta.find_one({'_id': 'xmltv'})
+        if meta is None or meta['ingest_id'] == self.ingest_id:
+            return
+        window_start, window_end = self._window()
+        cursor = self.programmes.find(
+            {'ingest_id': meta['ingest_id'], 'start': {'$lte': window_end}, 'stop': {'$gte': window_start}},
+            {'_id': 0, 'channel': 1, 'start': 1, 'stop': 1, 'title': 1, 'desc': 1}
+        )
+        self._index(await cursor.to_list(length=None))
+        self.channel_names = {c['channel']: c for c in meta.get('channels', [])}
+        self.ingest_id = meta['ingest_id']
+        self._stats['reloads'] += 1
+
+    @staticmethod
+    def _programme(entry: Tuple[float, float, str, str]) -> Dict[str, Any]:
+        start, stop, title, desc = entry
+        return {'start_timestamp': int(start), 'stop_timestamp': int(stop), 'title': title, 'description': desc}
+
+    def now_next(self, channels: Optional[List[str]] = None, at: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+        """Programme on air and the one after it, per channel"""
+        at = time.time() if at is None else at
+        result = {}
+        for channel in channels if channels is not None else self._entries:
+            entries = self._entries.get(channel)
+            if not entries:
+                continue
+            i = bisect.bisect_right(self._starts[channel], at)
+            current = entries[i - 1] if i > 0 and entries[i - 1][1] > at else None
+            following = entries[i] if i < len(entries) else None
+            result[channel] = {
+                'now': self._programme(current) if current else None,
+                'next': self._programme(following) if following else None,
+            }
+        return result
+
+    def grid(self, start: float, end: float, channels: Optional[List[str]] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """Programmes overlapping [start, end), per channel"""
+        result = {}
+        for channel in channels if channels is not None else self._entries:
+            entries = self._entries.get(channel)
+            if not entries:
+                continue
+            i = max(bisect.bisect_right(self._starts[channel], start) - 1, 0)
+            window = []
+            while i < len(entries) and entries[i][0] < end:
+                if entries[i][1] > start:
+                    window.append(self._programme(entries[i]))
+                i += 1
+            result[channel] = window
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            'ingest_id': self.ingest_id,
+            'ingesting': self._ingesting is not None and not self._ingesting.done(),
+            'channels': len(self._entries),
+            'programmes_in_memory': sum(len(e) for e in self._entries.values()),
+        }
+
+epg_guide = EpgGuide(db.epg_programmes, db.epg_meta, leases=MongoLease(db.cache_leases))
+
+# ==================== SERIES LIBRARY ====================
+
+# Series info is fetched at most this many at a time by the prefetcher
+SERIES_PREFETCH_CONCURRENCY = int(os.environ.get('SERIES_PREFETCH_CONCURRENCY', '4'))
+# How many titles of a served series page are prefetched, and how many of the most opened per warmer run
+SERIES_PREFETCH_VISIBLE = int(os.environ.get('SERIES_PREFETCH_VISIBLE', '24'))
+SERIES_PREFETCH_POPULAR = int(os.environ.get('SERIES_PREFETCH_POPULAR', '50'))
+
+def series_episodes(data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Flatten get_series_info episodes (season -> list, or a list of lists) into one list"""
+    episodes = data.get('episodes') or {}
+    seasons = episodes.values() if isinstance(episodes, dict) else episodes
+    flat = []
+    for season in seasons:
+        if isinstance(season, list):
+            flat.extend(e for e in season if isinstance(e, dict) and e.get('id') is not None)
+    return flat
+
+class SeriesLibrary:
+    """Series info held in Mongo, with episodes indexed on their own.
+
+    Each series is one document (info and seasons) in `series`, and each
+    episode one document in `episodes` whose _id is the episode id, so a
+    detail page or an episode lookup never waits on the panel once the
+    series has been fetched. It is the only store of series info;
+    concurrent refetches of one series share a single panel call.
+    prefetch() fills it ahead of time with bounded parallelism.
+    """
+
+    def __init__(self, series, episodes, ttl: float = SERIES_INFO_TTL, concurrency: int = SERIES_PREFETCH_CONCURRENCY):
+        self.series = series
+        self.episodes = episodes
+        self.ttl = ttl
+        self.concurrency = concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._pending: set = set()
+        self._tasks: set = set()
+        self._opened: Counter = Counter()
+        self._flight = SingleFlight()
+        self._stats = {'fetched': 0, 'fresh': 0, 'empty': 0, 'errors': 0, 'queued': 0, 'stale_served': 0}
+
+    async def ensure_indexes(self):
+        await create_index(self.episodes, [('series_id', 1), ('season', 1), ('episode_num', 1)])
+        await create_index(self.series, 'fetched_at')
+
+    async def store(self, series_id: int, data: Dict[str, Any]):
+        """Replace a series and its episodes with a freshly fetched get_series_info body"""
+        episodes = series_episodes(data)
+        ids = [str(e['id']) for e in episodes]
+        await self.series.replace_one(
+            {'_id': series_id},
+            {
+                '_id': series_id,
+                'info': data.get('info') or {},
+                'seasons': data.get('seasons') or [],
+                'episode_ids': ids,
+                'fetched_at': datetime.utcnow(),
+            },
+            upsert=True
+        )
+        if episodes:
+            await self.episodes.bulk_write([
+                ReplaceOne({'_id': episode_id}, {**episode, '_id': episode_id, 'series_id': series_id}, upsert=True)
+                for episode_id, episode in zip(ids, episodes)
+            ], ordered=False)
+        await self.episodes.delete_many({'series_id': series_id, '_id': {'$nin': ids}})
+
+    async def load(self, series_id: int) -> Optional[Tuple[Dict[str, Any], datetime]]:
+        """A stored series in get_series_info shape and when it was fetched, or None"""
+        doc = await self.series.find_one({'_id': series_id})
+        if doc is None:
+            return None
+        cursor = self.episodes.find({'series_id': series_id}, {'series_id': 0}).sort([('season', 1), ('episode_num', 1)])
+        episodes: Dict[str, List[Dict[str, Any]]] = {}
+        for episode in await cursor.to_list(length=None):
+            del episode['_id']
+            episodes.setdefault(str(episode.get('season')), []).append(episode)
+        return {'seasons': doc['seasons'], 'info': doc['info'], 'episodes': episodes}, doc['fetched_at']
+
+    async def episode(self, episode_id: Any) -> Optional[Dict[str, Any]]:
+        return await self.episodes.find_one({'_id': str(episode_id)})
+
+    async def _is_fresh(self, series_id: int) -> bool:
+        """Whether a series is stored and younger than ttl, reading only its fetched_at"""
+        doc = await self.series.find_one({'_id': series_id}, {'fetched_at': 1})
+        return doc is not None and (datetime.utcnow() - doc['fetched_at']).total_seconds() < self.ttl
+
+    async def info(self, username: str, password: str, series_id: int) -> Dict[str, Any]:
+        """Stored series info, refetched from the panel once older than ttl"""
+        if await self._is_fresh(series_id):
+            stored = await self.load(series_id)
+            if stored is not None:
+                self._stats['fresh'] += 1
+                return stored[0]
+        return await self._flight.do(str(series_id), lambda: self._refresh(username, password, series_id))
+
+    async def ensure_fresh(self, username: str, password: str, series_id: int):
+        """Refetch a series unless it is stored and fresh, without loading its episodes"""
+        if await self._is_fresh(series_id):
+            self._stats['fresh'] += 1
+            return
+        await self._flight.do(str(series_id), lambda: self._refresh(username, password, series_id))
+
+    async def _refresh(self, username: str, password: str, series_id: int) -> Dict[str, Any]:
+        try:
+            data = await xtream_api.get_series_info(username, password, series_id, raise_errors=True)
+        except Exception as e:
+            stored = await self.load(series_id)
+            if stored is None:
+                raise
+            logger.warning(f"Serving stored series {series_id} after refresh error: {str(e)}")
+            self._stats['stale_served'] += 1
+            return stored[0]
+        if is_empty(data) or not data.get('info'):
+            # Unknown series, or a panel glitch; never replace what we have with it
+            self._stats['empty'] += 1
+            stored = await self.load(series_id)
+            return stored[0] if stored is not None else {}
+        await self.store(series_id, data)
+        self._stats['fetched'] += 1
+        return data
+
+    def opened(self, series_id: int):
+        self._opened[series_id] += 1
+
+    def popular(self, n: int = SERIES_PREFETCH_POPULAR) -> List[int]:
+        """Series whose detail page was opened most on this worker"""
+        return [series_id for series_id, _ in self._opened.most_common(n)]
+
+    async def prefetch(self, username: str, password: str, series_ids: List[int]) -> Dict[str, int]:
+        """Make sure every series is stored and fresh, fetching at most `concurrency` at a time"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        before = dict(self._stats)
+        
+        async def one(series_id: int):
+            async with self._semaphore:
+                try:
+                    await self.ensure_fresh(username, password, series_id)
+                except Exception as e:
+                    self._stats['errors'] += 1
+                    logger.error(f"Series prefetch error for {series_id}: {str(e)}")
+                finally:
+                    self._pending.discard(series_id)
+        
+        await asyncio.gather(*[one(series_id) for series_id in series_ids])
+        return {name: self._stats[name] - before[name] for name in ('fetched', 'fresh', 'empty', 'errors')}
+
+    def enqueue(self, username: str, password: str, series_ids: List[int]) -> int:
+        """Prefetch in the background, skipping series already on their way"""
+        series_ids = [s for s in dict.fromkeys(series_ids) if s is not None and s not in self._pending]
+        if not series_ids:
+            return 0
+        self._pending.update(series_ids)
+        self._stats['queued'] += len(series_ids)
+        task = asyncio.ensure_future(self.prefetch(username, password, series_ids))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return len(series_ids)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._stats, 'pending': len(self._pending), 'tracked_popular': len(self._opened)}
+
+series_library = SeriesLibrary(db.series_info, db.episodes)
+
+# ==================== PLAYBACK ====================
+
+# Resolve playback URLs to their edge by default; clients can still ask per request
+PLAYBACK_RESOLVE = os.environ.get('PLAYBACK_RESOLVE', 'false').lower() in ('1', 'true', 'yes')
+# Edge URLs carry short-lived tokens, so they are only reused briefly
+PLAYBACK_EDGE_TTL = float(os.environ.get('PLAYBACK_EDGE_TTL', '20'))
+PLAYBACK_EDGE_MAX = int(os.environ.get('PLAYBACK_EDGE_MAX', '5000'))
+# Channels on each side of the one being played that are resolved ahead of a zap
+PLAYBACK_NEIGHBOURS = int(os.environ.get('PLAYBACK_NEIGHBOURS', '2'))
+
+class EdgeResolver:
+    """Panel playback URL -> edge URL, resolved server-side and cached briefly.
+
+    Saves the player the redirect round trips before its first request.
+    Concurrent resolutions of the same URL share one upstream chain. When
+    resolution fails the panel URL is handed out unchanged and the player
+    follows the redirect itself.
+    """
+
+    def __init__(self, ttl: float = PLAYBACK_EDGE_TTL, max_entries: int = PLAYBACK_EDGE_MAX):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._flight = SingleFlight()
+        self._tasks: set = set()
+        self._stats = {'hits': 0, 'misses': 0, 'resolved': 0, 'failures': 0, 'prefetched': 0}
+
+    def cached(self, url: str) -> Optional[str]:
+        entry = self._entries.get(url)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[1] >= self.ttl:
+            del self._entries[url]
+            return None
+        self._entries.move_to_end(url)
+        return entry[0]
+
+    async def _resolve(self, url: str) -> str:
+        edge = await xtream_api.resolve_redirects(url)
+        self._stats['resolved'] += 1
+        self._entries[url] = (edge, time.monotonic())
+        self._entries.move_to_end(url)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return edge
+
+    async def resolve(self, url: str) -> str:
+        edge = self.cached(url)
+        if edge is not None:
+            self._stats['hits'] += 1
+            return edge
+        self._stats['misses'] += 1
+        return await self._flight.do(url, lambda: self._resolve(url))
+
+    async def playback_url(self, url: str) -> Tuple[str, bool]:
+        """The edge URL when it can be resolved, else the panel URL; and whether it was resolved"""
+        try:
+            return await self.resolve(url), True
+        except Exception as e:
+            self._stats['failures'] += 1
+            logger.warning(f"Playback redirect resolution failed: {str(e)}")
+            return url, False
+
+    def background(self, coro: Awaitable[Any]):
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._prefetch_done)
+
+    def prefetch(self, urls: List[str]) -> int:
+        """Resolve URLs in the background so a later request finds them cached"""
+        started = 0
+        for url in urls:
+            if self.cached(url) is not None or self._flight.running(url):
+                continue
+            self.background(self._flight.do(url, lambda url=url: self._resolve(url)))
+            started += 1
+        self._stats['prefetched'] += started
+        return started
+
+    def _prefetch_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self._stats['failures'] += 1
+            logger.warning(f"Playback prefetch error: {str(task.exception())}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._stats, 'entries': len(self._entries), 'prefetching': len(self._tasks)}
+
+edge_resolver = EdgeResolver()
+
+async def neighbour_stream_ids(username: str, password: str, stream_id: int, count: int = PLAYBACK_NEIGHBOURS) -> List[Any]:
+    """Channels next to stream_id in its category, nearest first, as a user zaps up or down"""
+    _, view, allowed = await get_catalog_view('live', username, password)
+    row = view.by_id.get(stream_id)
+    if row is None:
+        return []
+    category_id = next((c for c in view.category_ids(row) if allowed is None or c in allowed), None)
+    rows = view.by_category.get(category_id)
+    if not rows:
+        return []
+    position = rows.index(row)
+    neighbours = []
+    for step in range(1, count + 1):
+        for index in (position + step, position - step):
+            if 0 <= index < len(rows):
+                neighbours.append(view.table.get(rows[index], 'stream_id'))
+    return neighbours
+
+async def prefetch_neighbours(username: str, password: str, stream_id: int, extension: str) -> int:
+    """Resolve the edges of the channels around stream_id ahead of a zap"""
+    neighbours = await neighbour_stream_ids(username, password, stream_id)
+    return edge_resolver.prefetch([
+        xtream_api.get_stream_url(username, password, neighbour, extension) for neighbour in neighbours
+    ])
+
+async def playback_response(url: str, resolve: Optional[bool]) -> Dict[str, Any]:
+    """Body of the stream-url routes, with the edge URL in resolve mode"""
+    if not (PLAYBACK_RESOLVE if resolve is None else resolve):
+        return {"stream_url": url}
+    stream_url, resolved = await edge_resolver.playback_url(url)
+    return {"stream_url": stream_url, "resolved": resolved}
+
+# ==================== HLS PROXY ====================
+
+# Serve live channels through /api/live/hls so viewers of a channel share playlist polls
+HLS_PROXY_ENABLED = os.environ.get('HLS_PROXY_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+# Variant (master) playlists change rarely; media playlists are reused for a share of their target duration
+HLS_MASTER_TTL = float(os.environ.get('HLS_MASTER_TTL', '30'))
+HLS_PLAYLIST_TTL_FACTOR = float(os.environ.get('HLS_PLAYLIST_TTL_FACTOR', '1.0'))
+HLS_PLAYLIST_MAX_TTL = float(os.environ.get('HLS_PLAYLIST_MAX_TTL', '10'))
+HLS_MAX_CHANNELS = int(os.environ.get('HLS_MAX_CHANNELS', '500'))
+# Upstream URLs remembered per channel for the opaque names handed to players
+HLS_CHANNEL_URLS = int(os.environ.get('HLS_CHANNEL_URLS', '2000'))
+HLS_MEDIA_TYPE = 'application/vnd.apple.mpegurl'
+# Segments are relayed through /api/live/hls/{stream_id}/s/ and cached, so each is pulled from the panel once
+HLS_SEGMENT_RELAY = os.environ.get('HLS_SEGMENT_RELAY', 'true').lower() in ('1', 'true', 'yes')
+HLS_SEGMENT_MEMORY_BYTES = int(os.environ.get('HLS_SEGMENT_MEMORY_BYTES', str(64 * 1024 * 1024)))
+# Size of the mmap'd ring file behind the memory tier; 0 keeps segments in memory only
+HLS_SEGMENT_DISK_BYTES = int(os.environ.get('HLS_SEGMENT_DISK_BYTES', str(256 * 1024 * 1024)))
+HLS_SEGMENT_DISK_DIR = os.environ.get('HLS_SEGMENT_DISK_DIR', tempfile.gettempdir())
+HLS_SEGMENT_MAX_BYTES = int(os.environ.get('HLS_SEGMENT_MAX_BYTES', str(16 * 1024 * 1024)))
+HLS_SEGMENT_TYPES = {
+    '.ts': 'video/mp2t',
+    '.m4s': 'video/iso.segment',
+    '.mp4': 'video/mp4',
+    '.aac': 'audio/aac',
+    '.key': 'application/octet-stream',
+}
+
+_HLS_URI_ATTR = re.compile(r'URI="([^"]*)"')
+# Tags whose URI attribute names another playlist rather than media
+_HLS_PLAYLIST_TAGS = ('#EXT-X-MEDIA', '#EXT-X-I-FRAME-STREAM-INF')
+
+class HlsPlaylist:
+    """A rewritten playlist: literal text and proxy links, joined per viewer by render()"""
+
+    __slots__ = ('parts', 'fetched_at', 'ttl', 'is_master')
+
+    def __init__(self, parts: List[Any], ttl: float, is_master: bool):
+        self.parts = parts
+        self.fetched_at = time.monotonic()
+        self.ttl = ttl
+        self.is_master = is_master
+
+    @property
+    def fresh(self) -> bool:
+        return time.monotonic() - self.fetched_at < self.ttl
+
+    def render(self, base: str, query: str) -> bytes:
+        """Proxy links are relative to where the playlist is served (base) and carry the viewer's auth query"""
+        return ''.join(part if isinstance(part, str) else f"{base}{part[0]}{query}" for part in self.parts).encode()
+
+class SegmentRing:
+    """Fixed-size mmap'd file that segments are appended to as a ring.
+
+    Writes go at a moving offset and wrap to the start when the next
+    segment does not fit; whatever they overlap is dropped from the index,
+    so the oldest segments are always the ones overwritten. The file is
+    unlinked as soon as it is mapped, leaving nothing behind on exit.
+    """
+
+    def __init__(self, size: int, directory: str = HLS_SEGMENT_DISK_DIR):
+        self.size = size
+        self.directory = directory
+        self._map: Optional[mmap.mmap] = None
+        self._offset = 0
+        self._index: "OrderedDict[str, Tuple[int, int]]" = OrderedDict()
+        self.bytes = 0
+        self.evictions = 0
+
+    def _open(self) -> mmap.mmap:
+        if self._map is None:
+            fd, path = tempfile.mkstemp(prefix='luxapp-segments-', suffix='.ring', dir=self.directory)
+            try:
+                os.ftruncate(fd, self.size)
+                self._map = mmap.mmap(fd, self.size)
+            finally:
+                os.close(fd)
+                with contextlib.suppress(OSError):
+                    os.unlink(path)
+        return self._map
+
+    def _drop_oldest(self):
+        _, (_, length) = self._index.popitem(last=False)
+        self.bytes -= length
+        self.evictions += 1
+
+    def put(self, name: str, data: bytes) -> bool:
+        length = len(data)
+        if name in self._index or length > self.size:
+            return False
+        ring = self._open()
+        if self._offset + length > self.size:
+            # Entries between the old offset and the end are the oldest; they go with the wrap
+            while self._index and next(iter(self._index.values()))[0] >= self._offset:
+                self._drop_oldest()
+            self._offset = 0
+        start, end = self._offset, self._offset + length
+        while self._index:
+            offset, size = next(iter(self._index.values()))
+            if not (offset < end and start < offset + size):
+                break
+            self._drop_oldest()
+        ring[start:end] = data
+        self._index[name] = (start, length)
+        self.bytes += length
+        self._offset = end
+        return True
+
+    def get(self, name: str) -> Optional[bytes]:
+        entry = self._index.get(name)
+        if entry is None:
+            return None
+        offset, length = entry
+        return self._map[offset:offset + length]
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+            self._index.clear()
+            self.bytes = 0
+
+class SegmentCache:
+    """Byte-budget LRU of segment bodies in memory, spilling to a SegmentRing.
+
+    A cached body is one bytes object handed to every viewer as is; only
+    a disk hit copies, once, when it is promoted back into memory.
+    """
+
+    def __init__(self, memory_bytes: int = HLS_SEGMENT_MEMORY_BYTES, disk_bytes: int = HLS_SEGMENT_DISK_BYTES, directory: str = HLS_SEGMENT_DISK_DIR):
+        self.memory_bytes = memory_bytes
+        self.ring = SegmentRing(disk_bytes, directory) if disk_bytes > 0 else None
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._bytes = 0
+        self.evictions = 0
+
+    def get(self, name: str) -> Tuple[Optional[bytes], Optional[str]]:
+        """A segment body and the tier it came from ('memory' or 'disk'), or (None, None)"""
+        data = self._entries.get(name)
+        if data is not None:
+            self._entries.move_to_end(name)
+            return data, 'memory'
+        data = self.ring.get(name) if self.ring is not None else None
+        if data is not None:
+            self._remember(name, data)
+            return data, 'disk'
+        return None, None
+
+    def _remember(self, name: str, data: bytes):
+        if len(data) > self.memory_bytes:
+            return
+        self._entries[name] = data
+        self._bytes += len(data)
+        while self._bytes > self.memory_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self.evictions += 1
+
+    def put(self, name: str, data: bytes):
+        if name in self._entries:
+            return
+        self._remember(name, data)
+        if self.ring is not None:
+            self.ring.put(name, data)
+
+    def close(self):
+        self._entries.clear()
+        self._bytes = 0
+        if self.ring is not None:
+            self.ring.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'memory_entries': len(self._entries),
+            'memory_bytes': self._bytes,
+            'memory_max_bytes': self.memory_bytes,
+            'memory_evictions': self.evictions,
+            'disk_entries': len(self.ring) if self.ring is not None else 0,
+            'disk_bytes': self.ring.bytes if self.ring is not None else 0,
+            'disk_max_bytes': self.ring.size if self.ring is not None else 0,
+            'disk_evictions': self.ring.evictions if self.ring is not None else 0,
+        }
+
+class HlsChannel:
+    """Playlists and upstream URLs of one channel, for every viewer or for one (viewer)"""
+
+    __slots__ = ('stream_id', 'viewer', 'urls', 'playlists', 'segments')
+
+    def __init__(self, stream_id: int, viewer: Optional[str] = None):
+        self.stream_id = stream_id
+        self.viewer = viewer
+        self.urls: "OrderedDict[str, str]" = OrderedDict()
+        self.playlists: Dict[str, HlsPlaylist] = {}
+        # Segment requests served, by tier, and segments pulled from the panel
+        self.segments: Counter = Counter()
+
+    def segment_stats(self) -> Dict[str, Any]:
+        served = self.segments['memory'] + self.segments['disk'] + self.segments['miss']
+        fetched = self.segments['fetched']
+        return {
+            **self.segments,
+            'served': served,
+            'fan_out': round(served / fetched, 2) if fetched else None,
+            'hit_ratio': round((served - self.segments['miss']) / served, 3) if served else None,
+        }
+
+    def name(self, url: str) -> str:
+        """Opaque, stable name for an upstream URL, so panel credentials and edge tokens stay server-side"""
+        name = hashlib.sha1(url.encode()).hexdigest()[:16]
+        self.urls[name] = url
+        self.urls.move_to_end(name)
+        while len(self.urls) > HLS_CHANNEL_URLS:
+            self.urls.popitem(last=False)
+        return name
+
+class HlsProxy:
+    """Caching, rewriting proxy for live HLS playlists.
+
+    The entry playlist of a channel is fetched from the panel URL and
+    cached for HLS_MASTER_TTL when it lists variants, or for its target
+    duration when it is a media playlist. Variant playlist URIs are
+    rewritten to opaque proxy paths; concurrent requests for the same
+    playlist share one upstream fetch. With relay on, segment and key URIs
+    are rewritten too and served from a SegmentCache, so each is pulled
+    from the panel once however many viewers a channel has. Without it
+    they are made absolute and players fetch from the edge.
+
+    URIs left absolute carry the edge token (or credentials) of whoever
+    fetched the playlist, and so do the upstream URLs behind proxy names
+    further down. A channel's playlists are therefore shared between
+    viewers only when every kind of URI is proxied (relay on); otherwise
+    each viewer gets a channel of their own, fetched with their own
+    credentials.
+    """
+
+    def __init__(self, max_channels: int = HLS_MAX_CHANNELS, relay: bool = HLS_SEGMENT_RELAY, segments: Optional[SegmentCache] = None):
+        self.max_channels = max_channels
+        self.relay = relay
+        self.segments = segments if segments is not None else SegmentCache()
+        self._channels: "OrderedDict[Tuple[int, Optional[str]], HlsChannel]" = OrderedDict()
+        self._flight = SingleFlight()
+        self._segment_flight = SingleFlight()
+        self._stats = {'requests': 0, 'hits': 0, 'upstream_fetches': 0, 'upstream_errors': 0}
+
+    def proxied(self, kind: str) -> bool:
+        """Whether URIs of a kind ('playlist', 'segment' or 'key') become proxy links"""
+        return kind == 'playlist' or self.relay
+
+    @property
+    def shared(self) -> bool:
+        """Whether served playlists hold no upstream URI, so viewers can share them"""
+        return all(self.proxied(kind) for kind in ('playlist', 'segment', 'key'))
+
+    def channel(self, stream_id: int, viewer: Optional[str] = None) -> HlsChannel:
+        """The channel as `viewer` sees it: the shared one, or their own when playlists keep upstream URIs"""
+        key = (stream_id, None if self.shared else viewer)
+        channel = self._channels.get(key)
+        if channel is None:
+            channel = self._channels[key] = HlsChannel(*key)
+            while len(self._channels) > self.max_channels:
+                self._channels.popitem(last=False)
+        self._channels.move_to_end(key)
+        return channel
+
+    def link(self, channel: HlsChannel, url: str, kind: str) -> Any:
+        """How a URI appears in a served playlist: a proxy path (as a tuple) or literal text"""
+        if not self.proxied(kind):
+            return url
+        if kind == 'playlist':
+            return (f"p/{channel.name(url)}.m3u8",)
+        # Keys are relayed like segments, so the edge token in their URI stays server-side too
+        extension = os.path.splitext(httpx.URL(url).path)[1].lower()
+        if extension not in HLS_SEGMENT_TYPES:
+            extension = '.key' if kind == 'key' else '.ts'
+        return (f"s/{channel.name(url)}{extension}",)
+
+    def rewrite(self, channel: HlsChannel, text: str, base_url: str) -> HlsPlaylist:
+        lines = text.splitlines()
+        is_master = any(line.startswith('#EXT-X-STREAM-INF') for line in lines)
+        target_duration = None
+        parts: List[Any] = []
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('#'):
+                if line.startswith('#EXT-X-TARGETDURATION:'):
+                    try:
+                        target_duration = float(line.split(':', 1)[1])
+                    except ValueError:
+                        pass
+                match = _HLS_URI_ATTR.search(line)
+                if match is None:
+                    parts.append(line + '\n')
+                    continue
+                kind = 'playlist' if line.startswith(_HLS_PLAYLIST_TAGS) else 'segment' if line.startswith('#EXT-X-MAP') else 'key'
+                link = self.link(channel, urljoin(base_url, match.group(1)), kind)
+                parts.extend([line[:match.start(1)], link, line[match.end(1):] + '\n'])
+                continue
+            parts.extend([self.link(channel, urljoin(base_url, line), 'playlist' if is_master else 'segment'), '\n'])
+        if is_master or target_duration is None:
+            ttl = HLS_MASTER_TTL
+        else:
+            ttl = min(target_duration * HLS_PLAYLIST_TTL_FACTOR, HLS_PLAYLIST_MAX_TTL)
+        return HlsPlaylist(parts, ttl, is_master)
+
+    async def _fetch(self, channel: HlsChannel, key: str, url: str) -> HlsPlaylist:
+        self._stats['upstream_fetches'] += 1
+        try:
+            text, final_url = await xtream_api.fetch_playlist(url)
+        except Exception:
+            self._stats['upstream_errors'] += 1
+            if key != 'entry':
+                # Variant URLs usually carry an edge token; let the next entry request pick up fresh ones
+                channel.playlists.pop('entry', None)
+            raise
+        if not text.lstrip().startswith('#EXTM3U'):
+            self._stats['upstream_errors'] += 1
+            raise ValueError(f"Upstream did not return a playlist for stream {channel.stream_id}")
+        playlist = self.rewrite(channel, text, final_url)
+        channel.playlists[key] = playlist
+        return playlist
+
+    async def playlist(self, stream_id: int, key: str, url: Optional[str], viewer: Optional[str] = None) -> Optional[HlsPlaylist]:
+        """The cached or freshly fetched playlist `key` ('entry' or a proxy name) of a channel"""
+        self._stats['requests'] += 1
+        channel = self.channel(stream_id, viewer)
+        if key != 'entry':
+            url = channel.urls.get(key)
+            if url is None:
+                return None
+        cached = channel.playlists.get(key)
+        if cached is not None and cached.fresh:
+            self._stats['hits'] += 1
+            return cached
+        return await self._flight.do(f"{stream_id}:{channel.viewer}:{key}", lambda: self._fetch(channel, key, url))
+
+    async def _fetch_segment(self, channel: HlsChannel, key: str, url: str) -> bytes:
+        data = await xtream_api.fetch_segment(url)
+        channel.segments['fetched'] += 1
+        if len(data) <= HLS_SEGMENT_MAX_BYTES:
+            self.segments.put(key, data)
+        return data
+
+    async def segment(self, stream_id: int, name: str, viewer: Optional[str] = None) -> Optional[bytes]:
+        """A relayed segment body, from cache or fetched once for all concurrent viewers"""
+        channel = self.channel(stream_id, viewer)
+        url = channel.urls.get(name)
+        # Cached per channel, so a segment is only ever served on the channel that listed it
+        key = f"{stream_id}:{channel.viewer}:{name}"
+        data, tier = self.segments.get(key)
+        if data is not None:
+            channel.segments[tier] += 1
+            return data
+        if url is None:
+            return None
+        channel.segments['miss'] += 1
+        return await self._segment_flight.do(key, lambda: self._fetch_segment(channel, key, url))
+
+    def stats(self) -> Dict[str, Any]:
+        busiest = sorted(self._channels.values(), key=lambda c: c.segments['fetched'], reverse=True)[:20]
+        return {
+            **self._stats,
+            'coalesced': self._flight.coalesced,
+            'channels': len(self._channels),
+            'hit_ratio': round(self._stats['hits'] / self._stats['requests'], 3) if self._stats['requests'] else None,
+            'relay': self.relay,
+            'shared': self.shared,
+            'segment_cache': {**self.segments.stats(), 'coalesced': self._segment_flight.coalesced},
+            'segments_by_channel': {c.stream_id: c.segment_stats() for c in busiest if c.segments},
+        }
+
+hls_proxy = HlsProxy()
+
+def hls_auth_query(request: Request) -> str:
+    """Query string carrying a viewer's query-string auth into the links of a served playlist"""
+    params = {key: request.query_params[key] for key in ('access_token', 'username', 'password') if key in request.query_params}
+    return f"?{urlencode(params)}" if params else ''
+
+async def require_hls_channel(stream_id: int, session: 'Session') -> None:
+    """404 unless the proxy is on and the stream is in the caller's live catalog"""
+    if not HLS_PROXY_ENABLED:
+        raise HTTPException(status_code=404, detail="HLS proxy is disabled")
+    _, view, allowed = await get_catalog_view('live', session.username, session.password)
+    row = view.by_id.get(stream_id)
+    if row is None or (allowed is not None and allowed.isdisjoint(view.category_ids(row))):
+        raise HTTPException(status_code=404, detail="Stream not found")
+
+def hls_response(playlist: HlsPlaylist, base: str, request: Request) -> Response:
+    return Response(
+        content=playlist.render(base, hls_auth_query(request)),
+        media_type=HLS_MEDIA_TYPE,
+        headers={'Cache-Control': f"max-age={int(playlist.ttl)}" if playlist.is_master else 'no-cache'},
+    )
+
+# ==================== CATALOG WARMER ====================
+
+CATALOG_WARMER_ENABLED = os.environ.get('CATALOG_WARMER_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+# Shorter than CATALOG_TTL so warmed catalogs never go stale between runs
+CATALOG_WARMER_INTERVAL = float(os.environ.get('CATALOG_WARMER_INTERVAL', '900'))
+CATALOG_WARMER_JITTER = float(os.environ.get('CATALOG_WARMER_JITTER', '0.2'))
+CATALOG_WARMER_CONCURRENCY = int(os.environ.get('CATALOG_WARMER_CONCURRENCY', '2'))
+# Only sessions active this recently are used to discover packages
+CATALOG_WARMER_ACTIVE_DAYS = float(os.environ.get('CATALOG_WARMER_ACTIVE_DAYS', '7'))
+
+class CatalogWarmer:
+    """Periodically pulls categories and full catalogs into the cache.
+
+    Each distinct package is fetched once per run using the credentials of
+    one recently active session. Unchanged catalogs only have their
+    timestamp bumped instead of being rewritten.
+    """
+
+    def __init__(
+        self,
+        interval: float = CATALOG_WARMER_INTERVAL,
+        jitter: float = CATALOG_WARMER_JITTER,
+        concurrency: int = CATALOG_WARMER_CONCURRENCY,
+    ):
+        self.interval = interval
+        self.jitter = jitter
+        self.concurrency = concurrency
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {
+            'runs': 0,
+            'skipped_runs': 0,
+            'last_run_at': None,
+            'last_run_seconds': None,
+            'refreshed': 0,
+            'unchanged': 0,
+            'errors': 0,
+            'last_changes': {},
+            'series_prefetched': {},
+        }
+
+    async def _active_accounts(self) -> List[Dict[str, str]]:
+        cutoff = datetime.utcnow() - timedelta(days=CATALOG_WARMER_ACTIVE_DAYS)
+        cursor = db.sessions.find(
+            {'last_activity': {'$gte': cutoff}},
+            {'_id': 0, 'username': 1, 'password': 1}
+        )
+        return await cursor.to_list(length=None)
+
+    async def _refresh_catalog(self, kind: str, cache_key: str, username: str, password: str) -> Dict[str, int]:
+        """Fetch one full catalog and store it only if it changed"""
+        items, changes = await fetch_catalog(kind, cache_key, username, password)
+        if changes is None:
+            await cache.touch(cache_key, CATALOG_TTL)
+            self._stats['unchanged'] += 1
+            return {'added': 0, 'removed': 0, 'modified': 0}
+        await cache.set(cache_key, items, CATALOG_TTL)
+        self._stats['refreshed'] += 1
+        return {name: len(values) for name, values in changes.items()}
+
+    async def run_once(self) -> Dict[str, Any]:
+        """Warm every package seen among active sessions once"""
+        started = time.perf_counter()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        
+        async def discover(kind: str, username: str, password: str):
+            async with semaphore:
+                try:
+                    # Refreshed here rather than in background tasks the semaphore would not bound
+                    categories = await get_user_categories(kind, username, password, stale_while_revalidate=0)
+                except Exception as e:
+                    self._stats['errors'] += 1
+                    logger.error(f"Warmer categories error for {kind}: {str(e)}")
+                    return None
+            return catalog_cache_key(kind, username, categories), (kind, username, password)
+        
+        accounts = await self._active_accounts()
+        found = await asyncio.gather(*[
+            discover(kind, account['username'], account['password'])
+            for account in accounts for kind in CATALOG_SOURCES
+        ])
+        targets: Dict[str, tuple] = {}
+        for cache_key, target in filter(None, found):
+            targets.setdefault(cache_key, target)
+        
+        async def warm(cache_key: str, kind: str, username: str, password: str):
+            async with semaphore:
+                try:
+                    return cache_key, await self._refresh_catalog(kind, cache_key, username, password)
+                except Exception as e:
+                    self._stats['errors'] += 1
+                    logger.error(f"Warmer refresh error for {cache_key}: {str(e)}")
+                    return cache_key, {'error': str(e)}
+        
+        results = await asyncio.gather(*[warm(key, *target) for key, target in targets.items()])
+        series_account = next((target[1:] for target in targets.values() if target[0] == 'series'), None)
+        popular = series_library.popular()
+        if series_account is not None and popular:
+            self._stats['series_prefetched'] = await series_library.prefetch(*series_account, popular)
+        elapsed = time.perf_counter() - started
+        self._stats['runs'] += 1
+        self._stats['last_run_at'] = datetime.utcnow().isoformat()
+        self._stats['last_run_seconds'] = round(elapsed, 3)
+        self._stats['last_changes'] = dict(results)
+        return dict(results)
+
+    async def run_forever(self):
+        while True:
+            # Only one worker warms per cycle; the lease is held for the cycle so peers skip it
+            cycle = self.interval * (1 - self.jitter)
+            if cache.leases is None or await cache.leases.acquire('catalog_warmer', seconds=cycle):
+                try:
+                    await self.run_once()
+                except Exception as e:
+                    self._stats['errors'] += 1
+                    logger.error(f"Catalog warmer error: {str(e)}")
+            else:
+                self._stats['skipped_runs'] += 1
+            await asyncio.sleep(self.interval * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self.run_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._stats, 'running': self._task is not None}
+
+catalog_warmer = CatalogWarmer()
+
+# ==================== SESSIONS ====================
+
+# Sessions end at the subscription's exp_date, and never later than this
+SESSION_MAX_AGE = int(os.environ.get('SESSION_MAX_AGE', str(30 * 86400)))
+SESSION_MEMORY_MAX = int(os.environ.get('SESSION_MEMORY_MAX', '10000'))
+# Rejected credentials are not retried upstream for this long
+SESSION_REJECT_TTL = 60
+# Login records' last_activity is refreshed by requests at most this often
+SESSION_ACTIVITY_INTERVAL = float(os.environ.get('SESSION_ACTIVITY_INTERVAL', '3600'))
+
+def session_expiry(user_info: Dict[str, Any]) -> datetime:
+    """When a session from this login ends: exp_date, capped at SESSION_MAX_AGE"""
+    latest = datetime.utcnow() + timedelta(seconds=SESSION_MAX_AGE)
+    try:
+        exp_date = int(user_info.get('exp_date') or 0)
+    except (TypeError, ValueError):
+        exp_date = 0
+    if exp_date <= 0:
+        return latest
+    return min(datetime.utcfromtimestamp(exp_date), latest)
+
+class Session:
+    __slots__ = ('username', 'password', 'expires_at')
+
+    def __init__(self, username: str, password: str, expires_at: datetime):
+        self.username = username
+        self.password = password
+        self.expires_at = expires_at
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at <= datetime.utcnow()
+
+class SessionStore:
+    """Sessions issued at login, cached in memory in front of Mongo.
+
+    Requests are authorized by a bearer token, or by username/password
+    for older clients; either way a known session is checked locally and
+    only unknown credentials are authenticated upstream (once).
+    """
+
+    def __init__(self, collection, max_entries: int = SESSION_MEMORY_MAX):
+        self.collection = collection
+        self.max_entries = max_entries
+        self._sessions: OrderedDict = OrderedDict()
+        self._rejected: OrderedDict = OrderedDict()
+        self._active: OrderedDict = OrderedDict()
+        self._flight = SingleFlight()
+        self._stats = {
+            'issued': 0, 'memory_hits': 0, 'mongo_hits': 0, 'upstream_auths': 0, 'rejected': 0, 'activity_writes': 0,
+        }
+
+    async def ensure_indexes(self):
+        await create_index(self.collection, 'expires_at', expireAfterSeconds=0)
+        await create_index(self.collection, 'credentials')
+
+    @staticmethod
+    def _hash(value: str) -> str:
+        return hashlib.sha256(value.encode()).hexdigest()
+
+    @classmethod
+    def _credentials_key(cls, username: str, password: str) -> str:
+        return cls._hash(f"{username}\0{password}")
+
+    def _remember(self, key: str, session: Session):
+        self._sessions[key] = session
+        self._sessions.move_to_end(key)
+        while len(self._sessions) > self.max_entries:
+            self._sessions.popitem(last=False)
+
+    def _reject(self, key: str):
+        """Refuse these credentials locally for SESSION_REJECT_TTL; bounded like the session map"""
+        self._rejected[key] = time.monotonic() + SESSION_REJECT_TTL
+        self._rejected.move_to_end(key)
+        while len(self._rejected) > self.max_entries:
+            self._rejected.popitem(last=False)
+
+    def _is_rejected(self, key: str) -> bool:
+        until = self._rejected.get(key)
+        if until is None:
+            return False
+        if until <= time.monotonic():
+            del self._rejected[key]
+            return False
+        return True
+
+    async def issue(self, username: str, password: str, user_info: Dict[str, Any]) -> Tuple[str, Session]:
+        """Create a session for credentials upstream just accepted"""
+        token = secrets.token_urlsafe(32)
+        session = Session(username, password, session_expiry(user_info))
+        await self.collection.insert_one({
+            '_id': self._hash(token),
+            'credentials': self._credentials_key(username, password),
+            'username': username,
+            'password': password,
+            'expires_at': session.expires_at,
+            'created_at': datetime.utcnow(),
+        })
+        self._remember(self._hash(token), session)
+        self._remember(self._credentials_key(username, password), session)
+        self._rejected.pop(self._credentials_key(username, password), None)
+        self._stats['issued'] += 1
+        return token, session
+
+    async def _find(self, key: str, query: Dict[str, Any]) -> Optional[Session]:
+        session = self._sessions.get(key)
+        if session is not None and not session.expired:
+            self._sessions.move_to_end(key)
+            self._stats['memory_hits'] += 1
+            return session
+        doc = await self.collection.find_one({**query, 'expires_at': {'$gt': datetime.utcnow()}})
+        if doc is None:
+            self._sessions.pop(key, None)
+            return None
+        session = Session(doc['username'], doc['password'], doc['expires_at'])
+        self._remember(key, session)
+        self._stats['mongo_hits'] += 1
+        return session
+
+    async def resolve_token(self, token: str) -> Optional[Session]:
+        key = self._hash(token)
+        return await self._find(key, {'_id': key})
+
+    async def resolve_credentials(self, username: str, password: str) -> Optional[Session]:
+        """Session for raw credentials, authenticating upstream only if none is known"""
+        key = self._credentials_key(username, password)
+        session = await self._find(key, {'credentials': key})
+        if session is not None:
+            return session
+        if self._is_rejected(key):
+            return None
+        
+        async def authenticate():
+            self._stats['upstream_auths'] += 1
+            result = await xtream_api.authenticate(username, password)
+            if result.get('unavailable'):
+                raise HTTPException(status_code=503, detail="Upstream unavailable")
+            if not result['success']:
+                self._reject(key)
+                return None
+            _, new_session = await self.issue(username, password, result['user_info'])
+            return new_session
+        
+        return await self._flight.do(key, authenticate)
+
+    async def revoke(self, token: str):
+        key = self._hash(token)
+        self._sessions.pop(key, None)
+        await self.collection.delete_one({'_id': key})
+
+    async def authorize(self, authorization: Optional[str], username: Optional[str], password: Optional[str]) -> Session:
+        """Session of a request, from its bearer token or its credentials"""
+        token = bearer_token(authorization)
+        if token:
+            session = await self.resolve_token(token)
+        elif username and password:
+            session = await self.resolve_credentials(username, password)
+        else:
+            raise HTTPException(status_code=401, detail="Not authenticated")
+        if session is None:
+            self._stats['rejected'] += 1
+            raise HTTPException(status_code=401, detail="Invalid or expired session")
+        return session
+
+    async def record_activity(self, session: Session):
+        """Keep the user's login record fresh, so the warmer and its TTL see them as active.
+
+        Clients keep their credentials and rarely log in again, so requests
+        refresh last_activity too, once per SESSION_ACTIVITY_INTERVAL.
+        """
+        now = time.monotonic()
+        last = self._active.get(session.username)
+        if last is not None and now - last < SESSION_ACTIVITY_INTERVAL:
+            return
+        self._active[session.username] = now
+        self._active.move_to_end(session.username)
+        while len(self._active) > self.max_entries:
+            self._active.popitem(last=False)
+        try:
+            await db.sessions.update_one(
+                {'username': session.username},
+                {'$set': {'password': session.password, 'last_activity': datetime.utcnow()}},
+                upsert=True
+            )
+            self._stats['activity_writes'] += 1
+        except Exception as e:
+            self._active.pop(session.username, None)
+            logger.error(f"Session activity error: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._stats, 'cached': len(self._sessions), 'rejected_cached': len(self._rejected)}
 
-class LoginRequest(BaseModel):
-    username: str
-    password: str
+def bearer_token(authorization: Optional[str]) -> Optional[str]:
+    scheme, _, token = (authorization or '').partition(' ')
+    return token.strip() if scheme.lower() == 'bearer' and token.strip() else None
 
-class LoginResponse(BaseModel):
-    success: bool
-    user_info: Optional[Dict[str, Any]] = None
-    server_info: Optional[Dict[str, Any]] = None
-    error: Optional[str] = None
+sessions = SessionStore(db.session_tokens)
 
-class Category(BaseModel):
-    category_id: str
-    category_name: str
-    parent_id: Optional[int] = 0
+async def require_session(
+    authorization: Optional[str] = Header(None),
+    username: Optional[str] = None,
+    password: Optional[str] = None,
+    access_token: Optional[str] = None,
+) -> Session:
+    """Route dependency: the caller's session, or 401.
 
-class LiveStream(BaseModel):
-    stream_id: int
-    num: int
-    name: str
-    stream_type: str
-    stream_icon: Optional[str] = None
-    epg_channel_id: Optional[str] = None
-    added: Optional[str] = None
-    is_adult: Optional[str] = "0"
-    category_id: Optional[str] = None
-    custom_sid: Optional[str] = None
-    tv_archive: Optional[int] = 0
-    direct_source: Optional[str] = None
-    tv_archive_duration: Optional[int] = 0
+    access_token is for clients that cannot set headers, such as video players.
+    """
+    if access_token and not authorization:
+        authorization = f"Bearer {access_token}"
+    session = await sessions.authorize(authorization, username, password)
+    await sessions.record_activity(session)
+    return session
 
-class StreamUrlRequest(BaseModel):
-    username: str
-    password: str
-    stream_id: int
-    extension: str = "m3u8"
+# ==================== MONGO BOOTSTRAP ====================
 
-# ==================== XTREAM CODES API HELPER ====================
+# Login records nobody has used for this long are dropped
+SESSION_RECORD_RETENTION = int(os.environ.get('SESSION_RECORD_RETENTION', str(90 * 86400)))
 
-class XtreamCodesAPI:
-    def __init__(self, base_url: str = "https://s.luxuztv.com:443"):
-        self.base_url = base_url.rstrip('/')
-    
-    async def authenticate(self, username: str, password: str) -> Dict[str, Any]:
-        """Authenticate user and get account info"""
-        try:
-            params = {
-                'username': username,
-                'password': password
-            }
-            url = f"{self.base_url}/player_api.php?{urlencode(params)}"
-            
-            async with httpx.AsyncClient(verify=False, timeout=30.0) as client:
-                response = await client.get(url)
-                response.raise_for_status()
-                data = response.json()
-                
-                if data.get('user_info', {}).get('auth') == 1 or data.get('user_info', {}).get('status') == 'Active':
-                    return {
-                        'success': True,
-                        'user_info': data.get('user_info', {}),
-                        'server_info': data.get('server_info', {})
-                    }
-                else:
-                    return {
-                        'success': False,
-                        'error': 'Invalid credentials'
-                    }
-        except Exception as e:
-            logger.error(f"Authentication error: {str(e)}")
-            return {
-                'success': False,
-                'error': str(e)
-            }
-    
-    async def get_live_categories(self, username: str, password: str) -> List[Dict[str, Any]]:
-        """Get all live TV categories"""
-        try:
-            params = {
-                'username': username,
-                'password': password,
-                'action': 'get_live_categories'
-            }
-            url = f"{self.base_url}/player_api.php?{urlencode(params)}"
-            
-            async with httpx.AsyncClient(verify=False, timeout=30.0) as client:
-                response = await client.get(url)
-                response.raise_for_status()
-                return response.json()
-        except Exception as e:
-            logger.error(f"Get categories error: {str(e)}")
-            return []
-    
-    async def get_live_streams(self, username: str, password: str, category_id: Optional[str] = None) -> List[Dict[str, Any]]:
-        """Get live streams, optionally filtered by category"""
-        try:
-            params = {
-                'username': username,
-                'password': password,
-                'action': 'get_live_streams'
-            }
-            if category_id:
-                params['category_id'] = category_id
-            
-            url = f"{self.base_url}/player_api.php?{urlencode(params)}"
-            
-            async with httpx.AsyncClient(verify=False, timeout=30.0) as client:
-                response = await client.get(url)
-                response.raise_for_status()
-                return response.json()
-        except Exception as e:
-            logger.error(f"Get live streams error: {str(e)}")
-            return []
-    
-    def get_stream_url(self, username: str, password: str, stream_id: int, extension: str = "m3u8") -> str:
-        """Generate stream URL for playback"""
-        return f"{self.base_url}/live/{username}/{password}/{stream_id}.{extension}"
-    
-    async def get_epg(self, username: str, password: str, stream_id: int, limit: int = 10) -> List[Dict[str, Any]]:
-        """Get EPG data for a specific stream"""
-        try:
-            params = {
-                'username': username,
-                'password': password,
-                'action': 'get_short_epg',
-                'stream_id': stream_id,
-                'limit': limit
-            }
-            url = f"{self.base_url}/player_api.php?{urlencode(params)}"
-            
-            async with httpx.AsyncClient(verify=False, timeout=30.0) as client:
-                response = await client.get(url)
-                response.raise_for_status()
-                data = response.json()
-                return data.get('epg_listings', [])
-        except Exception as e:
-            logger.error(f"Get EPG error: {str(e)}")
-            return []
-    
-    async def get_vod_categories(self, username: str, password: str) -> List[Dict[str, Any]]:
-        """Get all VOD categories"""
-        try:
-            params = {
-                'username': username,
-                'password': password,
-                'action': 'get_vod_categories'
-            }
-            url = f"{self.base_url}/player_api.php?{urlencode(params)}"
-            
-            async with httpx.AsyncClient(verify=False, timeout=30.0) as client:
-                response = await client.get(url)
-                response.raise_for_status()
-                return response.json()
-        except Exception as e:
-            logger.error(f"Get VOD categories error: {str(e)}")
-            return []
-    
-    async def get_vod_streams(self, username: str, password: str, category_id: Optional[str] = None) -> List[Dict[str, Any]]:
-        """Get VOD streams, optionally filtered by category"""
-        try:
-            params = {
-                'username': username,
-                'password': password,
-                'action': 'get_vod_streams'
-            }
-            if category_id:
-                params['category_id'] = category_id
-            
-            url = f"{self.base_url}/player_api.php?{urlencode(params)}"
-            
-            async with httpx.AsyncClient(verify=False, timeout=30.0) as client:
-                response = await client.get(url)
-                response.raise_for_status()
-                return response.json()
-        except Exception as e:
-            logger.error(f"Get VOD streams error: {str(e)}")
-            return []
-    
-    async def get_series_categories(self, username: str, password: str) -> List[Dict[str, Any]]:
-        """Get all series categories"""
+async def ensure_session_record_indexes():
+    """db.sessions: one login record per username, aged out by last activity"""
+    await create_index(db.sessions, 'username', unique=True)
+    await create_index(db.sessions, 'last_activity', expireAfterSeconds=SESSION_RECORD_RETENTION)
+
+def index_steps() -> Dict[str, Callable[[], Awaitable]]:
+    return {
+        'cache': cache.ensure_indexes,
+        'sessions': ensure_session_record_indexes,
+        'session_tokens': sessions.ensure_indexes,
+        'catalog_versions': catalog_versions.ensure_indexes,
+        'epg_programmes': epg_guide.ensure_indexes,
+        'episodes': series_library.ensure_indexes,
+    }
+
+async def bootstrap_mongo() -> Dict[str, Dict[str, Any]]:
+    """Create or update every index the app relies on; one failing collection does not stop the rest"""
+    report = {}
+    for name, step in index_steps().items():
+        started = time.perf_counter()
         try:
-            params = {
-                'username': username,
-                'password': password,
-                'action': 'get_series_categories'
-            }
-            url = f"{self.base_url}/player_api.php?{urlencode(params)}"
-            
-            async with httpx.AsyncClient(verify=False, timeout=30.0) as client:
-                response = await client.get(url)
-                response.raise_for_status()
-                return response.json()
+            await step()
+            report[name] = {'ok': True}
         except Exception as e:
-            logger.error(f"Get series categories error: {str(e)}")
-            return []
-    
-    async def get_series(self, username: str, password: str, category_id: Optional[str] = None) -> List[Dict[str, Any]]:
-        """Get series, optionally filtered by category"""
+            logger.error(f"Index bootstrap error for {name}: {str(e)}")
+            report[name] = {'ok': False, 'error': str(e)}
+        report[name]['ms'] = round((time.perf_counter() - started) * 1000, 2)
+    return report
+
+def hot_queries() -> List[Dict[str, Any]]:
+    """The queries made on every request or cycle, with representative arguments"""
+    now = datetime.utcnow()
+    # Leases are taken on cache keys, so one real-format catalog key serves both probes
+    catalog_key = catalog_cache_key('live', 'probe', [{'category_id': 'probe'}])
+    return [
+        {'name': 'cache by key', 'collection': cache.collection, 'filter': {'key': catalog_key}},
+        {'name': 'cache lease', 'collection': cache.leases.collection if cache.leases else db.cache_leases,
+         'filter': MongoLease.takeover_filter(catalog_key, now)},
+        {'name': 'login record by username', 'collection': db.sessions, 'filter': {'username': 'probe'}},
+        {'name': 'active login records', 'collection': db.sessions,
+         'filter': {'last_activity': {'$gte': now - timedelta(days=CATALOG_WARMER_ACTIVE_DAYS)}}},
+        {'name': 'session by credentials', 'collection': sessions.collection,
+         'filter': {'credentials': 'probe', 'expires_at': {'$gt': now}}},
+        {'name': 'latest catalog version', 'collection': catalog_versions.collection,
+         'filter': {'key': catalog_key}, 'sort': [('seq', -1)]},
+        {'name': 'programmes in window', 'collection': epg_guide.programmes,
+         'filter': {'ingest_id': 'probe', 'start': {'$lte': now}, 'stop': {'$gte': now}}},
+        {'name': 'episodes of series', 'collection': series_library.episodes,
+         'filter': {'series_id': 0}, 'sort': [('season', 1), ('episode_num', 1)]},
+    ]
+
+def plan_stages(plan: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Flatten an explain() winning plan into its stages"""
+    stages = [plan]
+    for child in [plan.get('inputStage')] + plan.get('inputStages', []):
+        if child:
+            stages.extend(plan_stages(child))
+    return stages
+
+def matching_index(indexes: Dict[str, Any], query: Dict[str, Any]) -> Optional[str]:
+    """Index whose leading key a query constrains (for servers without explain)"""
+    fields = set(query['filter']) | {field for field, _ in query.get('sort', [])}
+    for name, info in indexes.items():
+        if info['key'][0][0] in fields:
+            return name
+    return None
+
+async def explain_hot_queries(runs: int = 20) -> List[Dict[str, Any]]:
+    """Plan (index or collection scan) and latency of every hot query"""
+    report = []
+    for query in hot_queries():
+        collection = query['collection']
+        
+        def cursor():
+            found = collection.find(query['filter'])
+            return found.sort(query['sort']) if query.get('sort') else found
+        
         try:
-            params = {
-                'username': username,
-                'password': password,
-                'action': 'get_series'
-            }
-            if category_id:
-                params['category_id'] = category_id
-            
-            url = f"{self.base_url}/player_api.php?{urlencode(params)}"
-            
-            async with httpx.AsyncClient(verify=False, timeout=30.0) as client:
-                response = await client.get(url)
-                response.raise_for_status()
-                return response.json()
-        except Exception as e:
-            logger.error(f"Get series error: {str(e)}")
-            return []
+            explained = await cursor().explain()
+            planner = explained.get('queryPlanner', {})
+            winning = planner.get('winningPlan', {})
+            stages = plan_stages(winning.get('queryPlan', winning))
+            names = [s['stage'] for s in stages]
+            index = next((s.get('indexName') for s in stages if s.get('indexName')), None)
+            plan = {'source': 'explain', 'stage': 'IXSCAN' if 'IXSCAN' in names or 'IDHACK' in names or 'EXPRESS_IXSCAN' in names else names[-1], 'index': index}
+        except (AttributeError, NotImplementedError):
+            index = matching_index(await collection.index_information(), query)
+            plan = {'source': 'index_information', 'stage': 'IXSCAN' if index else 'COLLSCAN', 'index': index}
+        
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            await cursor().to_list(length=100)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        report.append({
+            'query': query['name'],
+            'collection': collection.name,
+            **plan,
+            'p50_ms': round(timings[len(timings) // 2], 3),
+            'max_ms': round(timings[-1], 3),
+        })
+    return report
+
+mongo_bootstrap_report: Dict[str, Dict[str, Any]] = {}
+
+# ==================== HOME SCREEN ====================
+
+# One deadline for every home-screen section; slower sections come back empty
+HOME_DEADLINE = float(os.environ.get('HOME_DEADLINE', '4'))
+HOME_LIVE_FIELDS = ('stream_id', 'name', 'stream_icon', 'tv_archive', 'category_id')
+HOME_MOVIE_FIELDS = ('stream_id', 'name', 'stream_icon', 'rating', 'release_year', 'container_extension', 'category_id')
+HOME_CATEGORY_FIELDS = ('category_id', 'category_name')
+
+def trim(items, limit: int, fields: Tuple[str, ...]) -> List[Dict[str, Any]]:
+    """First items of a list, reduced to the fields a screen renders"""
+    return [{k: item[k] for k in fields if k in item} for item in items[:limit]]
+
+def home_sections(username: str, password: str) -> Dict[str, Awaitable]:
+    """Coroutines producing each home-screen section"""
     
-    async def get_series_info(self, username: str, password: str, series_id: int) -> Dict[str, Any]:
-        """Get series info with seasons and episodes"""
-        try:
-            params = {
-                'username': username,
-                'password': password,
-                'action': 'get_series_info',
-                'series_id': series_id
-            }
-            url = f"{self.base_url}/player_api.php?{urlencode(params)}"
-            
-            async with httpx.AsyncClient(verify=False, timeout=30.0) as client:
-                response = await client.get(url)
-                response.raise_for_status()
-                return response.json()
-        except Exception as e:
-            logger.error(f"Get series info error: {str(e)}")
-            return {}
+    async def streams(kind: str, limit: int, fields: Tuple[str, ...]):
+        _, items = await get_shared_catalog(kind, username, password)
+        return trim(items, limit, fields)
     
-    def get_vod_url(self, username: str, password: str, vod_id: int, extension: str = "mp4") -> str:
-        """Generate VOD URL for playback"""
-        return f"{self.base_url}/movie/{username}/{password}/{vod_id}.{extension}"
+    async def categories(kind: str):
+        return trim(await get_user_categories(kind, username, password), 5, HOME_CATEGORY_FIELDS)
     
-    def get_series_url(self, username: str, password: str, episode_id: int, extension: str = "mp4") -> str:
-        """Generate series episode URL for playback"""
-        return f"{self.base_url}/series/{username}/{password}/{episode_id}.{extension}"
-
-# Initialize API client
-xtream_api = XtreamCodesAPI()
+    return {
+        'featured_streams': streams('live', 6, HOME_LIVE_FIELDS),
+        'live_categories': categories('live'),
+        'vod_categories': categories('vod'),
+        'latest_movies': streams('vod', 4, HOME_MOVIE_FIELDS),
+    }
 
 # ==================== ROUTES ====================
 
@@ -287,6 +3627,21 @@ xtream_api = XtreamCodesAPI()
 async def root():
     return {"message": "Luxuz TV API v1.0", "status": "running"}
 
+@api_router.get("/stats")
+async def get_stats():
+    """Runtime statistics for the upstream pool and cache"""
+    return {
+        "upstream_pool": xtream_api.pool_stats(),
+        "cache": cache.stats(),
+        "catalog_warmer": catalog_warmer.stats(),
+        "epg_guide": epg_guide.stats(),
+        "sessions": sessions.stats(),
+        "mongo_indexes": mongo_bootstrap_report,
+        "series_library": series_library.stats(),
+        "edge_resolver": edge_resolver.stats(),
+        "hls_proxy": hls_proxy.stats(),
+    }
+
 @api_router.post("/auth/login", response_model=LoginResponse)
 async def login(request: LoginRequest):
     """Authenticate user with Xtream Codes API"""
@@ -308,9 +3663,12 @@ async def login(request: LoginRequest):
                 {'$set': session_data},
                 upsert=True
             )
+            token, session = await sessions.issue(request.username, request.password, result['user_info'])
             
             return LoginResponse(
                 success=True,
+                token=token,
+                expires_at=int((session.expires_at - datetime(1970, 1, 1)).total_seconds()),
                 user_info=result['user_info'],
                 server_info=result['server_info']
             )
@@ -323,79 +3681,135 @@ async def login(request: LoginRequest):
         logger.error(f"Login error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.post("/auth/logout")
+async def logout(authorization: Optional[str] = Header(None)):
+    """End the session of a bearer token"""
+    token = bearer_token(authorization)
+    if not token:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    await sessions.revoke(token)
+    return {"success": True}
+
 @api_router.get("/live/categories")
-async def get_live_categories(username: str, password: str):
+async def get_live_categories(session: Session = Depends(require_session)):
     """Get all live TV categories"""
     try:
-        # Check cache first
-        cache_key = f"categories_{username}"
-        cached = await db.cache.find_one({'key': cache_key})
-        
-        if cached and (datetime.utcnow() - cached['timestamp']).seconds < 3600:
-            return cached['data']
-        
-        # Fetch from API
-        categories = await xtream_api.get_live_categories(username, password)
-        
-        # Cache the result
-        await db.cache.update_one(
-            {'key': cache_key},
-            {'$set': {'key': cache_key, 'data': categories, 'timestamp': datetime.utcnow()}},
-            upsert=True
-        )
-        
-        return categories
+        return await get_user_categories('live', session.username, session.password)
     except Exception as e:
         logger.error(f"Get categories error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.get("/live/streams")
-async def get_live_streams(username: str, password: str, category_id: Optional[str] = None):
-    """Get live streams, optionally filtered by category"""
+async def get_live_streams(
+    request: Request,
+    session: Session = Depends(require_session),
+    category_id: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    offset: int = Query(0, ge=0),
+    fields: Optional[str] = None,
+):
+    """Get live streams, optionally filtered by category and paginated"""
     try:
-        # Check cache first
-        cache_key = f"streams_{username}_{category_id or 'all'}"
-        cached = await db.cache.find_one({'key': cache_key})
-        
-        if cached and (datetime.utcnow() - cached['timestamp']).seconds < 1800:
-            return cached['data']
-        
-        # Fetch from API
-        streams = await xtream_api.get_live_streams(username, password, category_id)
-        
-        # Cache the result
-        await db.cache.update_one(
-            {'key': cache_key},
-            {'$set': {'key': cache_key, 'data': streams, 'timestamp': datetime.utcnow()}},
-            upsert=True
-        )
-        
-        return streams
+        view, items = await get_shared_catalog('live', session.username, session.password, category_id)
+        return catalog_response(request, view, items, limit, offset, fields)
     except Exception as e:
         logger.error(f"Get streams error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.post("/live/stream-url")
-async def get_stream_url(request: StreamUrlRequest):
+async def get_stream_url(request: StreamUrlRequest, authorization: Optional[str] = Header(None)):
     """Generate stream URL for playback"""
+    session = await require_session(authorization, request.username, request.password)
     try:
         stream_url = xtream_api.get_stream_url(
-            request.username,
-            request.password,
+            session.username,
+            session.password,
             request.stream_id,
             request.extension
         )
-        return {"stream_url": stream_url}
+        response = await playback_response(stream_url, request.resolve)
+        if response.get('resolved'):
+            edge_resolver.background(
+                prefetch_neighbours(session.username, session.password, request.stream_id, request.extension)
+            )
+        return response
     except Exception as e:
         logger.error(f"Get stream URL error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.get("/live/hls/{stream_id}")
+async def get_live_hls(stream_id: int, request: Request, session: Session = Depends(require_session)):
+    """Entry playlist of a live channel through the caching HLS proxy"""
+    await require_hls_channel(stream_id, session)
+    try:
+        panel_url = xtream_api.get_stream_url(session.username, session.password, stream_id, 'm3u8')
+        playlist = await hls_proxy.playlist(stream_id, 'entry', panel_url, session.username)
+        return hls_response(playlist, f"{stream_id}/", request)
+    except Exception as e:
+        logger.error(f"HLS playlist error: {str(e)}")
+        raise HTTPException(status_code=502, detail=str(e))
+
+@api_router.get("/live/hls/{stream_id}/p/{name}.m3u8")
+async def get_live_hls_variant(stream_id: int, name: str, request: Request, session: Session = Depends(require_session)):
+    """Variant playlist of a live channel, by the name its entry playlist gave it"""
+    await require_hls_channel(stream_id, session)
+    try:
+        playlist = await hls_proxy.playlist(stream_id, name, None, session.username)
+    except Exception as e:
+        logger.error(f"HLS playlist error: {str(e)}")
+        raise HTTPException(status_code=502, detail=str(e))
+    if playlist is None:
+        raise HTTPException(status_code=404, detail="Unknown playlist")
+    return hls_response(playlist, "../", request)
+
+@api_router.get("/live/hls/{stream_id}/s/{segment}")
+async def get_live_hls_segment(stream_id: int, segment: str, session: Session = Depends(require_session)):
+    """A live segment relayed through the shared segment cache"""
+    await require_hls_channel(stream_id, session)
+    name, extension = os.path.splitext(segment)
+    try:
+        data = await hls_proxy.segment(stream_id, name, session.username)
+    except Exception as e:
+        logger.error(f"HLS segment error: {str(e)}")
+        raise HTTPException(status_code=502, detail=str(e))
+    if data is None:
+        raise HTTPException(status_code=404, detail="Unknown segment")
+    return Response(
+        content=data,
+        media_type=HLS_SEGMENT_TYPES.get(extension, 'application/octet-stream'),
+        headers={'Cache-Control': 'max-age=3600'},
+    )
+
+@api_router.post("/live/epg/batch")
+async def get_epg_batch(request: EpgBatchRequest, authorization: Optional[str] = Header(None)):
+    """Get EPG data for many streams in one request"""
+    session = await require_session(authorization, request.username, request.password)
+    try:
+        semaphore = asyncio.Semaphore(EPG_BATCH_CONCURRENCY)
+        
+        async def fetch(stream_id: int):
+            async with semaphore:
+                return await get_channel_epg(session.username, session.password, stream_id, request.limit)
+        
+        stream_ids = list(dict.fromkeys(request.stream_ids))
+        results = await asyncio.gather(*[fetch(sid) for sid in stream_ids], return_exceptions=True)
+        
+        epg, errors = {}, {}
+        for stream_id, result in zip(stream_ids, results):
+            if isinstance(result, Exception):
+                errors[str(stream_id)] = str(result)
+            else:
+                epg[str(stream_id)] = result
+        return {"epg": epg, "errors": errors}
+    except Exception as e:
+        logger.error(f"Get EPG batch error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @api_router.get("/live/epg/{stream_id}")
-async def get_epg(stream_id: int, username: str, password: str, limit: int = 10):
+async def get_epg(stream_id: int, session: Session = Depends(require_session), limit: int = 10):
     """Get EPG data for a specific stream"""
     try:
-        epg_data = await xtream_api.get_epg(username, password, stream_id, limit)
-        return epg_data
+        return await get_channel_epg(session.username, session.password, stream_id, limit)
     except Exception as e:
         logger.error(f"Get EPG error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -403,62 +3817,43 @@ async def get_epg(stream_id: int, username: str, password: str, limit: int = 10)
 # ==================== VOD ROUTES ====================
 
 @api_router.get("/vod/categories")
-async def get_vod_categories(username: str, password: str):
+async def get_vod_categories(session: Session = Depends(require_session)):
     """Get all VOD categories"""
     try:
-        cache_key = f"vod_categories_{username}"
-        cached = await db.cache.find_one({'key': cache_key})
-        
-        if cached and (datetime.utcnow() - cached['timestamp']).seconds < 3600:
-            return cached['data']
-        
-        categories = await xtream_api.get_vod_categories(username, password)
-        
-        await db.cache.update_one(
-            {'key': cache_key},
-            {'$set': {'key': cache_key, 'data': categories, 'timestamp': datetime.utcnow()}},
-            upsert=True
-        )
-        
-        return categories
+        return await get_user_categories('vod', session.username, session.password)
     except Exception as e:
         logger.error(f"Get VOD categories error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.get("/vod/streams")
-async def get_vod_streams(username: str, password: str, category_id: Optional[str] = None):
-    """Get VOD streams, optionally filtered by category"""
+async def get_vod_streams(
+    request: Request,
+    session: Session = Depends(require_session),
+    category_id: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    offset: int = Query(0, ge=0),
+    fields: Optional[str] = None,
+):
+    """Get VOD streams, optionally filtered by category and paginated"""
     try:
-        cache_key = f"vod_streams_{username}_{category_id or 'all'}"
-        cached = await db.cache.find_one({'key': cache_key})
-        
-        if cached and (datetime.utcnow() - cached['timestamp']).seconds < 1800:
-            return cached['data']
-        
-        streams = await xtream_api.get_vod_streams(username, password, category_id)
-        
-        await db.cache.update_one(
-            {'key': cache_key},
-            {'$set': {'key': cache_key, 'data': streams, 'timestamp': datetime.utcnow()}},
-            upsert=True
-        )
-        
-        return streams
+        view, items = await get_shared_catalog('vod', session.username, session.password, category_id)
+        return catalog_response(request, view, items, limit, offset, fields)
     except Exception as e:
         logger.error(f"Get VOD streams error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.post("/vod/stream-url")
-async def get_vod_url(request: StreamUrlRequest):
+async def get_vod_url(request: StreamUrlRequest, authorization: Optional[str] = Header(None)):
     """Generate VOD URL for playback"""
+    session = await require_session(authorization, request.username, request.password)
     try:
         vod_url = xtream_api.get_vod_url(
-            request.username,
-            request.password,
+            session.username,
+            session.password,
             request.stream_id,
             request.extension if request.extension != "m3u8" else "mp4"
         )
-        return {"stream_url": vod_url}
+        return await playback_response(vod_url, request.resolve)
     except Exception as e:
         logger.error(f"Get VOD URL error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -466,89 +3861,200 @@ async def get_vod_url(request: StreamUrlRequest):
 # ==================== SERIES ROUTES ====================
 
 @api_router.get("/series/categories")
-async def get_series_categories(username: str, password: str):
+async def get_series_categories(session: Session = Depends(require_session)):
     """Get all series categories"""
     try:
-        cache_key = f"series_categories_{username}"
-        cached = await db.cache.find_one({'key': cache_key})
-        
-        if cached and (datetime.utcnow() - cached['timestamp']).seconds < 3600:
-            return cached['data']
-        
-        categories = await xtream_api.get_series_categories(username, password)
-        
-        await db.cache.update_one(
-            {'key': cache_key},
-            {'$set': {'key': cache_key, 'data': categories, 'timestamp': datetime.utcnow()}},
-            upsert=True
-        )
-        
-        return categories
+        return await get_user_categories('series', session.username, session.password)
     except Exception as e:
         logger.error(f"Get series categories error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.get("/series/list")
-async def get_series_list(username: str, password: str, category_id: Optional[str] = None):
-    """Get series list, optionally filtered by category"""
+async def get_series_list(
+    request: Request,
+    session: Session = Depends(require_session),
+    category_id: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    offset: int = Query(0, ge=0),
+    fields: Optional[str] = None,
+):
+    """Get series list, optionally filtered by category and paginated"""
     try:
-        cache_key = f"series_list_{username}_{category_id or 'all'}"
-        cached = await db.cache.find_one({'key': cache_key})
-        
-        if cached and (datetime.utcnow() - cached['timestamp']).seconds < 1800:
-            return cached['data']
-        
-        series = await xtream_api.get_series(username, password, category_id)
-        
-        await db.cache.update_one(
-            {'key': cache_key},
-            {'$set': {'key': cache_key, 'data': series, 'timestamp': datetime.utcnow()}},
-            upsert=True
-        )
-        
-        return series
+        view, items = await get_shared_catalog('series', session.username, session.password, category_id)
+        if limit is not None:
+            # The titles on screen are the ones likely to be opened next
+            visible = items[offset:offset + min(limit, SERIES_PREFETCH_VISIBLE)]
+            series_library.enqueue(session.username, session.password, [item.get('series_id') for item in visible])
+        return catalog_response(request, view, items, limit, offset, fields)
     except Exception as e:
         logger.error(f"Get series error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.get("/series/info/{series_id}")
-async def get_series_info_endpoint(series_id: int, username: str, password: str):
+async def get_series_info_endpoint(series_id: int, session: Session = Depends(require_session)):
     """Get series info with seasons and episodes"""
     try:
-        cache_key = f"series_info_{username}_{series_id}"
-        cached = await db.cache.find_one({'key': cache_key})
-        
-        if cached and (datetime.utcnow() - cached['timestamp']).seconds < 3600:
-            return cached['data']
-        
-        series_info = await xtream_api.get_series_info(username, password, series_id)
-        
-        await db.cache.update_one(
-            {'key': cache_key},
-            {'$set': {'key': cache_key, 'data': series_info, 'timestamp': datetime.utcnow()}},
-            upsert=True
-        )
-        
-        return series_info
+        # Series info is the same for everyone on the panel, so it is shared once entitlement is checked
+        _, view, allowed = await get_catalog_view('series', session.username, session.password)
+        item = view.get(series_id)
+        if item is None or (allowed is not None and allowed.isdisjoint(item_category_ids(item))):
+            raise HTTPException(status_code=404, detail="Series not found")
+        series_library.opened(series_id)
+        return await series_library.info(session.username, session.password, series_id)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Get series info error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.post("/series/episode-url")
-async def get_series_episode_url(request: StreamUrlRequest):
+async def get_series_episode_url(request: StreamUrlRequest, authorization: Optional[str] = Header(None)):
     """Generate series episode URL for playback"""
+    session = await require_session(authorization, request.username, request.password)
     try:
+        extension = request.extension
+        if extension == "m3u8":
+            # Episodes are files; use the container the panel reported for this one when we have it
+            episode = await series_library.episode(request.stream_id)
+            extension = (episode or {}).get('container_extension') or "mp4"
         episode_url = xtream_api.get_series_url(
-            request.username,
-            request.password,
+            session.username,
+            session.password,
             request.stream_id,  # episode_id
-            request.extension if request.extension != "m3u8" else "mp4"
+            extension
         )
-        return {"stream_url": episode_url}
+        return await playback_response(episode_url, request.resolve)
     except Exception as e:
         logger.error(f"Get episode URL error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.get("/home")
+async def get_home(session: Session = Depends(require_session)):
+    """Everything the home screen shows, fetched concurrently under one deadline"""
+    started = time.perf_counter()
+    sections = home_sections(session.username, session.password)
+    # Fills keep running after a timeout (they are shielded), so the next open is warm
+    results = await asyncio.gather(
+        *[asyncio.wait_for(coro, HOME_DEADLINE) for coro in sections.values()],
+        return_exceptions=True
+    )
+    payload: Dict[str, Any] = {}
+    errors: Dict[str, str] = {}
+    for name, result in zip(sections, results):
+        if isinstance(result, BaseException):
+            errors[name] = 'timeout' if isinstance(result, asyncio.TimeoutError) else str(result)
+            logger.error(f"Home section {name} error: {errors[name]}")
+            payload[name] = []
+        else:
+            payload[name] = result
+    return {
+        **payload,
+        "partial": bool(errors),
+        "errors": errors,
+        "took_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+
+@api_router.get("/search")
+async def search_catalog(
+    session: Session = Depends(require_session),
+    q: str = Query(..., min_length=1),
+    types: str = "live,vod,series",
+    limit: int = Query(20, ge=1, le=200),
+    fuzzy: bool = True,
+):
+    """Search live channels, movies and series by name"""
+    try:
+        started = time.perf_counter()
+        kinds = [k.strip() for k in types.split(',') if k.strip() in CATALOG_SOURCES]
+        views = await asyncio.gather(*[get_catalog_view(kind, session.username, session.password) for kind in kinds])
+        
+        matches = []
+        for kind, (_, view, allowed) in zip(kinds, views):
+            found = 0
+            for score, doc_id in view.search.search(q, fuzzy=fuzzy):
+                row = view.by_id.get(doc_id)
+                if row is None or (allowed is not None and not allowed.intersection(view.category_ids(row))):
+                    continue
+                item = view.table.row(row)
+                matches.append({'kind': kind, 'score': round(score, 3), 'item': item})
+                found += 1
+                if found >= limit:
+                    break
+        
+        matches.sort(key=lambda m: -m['score'])
+        return {
+            'query': q,
+            'results': matches[:limit],
+            'took_ms': round((time.perf_counter() - started) * 1000, 2),
+        }
+    except Exception as e:
+        logger.error(f"Search error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/{kind}/changes")
+async def get_catalog_changes(kind: str, since: str, session: Session = Depends(require_session)):
+    """Items added, removed and modified since the catalog version a client holds (X-Catalog-Version)"""
+    if kind not in CATALOG_SOURCES:
+        raise HTTPException(status_code=404, detail="Unknown catalog")
+    try:
+        cache_key, view, allowed = await get_catalog_view(kind, session.username, session.password)
+        changes = await catalog_versions.changes(cache_key, view, since)
+        if changes is None:
+            # History no longer reaches back to since: reload the whole list
+            return {"kind": kind, "since": since, "version": view.version, "reset": True,
+                    "added": [], "removed": [], "modified": []}
+        if allowed is not None:
+            for name in ('added', 'modified'):
+                changes[name] = [item for item in changes[name] if allowed.intersection(item_category_ids(item))]
+        return {"kind": kind, "since": since, "version": view.version, "reset": False, **changes}
+    except Exception as e:
+        logger.error(f"Get catalog changes error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# ==================== XMLTV GUIDE ROUTES ====================
+
+def split_channels(channels: Optional[str]) -> Optional[List[str]]:
+    return [c for c in channels.split(',') if c] if channels else None
+
+@api_router.post("/epg/ingest", status_code=202)
+async def ingest_epg(request: Optional[CredentialsRequest] = None, authorization: Optional[str] = Header(None)):
+    """Start ingesting the provider's full XMLTV guide"""
+    request = request or CredentialsRequest()
+    session = await require_session(authorization, request.username, request.password)
+    started = epg_guide.start_ingest(session.username, session.password)
+    return {"started": started, **epg_guide.stats()}
+
+@api_router.get("/epg/now-next")
+async def get_epg_now_next(channels: Optional[str] = None, session: Session = Depends(require_session)):
+    """Current and next programme for the given (or all) XMLTV channel ids"""
+    try:
+        await epg_guide.ensure_loaded()
+        return epg_guide.now_next(split_channels(channels))
+    except Exception as e:
+        logger.error(f"Get now/next error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/epg/grid")
+async def get_epg_grid(
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    channels: Optional[str] = None,
+    session: Session = Depends(require_session),
+):
+    """Programmes in a time window (unix seconds, at most 24h) for the given (or all) channels"""
+    try:
+        start = time.time() if start is None else start
+        end = start + 3 * 3600 if end is None else end
+        if end <= start or end - start > 24 * 3600:
+            raise HTTPException(status_code=400, detail="Window must be positive and at most 24 hours")
+        await epg_guide.ensure_loaded()
+        return epg_guide.grid(start, end, split_channels(channels))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Get EPG grid error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 # Include the router in the main app
 app.include_router(api_router)
 
@@ -558,8 +4064,76 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count", "X-Next-Offset", "X-Catalog-Version", "ETag"],
 )
 
+@app.on_event("startup")
+async def startup_http_client():
+    await xtream_api.start()
+
+@app.on_event("startup")
+async def startup_mongo_bootstrap():
+    mongo_bootstrap_report.update(await bootstrap_mongo())
+
+@app.on_event("startup")
+async def startup_catalog_warmer():
+    if CATALOG_WARMER_ENABLED:
+        catalog_warmer.start()
+
+@app.on_event("shutdown")
+async def shutdown_catalog_warmer():
+    await catalog_warmer.stop()
+
+@app.on_event("shutdown")
+async def shutdown_segment_cache():
+    hls_proxy.segments.close()
+
+@app.on_event("shutdown")
+async def shutdown_http_client():
+    await xtream_api.close()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    client.close()
+
+async def warm_catalogs_once():
+    await xtream_api.start()
+    try:
+        return await catalog_warmer.run_once()
+    finally:
+        await xtream_api.close()
+        client.close()
+
+async def mongo_indexes_once():
+    try:
+        return {'indexes': await bootstrap_mongo(), 'queries': await explain_hot_queries()}
+    finally:
+        client.close()
+
+async def ingest_epg_once(username: str, password: str):
+    await xtream_api.start()
+    try:
+        await epg_guide.ensure_indexes()
+        return await epg_guide.ingest_from_upstream(username, password)
+    finally:
+        await xtream_api.close()
+        client.close()
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Luxuz TV backend utilities")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("warm", help="Pull catalogs for all active packages into the cache once")
+    commands.add_parser("indexes", help="Create or update Mongo indexes and report hot query plans and latency")
+    ingest = commands.add_parser("ingest-epg", help="Ingest the provider's full XMLTV guide")
+    ingest.add_argument("--username", required=True)
+    ingest.add_argument("--password", required=True)
+    args = parser.parse_args()
+    
+    if args.command == "warm":
+        print(json.dumps(asyncio.run(warm_catalogs_once()), indent=2))
+    elif args.command == "indexes":
+        print(json.dumps(asyncio.run(mongo_indexes_once()), indent=2))
+    elif args.command == "ingest-epg":
+        print(json.dumps(asyncio.run(ingest_epg_once(args.username, args.password)), indent=2))
@@ -0,0 +1,379 @@
+"""
+Latency, throughput and memory of every /api route against a stub panel.
+
+The backend runs in-process behind httpx.ASGITransport, talking to the
+stub Xtream panel from tests/stub_xtream.py (catalog size and upstream
+latency are configurable) and to mongomock, or to a real mongod with
+--mongo-url. Each route is measured:
+
+  cold  first request after all caches and collections are reset,
+        repeated --cold-runs times
+  warm  --requests requests at --concurrency after --warmup requests
+
+and reports p50/p95/p99 latency, warm throughput, the peak memory
+allocated while serving one concurrent batch, and process RSS.
+
+The XMLTV guide is sized on its own (--guide-channels): /epg/ingest
+writes every programme, and mongomock inserts grow quadratically.
+
+    python benchmarks/api_load.py --items 20000 --latency 0.05
+    python benchmarks/api_load.py --json after.json --compare before.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+from mongomock_motor import AsyncMongoMockClient
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'backend'))
+
+import server  # noqa: E402
+from tests.stub_xtream import STUB_BASE_URL, StubXtream  # noqa: E402
+
+CREDS = {'username': 'bench', 'password': 'secret'}
+
+
+def percentile(samples: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile in milliseconds"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))] * 1000, 2)
+
+
+def rss_mb() -> float:
+    """Current resident set size, or the peak where /proc is not available"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return round(int(statm.read().split()[1]) * resource.getpagesize() / 1e6, 1)
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / (1e6 if sys.platform == 'darwin' else 1e3), 1)
+
+
+class Backend:
+    """Points the server module at fresh storage and the stub panel, like tests/conftest.py"""
+
+    def __init__(self, stub: StubXtream, mongo_url: Optional[str], upstream_rate: float):
+        self.stub = stub
+        self.mongo_url = mongo_url
+        self.upstream_rate = upstream_rate
+        self.segment_dir = tempfile.mkdtemp(prefix='luxapp-bench-')
+        self._client = None
+        self._db_name = None
+
+    async def reset(self):
+        await self.close()
+        if self.mongo_url:
+            from motor.motor_asyncio import AsyncIOMotorClient
+
+            self._client = AsyncIOMotorClient(self.mongo_url)
+            self._db_name = f"luxapp_bench_{uuid.uuid4().hex[:8]}"
+            db = self._client[self._db_name]
+        else:
+            db = AsyncMongoMockClient()['bench']
+        server.db = db
+        server.cache = server.TwoTierCache(db.cache, leases=server.MongoLease(db.cache_leases))
+        server.catalog_versions = server.CatalogVersionLog(db.catalog_versions)
+        server.sessions = server.SessionStore(db.session_tokens)
+        server.epg_guide = server.EpgGuide(db.epg_programmes, db.epg_meta, leases=server.MongoLease(db.cache_leases))
+        server.series_library = server.SeriesLibrary(db.series_info, db.episodes)
+        server.edge_resolver = server.EdgeResolver()
+        server.hls_proxy = server.HlsProxy(segments=server.SegmentCache(directory=self.segment_dir))
+        server.HLS_PROXY_ENABLED = True
+        # The governor paces the real panel; by default let the benchmark measure the backend itself
+        server.xtream_api = server.XtreamCodesAPI(
+            base_url=STUB_BASE_URL,
+            transport=httpx.ASGITransport(app=self.stub.app),
+            governor=server.UpstreamGovernor(rate=self.upstream_rate),
+        )
+        await server.bootstrap_mongo()
+
+    async def close(self):
+        # Prefetches and ingests started by the last requests would outlive the storage and client they use
+        while True:
+            pending = [task for task in asyncio.all_tasks() if task is not asyncio.current_task() and not task.done()]
+            if not pending:
+                break
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        if isinstance(getattr(server, 'xtream_api', None), server.XtreamCodesAPI):
+            await server.xtream_api.close()
+        server.hls_proxy.segments.close()
+        if self._client is not None:
+            await self._client.drop_database(self._db_name)
+            self._client.close()
+            self._client = None
+
+
+Prepare = Callable[[httpx.AsyncClient, Dict[str, str]], Awaitable[Dict[str, Any]]]
+
+
+async def hls_variant(client: httpx.AsyncClient, headers: Dict[str, str], stream_id: int) -> str:
+    """Proxy path of a channel's first variant playlist, read from its entry playlist"""
+    entry = await client.get(f"/api/live/hls/{stream_id}", headers=headers)
+    variant = next(line for line in entry.text.splitlines() if line and not line.startswith('#'))
+    return f"/api/live/hls/{variant}"
+
+
+async def hls_segment(client: httpx.AsyncClient, headers: Dict[str, str], stream_id: int) -> str:
+    """Proxy path of the first segment of a channel's first variant"""
+    media = await client.get(await hls_variant(client, headers, stream_id), headers=headers)
+    segment = next(line for line in media.text.splitlines() if line and not line.startswith('#'))
+    return f"/api/live/hls/{stream_id}/{segment.removeprefix('../')}"
+
+
+def routes(stub: StubXtream) -> List[Dict[str, Any]]:
+    """One representative request per /api route"""
+    stream_id = stub.live[len(stub.live) // 2]['stream_id']
+    vod_id = stub.vod[0]['stream_id']
+    series_id = stub.series[0]['series_id']
+    episode_id = series_id * 100 + 11
+
+    async def variant(client, headers):
+        return {'path': await hls_variant(client, headers, stream_id)}
+
+    async def segment(client, headers):
+        return {'path': await hls_segment(client, headers, stream_id)}
+
+    async def since(client, headers):
+        response = await client.get('/api/live/streams', params={'limit': 1}, headers=headers)
+        return {'params': {'since': response.headers['X-Catalog-Version']}}
+
+    async def throwaway_token(client, headers):
+        token = (await client.post('/api/auth/login', json=CREDS)).json()['token']
+        return {'headers': {'Authorization': f"Bearer {token}"}}
+
+    return [
+        {'name': 'GET /', 'method': 'GET', 'path': '/api/'},
+        {'name': 'GET /stats', 'method': 'GET', 'path': '/api/stats'},
+        {'name': 'POST /auth/login', 'method': 'POST', 'path': '/api/auth/login', 'json': CREDS, 'anonymous': True},
+        {'name': 'POST /auth/logout', 'method': 'POST', 'path': '/api/auth/logout', 'prepare': throwaway_token},
+        {'name': 'GET /live/categories', 'method': 'GET', 'path': '/api/live/categories'},
+        {'name': 'GET /live/streams', 'method': 'GET', 'path': '/api/live/streams', 'params': {'limit': 50}},
+        {'name': 'GET /live/streams (all)', 'method': 'GET', 'path': '/api/live/streams'},
+        {'name': 'POST /live/stream-url', 'method': 'POST', 'path': '/api/live/stream-url', 'json': {'stream_id': stream_id}},
+        {'name': 'POST /live/stream-url (resolve)', 'method': 'POST', 'path': '/api/live/stream-url',
+         'json': {'stream_id': stream_id, 'resolve': True}},
+        {'name': 'GET /live/hls/{id}', 'method': 'GET', 'path': f"/api/live/hls/{stream_id}"},
+        {'name': 'GET /live/hls/{id}/p/{name}', 'method': 'GET', 'prepare': variant},
+        {'name': 'GET /live/hls/{id}/s/{segment}', 'method': 'GET', 'prepare': segment},
+        {'name': 'POST /live/epg/batch', 'method': 'POST', 'path': '/api/live/epg/batch',
+         'json': {'stream_ids': [s['stream_id'] for s in stub.live[:20]]}},
+        {'name': 'GET /live/epg/{id}', 'method': 'GET', 'path': f"/api/live/epg/{stream_id}"},
+        {'name': 'GET /vod/categories', 'method': 'GET', 'path': '/api/vod/categories'},
+        {'name': 'GET /vod/streams', 'method': 'GET', 'path': '/api/vod/streams', 'params': {'limit': 50}},
+        {'name': 'POST /vod/stream-url', 'method': 'POST', 'path': '/api/vod/stream-url', 'json': {'stream_id': vod_id}},
+        {'name': 'GET /series/categories', 'method': 'GET', 'path': '/api/series/categories'},
+        {'name': 'GET /series/list', 'method': 'GET', 'path': '/api/series/list', 'params': {'limit': 50}},
+        {'name': 'GET /series/info/{id}', 'method': 'GET', 'path': f"/api/series/info/{series_id}"},
+        {'name': 'POST /series/episode-url', 'method': 'POST', 'path': '/api/series/episode-url',
+         'json': {'stream_id': episode_id}},
+        {'name': 'GET /home', 'method': 'GET', 'path': '/api/home'},
+        {'name': 'GET /search', 'method': 'GET', 'path': '/api/search', 'params': {'q': 'movie 1'}},
+        {'name': 'GET /{kind}/changes', 'method': 'GET', 'path': '/api/live/changes', 'prepare': since},
+        {'name': 'POST /epg/ingest', 'method': 'POST', 'path': '/api/epg/ingest', 'json': CREDS},
+        {'name': 'GET /epg/now-next', 'method': 'GET', 'path': '/api/epg/now-next'},
+        {'name': 'GET /epg/grid', 'method': 'GET', 'path': '/api/epg/grid'},
+    ]
+
+
+class LoadDriver:
+    def __init__(self, backend: Backend, args: argparse.Namespace):
+        self.backend = backend
+        self.args = args
+
+    async def _session(self) -> tuple:
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url='http://bench')
+        token = (await client.post('/api/auth/login', json=CREDS)).json()['token']
+        return client, {'Authorization': f"Bearer {token}"}
+
+    async def _request_kwargs(self, route: Dict[str, Any], client: httpx.AsyncClient, headers: Dict[str, str]) -> Dict[str, Any]:
+        request = {
+            'method': route['method'],
+            'url': route.get('path'),
+            'params': route.get('params'),
+            'json': route.get('json'),
+            'headers': {} if route.get('anonymous') else dict(headers),
+        }
+        if route.get('prepare'):
+            prepared = await route['prepare'](client, headers)
+            request['url'] = prepared.get('path', request['url'])
+            request['params'] = {**(request['params'] or {}), **prepared.get('params', {})}
+            request['headers'].update(prepared.get('headers', {}))
+        return request
+
+    @staticmethod
+    async def _timed(client: httpx.AsyncClient, request: Dict[str, Any]) -> tuple:
+        started = time.perf_counter()
+        response = await client.request(**request)
+        return time.perf_counter() - started, response.status_code < 400
+
+    async def cold(self, route: Dict[str, Any]) -> Dict[str, Any]:
+        samples, errors = [], 0
+        for _ in range(self.args.cold_runs):
+            await self.backend.reset()
+            client, headers = await self._session()
+            try:
+                # prepare() only fetches what the measured request needs to be addressable
+                request = await self._request_kwargs(route, client, headers)
+                elapsed, ok = await self._timed(client, request)
+            finally:
+                await client.aclose()
+            samples.append(elapsed)
+            errors += not ok
+        return {
+            'p50_ms': percentile(samples, 0.50),
+            'p95_ms': percentile(samples, 0.95),
+            'p99_ms': percentile(samples, 0.99),
+            'errors': errors,
+        }
+
+    async def warm(self, route: Dict[str, Any]) -> Dict[str, Any]:
+        client, headers = await self._session()
+        try:
+            request = await self._request_kwargs(route, client, headers)
+            for _ in range(self.args.warmup):
+                await client.request(**request)
+            semaphore = asyncio.Semaphore(self.args.concurrency)
+
+            async def one():
+                async with semaphore:
+                    return await self._timed(client, request)
+
+            started = time.perf_counter()
+            results = await asyncio.gather(*[one() for _ in range(self.args.requests)])
+            wall = time.perf_counter() - started
+
+            # Allocation peak of one concurrent batch, measured apart so tracing does not skew latency
+            tracemalloc.start()
+            baseline, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            await asyncio.gather(*[client.request(**request) for _ in range(self.args.concurrency)])
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        finally:
+            await client.aclose()
+        samples = [elapsed for elapsed, _ in results]
+        return {
+            'p50_ms': percentile(samples, 0.50),
+            'p95_ms': percentile(samples, 0.95),
+            'p99_ms': percentile(samples, 0.99),
+            'throughput_rps': round(len(samples) / wall, 1) if wall else None,
+            'errors': sum(not ok for _, ok in results),
+            'alloc_peak_kb': round((peak - baseline) / 1024, 1),
+            'rss_mb': rss_mb(),
+        }
+
+    async def run(self, only: Optional[str] = None) -> Dict[str, Any]:
+        report = {}
+        for route in routes(self.backend.stub):
+            if only and only not in route['name']:
+                continue
+            report[route['name']] = {'cold': await self.cold(route), 'warm': await self.warm(route)}
+        await self.backend.close()
+        return report
+
+
+def print_report(report: Dict[str, Any]):
+    print(
+        f"{'route':<36} {'cold p50':>9} {'cold p95':>9} {'warm p50':>9} {'warm p95':>9} {'warm p99':>9} "
+        f"{'req/s':>8} {'alloc KB':>9} {'RSS MB':>7} {'err':>4}"
+    )
+    for name, result in report.items():
+        cold, warm = result['cold'], result['warm']
+        print(
+            f"{name:<36} {cold['p50_ms']:>9} {cold['p95_ms']:>9} {warm['p50_ms']:>9} {warm['p95_ms']:>9} "
+            f"{warm['p99_ms']:>9} {warm['throughput_rps']:>8} {warm['alloc_peak_kb']:>9} {warm['rss_mb']:>7} "
+            f"{cold['errors'] + warm['errors']:>4}"
+        )
+
+
+def regressions(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Routes whose p95 grew, or whose throughput fell, by more than tolerance against a saved run"""
+    found = []
+    for name, result in report.items():
+        before = baseline.get('routes', {}).get(name)
+        if before is None:
+            continue
+        for phase in ('cold', 'warm'):
+            now, then = result[phase]['p95_ms'], before[phase]['p95_ms']
+            if now is not None and then and now > then * (1 + tolerance):
+                found.append(f"{name}: {phase} p95 {then} -> {now} ms")
+        now, then = result['warm']['throughput_rps'], before['warm']['throughput_rps']
+        if now is not None and then and now < then * (1 - tolerance):
+            found.append(f"{name}: warm throughput {then} -> {now} req/s")
+    return found
+
+
+async def benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    stub = StubXtream(
+        live=args.items, vod=args.items, series=max(1, args.items // 10),
+        categories=args.categories, latency=args.latency,
+    )
+    stub.guide_channels = args.guide_channels
+    backend = Backend(stub, args.mongo_url, args.upstream_rate)
+    report = await LoadDriver(backend, args).run(args.route)
+    return {
+        'config': {
+            key: getattr(args, key)
+            for key in (
+                'items', 'guide_channels', 'categories', 'latency', 'requests', 'concurrency', 'cold_runs', 'warmup',
+                'upstream_rate',
+            )
+        } | {'mongo': 'mongod' if args.mongo_url else 'mongomock'},
+        'routes': report,
+        'upstream_calls': dict(stub.calls),
+    }
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--items', type=int, default=5000, help="live and VOD catalog size (series get a tenth)")
+    parser.add_argument('--guide-channels', type=int, default=50, help="live channels in the XMLTV guide")
+    parser.add_argument('--categories', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.02, help="seconds the stub panel waits per API call")
+    parser.add_argument('--requests', type=int, default=200, help="warm requests per route")
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--cold-runs', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--upstream-rate', type=float, default=0, help="governor token rate; 0 disables pacing")
+    parser.add_argument('--mongo-url', help="measure against this mongod instead of mongomock")
+    parser.add_argument('--route', help="only routes whose name contains this")
+    parser.add_argument('--json', help="write the report here")
+    parser.add_argument('--compare', help="a report saved with --json to check for regressions against")
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    logging.disable(logging.WARNING)
+    result = asyncio.run(benchmark(args))
+    print_report(result['routes'])
+    if args.json:
+        Path(args.json).write_text(json.dumps(result, indent=2))
+    if args.compare:
+        found = regressions(result['routes'], json.loads(Path(args.compare).read_text()), args.tolerance)
+        for line in found:
+            print(f"REGRESSION {line}")
+        if found:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
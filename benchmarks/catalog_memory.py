@@ -0,0 +1,57 @@
+"""
+Memory used by a cached catalog: plain dict lists vs CompactCatalog.
+
+Items come from the stub panel's generators, so they have the same
+shape as get_vod_streams / get_live_streams / get_series responses, and
+every variant is decoded from the same JSON document so no strings are
+shared between them.
+
+    python benchmarks/catalog_memory.py --items 100000
+"""
+
+import argparse
+import gc
+import json
+import sys
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'backend'))
+
+from server import CatalogView, CompactCatalog  # noqa: E402
+from tests.stub_xtream import StubXtream  # noqa: E402
+
+
+def measure(build):
+    """Bytes still allocated after build() returns, plus the peak while building"""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--items', type=int, default=100000)
+    args = parser.parse_args()
+    stub = StubXtream(live=args.items, vod=args.items, series=args.items, categories=50)
+
+    print(f"{'catalog':<8} {'items':>8} {'dict list MB':>13} {'compact MB':>11} {'view MB':>8} {'ratio':>6}")
+    for kind, id_field in (('live', 'stream_id'), ('vod', 'stream_id'), ('series', 'series_id')):
+        document = json.dumps(getattr(stub, kind))
+        dicts, _ = measure(lambda: json.loads(document))
+        compact, _ = measure(lambda: CompactCatalog(json.loads(document)))
+        view, _ = measure(lambda: CatalogView(json.loads(document), id_field))
+        print(
+            f"{kind:<8} {args.items:>8} {dicts / 1e6:>13.1f} {compact / 1e6:>11.1f} "
+            f"{view / 1e6:>8.1f} {compact / dicts:>6.2f}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -76,29 +76,14 @@ export default function HomeScreen() {
 
   const loadHomeData = async (creds: any) => {
     try {
-      // Load featured streams (limit to 6)
-      const streamsRes = await axios.get(
-        `${API_URL}/api/live/streams?username=${creds.username}&password=${creds.password}&limit=6`
+      // Featured streams, categories and latest movies in one request
+      const homeRes = await axios.get(
+        `${API_URL}/api/home?username=${creds.username}&password=${creds.password}`
       );
-      setFeaturedStreams(streamsRes.data || []);
-
-      // Load live categories (limit to 5)
-      const categoriesRes = await axios.get(
-        `${API_URL}/api/live/categories?username=${creds.username}&password=${creds.password}`
-      );
-      setLiveCategories(categoriesRes.data?.slice(0, 5) || []);
-
-      // Load VOD categories (limit to 5)
-      const vodRes = await axios.get(
-        `${API_URL}/api/vod/categories?username=${creds.username}&password=${creds.password}`
-      );
-      setVodCategories(vodRes.data?.slice(0, 5) || []);
-
-      // Load latest movies (limit to 4)
-      const moviesRes = await axios.get(
-        `${API_URL}/api/vod/streams?username=${creds.username}&password=${creds.password}&limit=4`
-      );
-      setLatestMovies(moviesRes.data || []);
+      setFeaturedStreams(homeRes.data?.featured_streams || []);
+      setLiveCategories(homeRes.data?.live_categories || []);
+      setVodCategories(homeRes.data?.vod_categories || []);
+      setLatestMovies(homeRes.data?.latest_movies || []);
 
     } catch (error: any) {
       console.error('Error loading home data:', error);
@@ -0,0 +1,37 @@
+import sys
+from pathlib import Path
+
+import httpx
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+# The backend is run from its own directory (uvicorn server:app), so mirror that here
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+import server  # noqa: E402
+from tests.stub_xtream import STUB_BASE_URL, StubXtream  # noqa: E402
+
+
+@pytest.fixture
+def stub():
+    return StubXtream()
+
+
+@pytest.fixture
+def backend(monkeypatch, stub, tmp_path):
+    """Point the server module at mongomock and the stub panel"""
+    db = AsyncMongoMockClient()['test']
+    monkeypatch.setattr(server, 'db', db)
+    monkeypatch.setattr(server, 'cache', server.TwoTierCache(db.cache, leases=server.MongoLease(db.cache_leases)))
+    monkeypatch.setattr(server, 'catalog_versions', server.CatalogVersionLog(db.catalog_versions))
+    monkeypatch.setattr(server, 'sessions', server.SessionStore(db.session_tokens))
+    monkeypatch.setattr(server, 'epg_guide', server.EpgGuide(db.epg_programmes, db.epg_meta, leases=server.MongoLease(db.cache_leases)))
+    monkeypatch.setattr(server, 'series_library', server.SeriesLibrary(db.series_info, db.episodes))
+    monkeypatch.setattr(server, 'edge_resolver', server.EdgeResolver())
+    segments = server.SegmentCache(memory_bytes=1024 * 1024, disk_bytes=4 * 1024 * 1024, directory=str(tmp_path))
+    monkeypatch.setattr(server, 'hls_proxy', server.HlsProxy(segments=segments))
+    monkeypatch.setattr(
+        server, 'xtream_api',
+        server.XtreamCodesAPI(base_url=STUB_BASE_URL, transport=httpx.ASGITransport(app=stub.app))
+    )
+    return server
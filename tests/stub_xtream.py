@@ -0,0 +1,290 @@
+"""
+Local stand-in for an Xtream Codes panel.
+
+Serves player_api.php with generated catalogs of configurable size and
+latency so the backend can be exercised without s.luxuztv.com. Use it
+in-process through httpx.ASGITransport(app=stub.app).
+"""
+
+import asyncio
+import hashlib
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+STUB_BASE_URL = "http://stub-xtream"
+HLS_MEDIA_TYPE = 'application/vnd.apple.mpegurl'
+
+
+class StubXtream:
+    def __init__(
+        self,
+        live: int = 50,
+        vod: int = 100,
+        series: int = 20,
+        categories: int = 5,
+        latency: float = 0.0,
+        users: Optional[Dict[str, str]] = None,
+    ):
+        self.latency = latency
+        self.users = users
+        self.calls: Counter = Counter()
+        self.edge_tokens = 0
+        self.hls_target_duration = 4
+        self.hls_segment_size = 4096
+        # Channels listed in the XMLTV guide; None lists every live channel
+        self.guide_channels: Optional[int] = None
+        self.categories = {
+            kind: [
+                {'category_id': str(offset + i), 'category_name': f"{kind.upper()} {i}", 'parent_id': 0}
+                for i in range(categories)
+            ]
+            for kind, offset in (('live', 1), ('vod', 101), ('series', 201))
+        }
+        self.live = [self._live_item(i) for i in range(1, live + 1)]
+        self.vod = [self._vod_item(i) for i in range(1, vod + 1)]
+        self.series = [self._series_item(i) for i in range(1, series + 1)]
+        self.app = self._build_app()
+
+    def _category(self, kind: str, i: int) -> str:
+        cats = self.categories[kind]
+        return cats[i % len(cats)]['category_id']
+
+    def _live_item(self, i: int) -> Dict[str, Any]:
+        return {
+            'num': i,
+            'name': f"Channel {i}",
+            'stream_type': 'live',
+            'stream_id': i,
+            'stream_icon': f"http://stub-xtream/images/live/{i}.png",
+            'epg_channel_id': f"channel{i}.stub",
+            'added': '1700000000',
+            'is_adult': '0',
+            'category_id': self._category('live', i),
+            'custom_sid': '',
+            'tv_archive': 0,
+            'direct_source': '',
+            'tv_archive_duration': 0,
+        }
+
+    def _vod_item(self, i: int) -> Dict[str, Any]:
+        return {
+            'num': i,
+            'name': f"Movie {i}",
+            'stream_type': 'movie',
+            'stream_id': 100000 + i,
+            'stream_icon': f"http://stub-xtream/images/vod/{i}.jpg",
+            'rating': '7.1',
+            'rating_5based': 3.6,
+            'added': '1700000000',
+            'is_adult': '0',
+            'category_id': self._category('vod', i),
+            'container_extension': 'mp4',
+            'custom_sid': '',
+            'direct_source': '',
+        }
+
+    def _series_item(self, i: int) -> Dict[str, Any]:
+        return {
+            'num': i,
+            'name': f"Series {i}",
+            'series_id': 500000 + i,
+            'cover': f"http://stub-xtream/images/series/{i}.jpg",
+            'plot': f"Plot of series {i}",
+            'genre': 'Drama',
+            'rating': '8',
+            'last_modified': '1700000000',
+            'category_id': self._category('series', i),
+        }
+
+    def series_info(self, series_id: int, seasons: int = 2, episodes: int = 3) -> Dict[str, Any]:
+        info = next((s for s in self.series if s['series_id'] == series_id), None)
+        if info is None:
+            return {}
+        return {
+            'seasons': [{'season_number': s, 'name': f"Season {s}"} for s in range(1, seasons + 1)],
+            'info': info,
+            'episodes': {
+                str(s): [
+                    {
+                        'id': str(series_id * 100 + s * 10 + e),
+                        'episode_num': e,
+                        'title': f"S{s:02d}E{e:02d}",
+                        'container_extension': 'mkv',
+                        'season': s,
+                    }
+                    for e in range(1, episodes + 1)
+                ]
+                for s in range(1, seasons + 1)
+            },
+        }
+
+    def short_epg(self, stream_id: int, limit: int = 10, slot: int = 1800) -> List[Dict[str, Any]]:
+        """Back-to-back programmes of `slot` seconds, starting with the one on air"""
+        start = int(time.time()) // slot * slot
+        return [
+            {
+                'id': f"{stream_id}-{n}",
+                'channel_id': f"channel{stream_id}.stub",
+                'title': f"Programme {n} on {stream_id}",
+                'start_timestamp': str(start + n * slot),
+                'stop_timestamp': str(start + (n + 1) * slot),
+            }
+            for n in range(limit)
+        ]
+
+    def xmltv(self, hours: int = 6, slot: int = 1800) -> str:
+        """Full guide for the first guide_channels live channels: `hours` of back-to-back programmes from the last slot boundary"""
+        start = int(time.time()) // slot * slot
+        fmt = lambda ts: time.strftime('%Y%m%d%H%M%S +0000', time.gmtime(ts))
+        channels = self.live[:self.guide_channels]
+        parts = ['<?xml version="1.0" encoding="UTF-8"?>', '<tv generator-info-name="stub-xtream">']
+        for item in channels:
+            parts.append(
+                f'<channel id="{item["epg_channel_id"]}"><display-name>{item["name"]}</display-name>'
+                f'<icon src="{item["stream_icon"]}"/></channel>'
+            )
+        for item in channels:
+            for n in range(hours * 3600 // slot):
+                parts.append(
+                    f'<programme start="{fmt(start + n * slot)}" stop="{fmt(start + (n + 1) * slot)}" '
+                    f'channel="{item["epg_channel_id"]}"><title>Programme {n} on {item["stream_id"]}</title>'
+                    f'<desc>About programme {n}</desc></programme>'
+                )
+        parts.append('</tv>')
+        return '\n'.join(parts)
+
+    def hls_master(self, stream_id: int, token: str) -> str:
+        """Variant playlist with two renditions, addressed relative to the edge URL"""
+        return (
+            "#EXTM3U\n"
+            "#EXT-X-VERSION:3\n"
+            '#EXT-X-STREAM-INF:BANDWIDTH=2500000,RESOLUTION=1280x720\n'
+            f"{stream_id}/720p.m3u8?token={token}\n"
+            '#EXT-X-STREAM-INF:BANDWIDTH=800000,RESOLUTION=640x360\n'
+            f"{stream_id}/360p.m3u8?token={token}\n"
+        )
+
+    def hls_media(self, variant: str, token: Optional[str] = None, window: int = 3) -> str:
+        """Live media playlist whose window slides every hls_target_duration seconds.
+
+        The AES key and the segments sit next to it and, like real edges, carry the playlist's token.
+        """
+        first = int(time.time() // self.hls_target_duration)
+        query = f"?token={token}" if token is not None else ''
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            f"#EXT-X-TARGETDURATION:{self.hls_target_duration}",
+            f"#EXT-X-MEDIA-SEQUENCE:{first}",
+            f'#EXT-X-KEY:METHOD=AES-128,URI="{variant}/stream.key{query}"',
+        ]
+        for sequence in range(first, first + window):
+            lines.append(f"#EXTINF:{self.hls_target_duration}.000,")
+            lines.append(f"{variant}/{sequence}.ts{query}")
+        return '\n'.join(lines) + '\n'
+
+    def hls_segment(self, stream_id: int, variant: str, sequence: int) -> bytes:
+        header = f"{stream_id}/{variant}/{sequence}".encode()
+        return header + b'\x47' * (self.hls_segment_size - len(header))
+
+    def _authorized(self, username: Optional[str], password: Optional[str]) -> bool:
+        return self.users is None or self.users.get(username) == password
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.get("/player_api.php")
+        async def player_api(request: Request):
+            params = request.query_params
+            action = params.get('action', 'auth')
+            self.calls[action] += 1
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            if not self._authorized(params.get('username'), params.get('password')):
+                return JSONResponse({'user_info': {'auth': 0}})
+            category_id = params.get('category_id')
+
+            def by_category(items: List[Dict[str, Any]]):
+                return [i for i in items if not category_id or i['category_id'] == category_id]
+
+            if action == 'auth':
+                return {
+                    'user_info': {
+                        'username': params.get('username'),
+                        'auth': 1,
+                        'status': 'Active',
+                        'exp_date': '4102444800',
+                        'max_connections': '1',
+                    },
+                    'server_info': {'url': 'stub-xtream', 'port': '80'},
+                }
+            if action == 'get_live_categories':
+                return self.categories['live']
+            if action == 'get_vod_categories':
+                return self.categories['vod']
+            if action == 'get_series_categories':
+                return self.categories['series']
+            if action == 'get_live_streams':
+                return by_category(self.live)
+            if action == 'get_vod_streams':
+                return by_category(self.vod)
+            if action == 'get_series':
+                return by_category(self.series)
+            if action == 'get_series_info':
+                return self.series_info(int(params.get('series_id')))
+            if action == 'get_short_epg':
+                return {'epg_listings': self.short_epg(int(params.get('stream_id')), int(params.get('limit', 10)))}
+            return JSONResponse({'error': f"unknown action {action}"}, status_code=400)
+
+        @app.get("/edge/live/{stream_id}.m3u8")
+        async def hls_master(stream_id: int, token: str):
+            self.calls['edge'] += 1
+            self.calls['hls_master'] += 1
+            return Response(self.hls_master(stream_id, token), media_type=HLS_MEDIA_TYPE)
+
+        @app.get("/edge/live/{stream_id}/{variant}.m3u8")
+        async def hls_media(stream_id: int, variant: str, token: str):
+            self.calls['hls_media'] += 1
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            return Response(self.hls_media(variant, token), media_type=HLS_MEDIA_TYPE)
+
+        @app.get("/edge/live/{stream_id}/{variant}/stream.key")
+        async def hls_key(stream_id: int, variant: str, token: str):
+            self.calls['hls_key'] += 1
+            return Response(hashlib.md5(f"{stream_id}/{variant}".encode()).digest(), media_type='application/octet-stream')
+
+        @app.get("/edge/live/{stream_id}/{variant}/{sequence}.ts")
+        async def hls_segment(stream_id: int, variant: str, sequence: int, token: str):
+            self.calls['hls_segment'] += 1
+            return Response(self.hls_segment(stream_id, variant, sequence), media_type='video/mp2t')
+
+        @app.get("/edge/{kind}/{filename}")
+        async def edge(kind: str, filename: str):
+            self.calls['edge'] += 1
+            return Response(b'#EXTM3U\n', media_type=HLS_MEDIA_TYPE)
+
+        @app.get("/{kind}/{username}/{password}/{filename}")
+        async def playback(kind: str, username: str, password: str, filename: str):
+            # Panels answer playback URLs with a redirect to a load-balanced edge
+            self.calls['playback'] += 1
+            if kind not in ('live', 'movie', 'series') or not self._authorized(username, password):
+                return Response(status_code=404 if kind not in ('live', 'movie', 'series') else 401)
+            stream_id, _, extension = filename.partition('.')
+            self.edge_tokens += 1
+            location = f"{STUB_BASE_URL}/edge/{kind}/{stream_id}.{extension}?token={self.edge_tokens}"
+            return Response(status_code=302, headers={'Location': location})
+
+        @app.get("/xmltv.php")
+        async def xmltv(request: Request):
+            params = request.query_params
+            self.calls['xmltv'] += 1
+            if not self._authorized(params.get('username'), params.get('password')):
+                return Response(status_code=401)
+            return Response(self.xmltv(), media_type='application/xml')
+
+        return app
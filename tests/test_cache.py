@@ -0,0 +1,212 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from mongomock_motor import AsyncMongoMockClient
+
+from server import MongoLease, TwoTierCache
+
+
+def make_cache(max_bytes=10_000):
+    return TwoTierCache(AsyncMongoMockClient()['test'].cache, max_bytes=max_bytes)
+
+
+def test_memory_tier_serves_hits_without_mongo():
+    async def run():
+        cache = make_cache()
+        await cache.set('k', [1, 2, 3], ttl=60)
+        await cache.collection.delete_many({})
+        assert await cache.get('k', ttl=60) == [1, 2, 3]
+        assert cache.stats()['memory_hits'] == 1
+
+    asyncio.run(run())
+
+
+def test_mongo_tier_backfills_memory():
+    async def run():
+        cache = make_cache()
+        await cache.set('k', {'a': 1}, ttl=60)
+        cache._entries.clear()
+        cache._bytes = 0
+        assert await cache.get('k', ttl=60) == {'a': 1}
+        assert await cache.get('k', ttl=60) == {'a': 1}
+        stats = cache.stats()
+        assert stats['mongo_hits'] == 1
+        assert stats['memory_hits'] == 1
+
+    asyncio.run(run())
+
+
+def test_day_old_entry_is_stale():
+    # timedelta.seconds wraps every 24h; a 25h old entry must not look 1h old
+    async def run():
+        cache = make_cache()
+        old = datetime.utcnow() - timedelta(hours=25)
+        await cache.collection.insert_one({'key': 'k', 'data': [1], 'timestamp': old})
+        assert await cache.get('k', ttl=7200) is None
+        assert cache.stats()['misses'] == 1
+
+    asyncio.run(run())
+
+
+def test_lru_evicts_by_byte_budget():
+    async def run():
+        cache = make_cache(max_bytes=100)
+        await cache.set('a', 'x' * 40, ttl=60)
+        await cache.set('b', 'x' * 40, ttl=60)
+        await cache.get('a', ttl=60)
+        await cache.set('c', 'x' * 40, ttl=60)
+        assert list(cache._entries) == ['a', 'c']
+        assert cache.stats()['bytes'] <= 100
+        assert cache.stats()['evictions'] == 1
+
+    asyncio.run(run())
+
+
+def test_set_writes_ttl_expiry():
+    async def run():
+        cache = make_cache()
+        cache.stale_while_revalidate = 60
+        cache.stale_if_error = 90
+        await cache.set('k', [], ttl=30)
+        doc = await cache.collection.find_one({'key': 'k'})
+        # Kept past the ttl for as long as the widest stale window allows
+        assert doc['expires_at'] - doc['timestamp'] == timedelta(seconds=120)
+
+    asyncio.run(run())
+
+
+def test_get_or_fetch_calls_fetcher_once():
+    async def run():
+        cache = make_cache()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            return ['fresh']
+
+        assert await cache.get_or_fetch('k', 60, fetch) == ['fresh']
+        assert await cache.get_or_fetch('k', 60, fetch) == ['fresh']
+        assert len(calls) == 1
+
+    asyncio.run(run())
+
+
+def test_concurrent_misses_share_one_fetch():
+    async def run():
+        cache = make_cache()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return ['fresh']
+
+        results = await asyncio.gather(*[cache.get_or_fetch('k', 60, fetch) for _ in range(20)])
+        assert results == [['fresh']] * 20
+        assert len(calls) == 1
+        assert cache.stats()['coalesced'] == 19
+
+    asyncio.run(run())
+
+
+def test_lease_makes_other_workers_wait_for_the_leader():
+    async def run():
+        db = AsyncMongoMockClient()['test']
+        leader = TwoTierCache(db.cache, leases=MongoLease(db.cache_leases))
+        follower = TwoTierCache(db.cache, leases=MongoLease(db.cache_leases), lease_poll_interval=0.01)
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.1)
+            return ['fresh']
+
+        leading = asyncio.ensure_future(leader.get_or_fetch('k', 60, fetch))
+        await asyncio.sleep(0.02)
+        assert await follower.get_or_fetch('k', 60, fetch) == ['fresh']
+        assert await leading == ['fresh']
+        assert len(calls) == 1
+        assert follower.stats()['lease_peer_fills'] == 1
+        assert await db.cache_leases.count_documents({}) == 0
+
+    asyncio.run(run())
+
+
+def test_stale_entry_is_served_while_refreshing():
+    async def run():
+        cache = make_cache()
+        old = datetime.utcnow() - timedelta(seconds=120)
+        await cache.collection.insert_one({'key': 'k', 'data': ['stale'], 'timestamp': old})
+
+        async def fetch():
+            return ['fresh']
+
+        assert await cache.get_or_fetch('k', 60, fetch) == ['stale']
+        await asyncio.gather(*cache._refreshes)
+        assert await cache.get_or_fetch('k', 60, fetch) == ['fresh']
+        stats = cache.stats()
+        assert stats['stale_served'] == 1
+        assert stats['background_refreshes'] == 1
+
+    asyncio.run(run())
+
+
+def test_stale_if_error_bounds():
+    async def run():
+        cache = make_cache()
+        cache.stale_while_revalidate = 0
+        cache.stale_if_error = 600
+
+        async def failing():
+            raise RuntimeError('panel down')
+
+        recent = datetime.utcnow() - timedelta(seconds=120)
+        await cache.collection.insert_one({'key': 'a', 'data': ['stale'], 'timestamp': recent})
+        assert await cache.get_or_fetch('a', 60, failing) == ['stale']
+        assert cache.stats()['stale_if_error_served'] == 1
+
+        ancient = datetime.utcnow() - timedelta(hours=2)
+        await cache.collection.insert_one({'key': 'b', 'data': ['stale'], 'timestamp': ancient})
+        try:
+            await cache.get_or_fetch('b', 60, failing)
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError('entry past the stale-if-error window was served')
+
+    asyncio.run(run())
+
+
+def test_stale_memory_entry_rechecks_mongo_by_timestamp_only():
+    async def run():
+        cache = make_cache()
+        cache._remember('k', ['stale'], datetime.utcnow() - timedelta(seconds=120))
+        await cache.collection.insert_one({'key': 'k', 'data': ['stale'], 'timestamp': datetime.utcnow() - timedelta(seconds=120)})
+        full_reads = []
+        find_one = cache.collection.find_one
+
+        async def counting_find_one(query, projection=None, *args, **kwargs):
+            if projection is None:
+                full_reads.append(query)
+            return await find_one(query, projection, *args, **kwargs)
+
+        cache.collection.find_one = counting_find_one
+        release = asyncio.Event()
+
+        async def fetch():
+            await release.wait()
+            return ['fresh']
+
+        for _ in range(50):
+            assert await cache.get_or_fetch('k', 60, fetch) == ['stale']
+        assert full_reads == []
+        assert cache.stats()['mongo_rechecks'] == 50
+
+        # A copy another worker stored is still picked up, with one full read
+        await cache.collection.update_one({'key': 'k'}, {'$set': {'data': ['peer'], 'timestamp': datetime.utcnow()}})
+        assert await cache.get('k', ttl=60) == ['peer']
+        assert len(full_reads) == 1
+        release.set()
+        await asyncio.gather(*cache._refreshes)
+
+    asyncio.run(run())
@@ -0,0 +1,177 @@
+import pytest
+
+from fastapi.testclient import TestClient
+
+from tests.stub_xtream import StubXtream
+
+CREDS = {'username': 'alice', 'password': 'secret'}
+
+
+def test_category_switches_use_the_full_catalog_index(backend, stub):
+    with TestClient(backend.app) as client:
+        everything = client.get('/api/live/streams', params=CREDS).json()
+        for category in stub.categories['live']:
+            cid = category['category_id']
+            response = client.get('/api/live/streams', params={**CREDS, 'category_id': cid})
+            assert response.json() == [item for item in everything if item['category_id'] == cid]
+
+    assert stub.calls['get_live_streams'] == 1
+
+
+def test_items_outside_entitled_categories_are_hidden(backend, stub):
+    hidden = {**stub._live_item(777), 'category_id': '9999'}
+    stub.live.append(hidden)
+
+    with TestClient(backend.app) as client:
+        items = client.get('/api/live/streams', params=CREDS).json()
+        by_category = client.get('/api/live/streams', params={**CREDS, 'category_id': '9999'}).json()
+
+    assert hidden['stream_id'] not in {item['stream_id'] for item in items}
+    assert len(items) == len(stub.live) - 1
+    assert by_category == []
+
+
+def test_pagination_and_projection(backend, stub):
+    with TestClient(backend.app) as client:
+        response = client.get('/api/vod/streams', params={**CREDS, 'limit': 4, 'offset': 2, 'fields': 'stream_id,name'})
+
+    assert response.json() == [{'stream_id': i['stream_id'], 'name': i['name']} for i in stub.vod[2:6]]
+    assert response.headers['X-Total-Count'] == str(len(stub.vod))
+    assert response.headers['X-Next-Offset'] == '6'
+
+
+def test_array_reader_yields_elements_across_any_chunk_boundary():
+    from server import JsonArrayReader, json_dumps
+
+    items = [{'name': 'Čaj ☕', 'stream_id': i, 'tags': [1, {'a': 'b]'}], 'n': None} for i in range(20)] + [12345, 'x,]']
+    document = b' [\n' + b', '.join(json_dumps(item) for item in items) + b' ]'
+    for size in (1, 2, 7, 64, len(document)):
+        reader = JsonArrayReader()
+        decoded = []
+        for i in range(0, len(document), size):
+            decoded += reader.feed(document[i:i + size])
+        decoded += reader.close()
+        assert decoded == items
+
+
+def test_array_reader_rejects_non_arrays_and_truncation():
+    from server import JsonArrayReader
+
+    with pytest.raises(ValueError):
+        JsonArrayReader().feed(b'{"user_info": {}}')
+    reader = JsonArrayReader()
+    reader.feed(b'[{"a": 1}, {"b"')
+    with pytest.raises(ValueError):
+        reader.close()
+
+
+def test_catalog_responses_reuse_encoded_items(backend, stub):
+    with TestClient(backend.app) as client:
+        first = client.get('/api/vod/streams', params={**CREDS, 'limit': 10})
+        second = client.get('/api/vod/streams', params={**CREDS, 'limit': 10})
+
+    assert first.headers['content-type'] == 'application/json'
+    assert first.headers['x-total-count'] == str(len(stub.vod))
+    assert first.json() == stub.vod[:10]
+    assert second.content == first.content
+
+
+def test_compact_catalog_round_trips_items_exactly():
+    from server import CompactCatalog
+
+    items = [
+        {'name': 'A', 'stream_id': 1, 'stream_icon': 'http://cdn/img/1.png', 'category_id': '7', 'rating': 7.5},
+        {'stream_id': 2, 'name': 'B', 'stream_icon': '', 'category_id': 7, 'category_ids': [7, 8]},
+        {'name': 'C', 'stream_id': 2 ** 70, 'stream_icon': None, 'category_id': None, 'extra': {'a': 1}},
+        {'name': 'D', 'stream_id': 4, 'stream_icon': 'http://cdn/img/4.png'},
+    ]
+    # Equal values of different types must not be merged into whichever came first
+    mixed = [True, 1, 1.0, 0, False, 5.0, 5, '1']
+    items += [{'name': f"M{i}", 'stream_id': 10 + i, 'tv_archive': v, 'category_id': v} for i, v in enumerate(mixed)]
+    table = CompactCatalog(items)
+
+    assert [table.row(r) for r in range(len(table))] == items
+    assert [type(table.row(r)['tv_archive']) for r in range(4, len(table))] == [type(v) for v in mixed]
+    assert [type(table.get(r, 'category_id')) for r in range(4, len(table))] == [type(v) for v in mixed]
+    assert [list(table.row(r)) for r in range(len(table))] == [list(item) for item in items]
+    assert list(table.rows([3, 0])) == [items[3], items[0]]
+    assert table.get(0, 'stream_icon') == 'http://cdn/img/1.png'
+    assert table.get(3, 'category_id', 'absent') == 'absent'
+    assert table.prefixes == [None, 'http://cdn/img/']
+
+
+def test_compact_catalog_uses_a_fraction_of_dict_memory():
+    import json
+    import tracemalloc
+
+    from server import CompactCatalog
+
+    document = json.dumps(StubXtream(vod=5000).vod)
+
+    def retained(build):
+        tracemalloc.start()
+        result = build()  # noqa: F841
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return size
+
+    assert retained(lambda: CompactCatalog(json.loads(document))) < 0.5 * retained(lambda: json.loads(document))
+
+
+def test_catalog_etags_and_precompressed_encodings(backend, stub):
+    with TestClient(backend.app) as client:
+        full = client.get('/api/live/streams', params=CREDS, headers={'Accept-Encoding': 'gzip'})
+        unchanged = client.get('/api/live/streams', params=CREDS, headers={'If-None-Match': full.headers['etag']})
+        identity = client.get('/api/live/streams', params=CREDS, headers={'Accept-Encoding': 'identity'})
+        page = client.get('/api/live/streams', params={**CREDS, 'limit': 5}, headers={'If-None-Match': full.headers['etag']})
+
+    assert full.headers['content-encoding'] == 'gzip'
+    assert full.json() == stub.live
+    assert unchanged.status_code == 304
+    assert unchanged.content == b''
+    assert unchanged.headers['x-total-count'] == str(len(stub.live))
+    assert 'content-encoding' not in identity.headers
+    assert identity.json() == stub.live
+    assert page.status_code == 200
+    assert page.headers['etag'] != full.headers['etag']
+
+
+def test_etag_follows_content_across_catalog_versions(stub):
+    from server import CatalogView, etag_matches
+
+    first = CatalogView(stub.live).render_full()
+    refetched = CatalogView([dict(item) for item in stub.live]).render_full()
+    changed = CatalogView([{**stub.live[0], 'name': 'Renamed'}] + stub.live[1:]).render_full()
+
+    assert refetched.etag == first.etag
+    assert changed.etag != first.etag
+    assert etag_matches(f'"other", W/{first.etag}', first.etag)
+    # The pinned full page keeps only its compressed copies
+    assert first.body is None
+    assert first.encoded('gzip') and first.encoded(None) == refetched.encoded(None)
+
+
+def test_rendered_pages_count_toward_the_cache_budget(backend, monkeypatch):
+    import asyncio
+
+    from server import CatalogView
+
+    monkeypatch.setattr(backend, 'CATALOG_PAGE_CACHE_BYTES', 4096)
+    items = StubXtream(live=300).live
+    view = CatalogView(items)
+    for offset in range(0, 300, 10):
+        view.render(view.items[offset:offset + 10])
+    assert 0 < view.memory_bytes() <= 4096
+
+    async def scenario():
+        cache = backend.TwoTierCache(backend.db.cache)
+        stored = await cache.set('catalog_live_budget', items, 60)
+        before = cache.stats()['bytes']
+        stored.render_full()
+        stored.render(stored.items[:50])
+        await cache.get('catalog_live_budget', 60)
+        return before, cache.stats()['bytes'], stored.memory_bytes()
+
+    before, after, held = asyncio.run(scenario())
+    assert held > 0
+    assert after == before + held
@@ -0,0 +1,51 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from tests.test_warmer import add_sessions
+
+CREDS = {'username': 'alice', 'password': 'secret'}
+
+
+def test_changes_since_a_version_are_net_of_every_later_snapshot(backend, stub):
+    add_sessions(backend, 'alice')
+    warmer = backend.CatalogWarmer()
+    asyncio.run(warmer.run_once())
+    with TestClient(backend.app) as client:
+        baseline = client.get('/api/live/streams', params=CREDS).headers['x-catalog-version']
+
+    stub.live.append(stub._live_item(900))
+    stub.live.append(stub._live_item(901))
+    stub.live[0] = {**stub.live[0], 'name': 'Renamed'}
+    removed = stub.live.pop(1)
+    asyncio.run(warmer.run_once())
+    # Added then removed again before the client syncs: never reported
+    stub.live = [item for item in stub.live if item['stream_id'] != 901]
+    stub.live[-1] = {**stub.live[-1], 'name': 'Channel 900 HD'}
+    asyncio.run(warmer.run_once())
+
+    with TestClient(backend.app) as client:
+        current = client.get('/api/live/streams', params=CREDS).headers['x-catalog-version']
+        changes = client.get('/api/live/changes', params={**CREDS, 'since': baseline}).json()
+        none = client.get('/api/live/changes', params={**CREDS, 'since': current}).json()
+        unknown = client.get('/api/live/changes', params={**CREDS, 'since': 'not-a-version'}).json()
+        missing = client.get('/api/radio/changes', params={**CREDS, 'since': baseline})
+
+    assert changes['version'] == current != baseline
+    assert changes['reset'] is False
+    assert changes['added'] == [stub.live[-1]]
+    assert changes['removed'] == [removed['stream_id']]
+    assert changes['modified'] == [stub.live[0]]
+    assert none['reset'] is False and none['added'] == none['removed'] == none['modified'] == []
+    assert unknown['reset'] is True
+    assert missing.status_code == 404
+
+
+def test_unchanged_snapshots_add_no_versions(backend, stub):
+    add_sessions(backend, 'alice')
+    warmer = backend.CatalogWarmer()
+    asyncio.run(warmer.run_once())
+    asyncio.run(warmer.run_once())
+
+    entries = asyncio.run(backend.db.catalog_versions.count_documents({}))
+    assert entries == 3
@@ -0,0 +1,38 @@
+import time
+
+from fastapi.testclient import TestClient
+
+from server import EPG_MIN_TTL, epg_ttl
+
+CREDS = {'username': 'alice', 'password': 'secret'}
+
+
+def test_epg_ttl_runs_until_next_programme_boundary():
+    now = time.time()
+    listings = [
+        {'start_timestamp': str(now - 600), 'stop_timestamp': str(now + 900)},
+        {'start_timestamp': str(now + 900), 'stop_timestamp': str(now + 2700)},
+    ]
+    assert 890 < epg_ttl(listings) <= 900
+    assert epg_ttl([{'start_timestamp': str(now - 60), 'stop_timestamp': str(now + 1)}]) == EPG_MIN_TTL
+
+
+def test_batch_merges_channels_and_caches_each_one(backend, stub):
+    with TestClient(backend.app) as client:
+        first = client.post('/api/live/epg/batch', json={**CREDS, 'stream_ids': [1, 2, 3, 2], 'limit': 3}).json()
+        again = client.post('/api/live/epg/batch', json={**CREDS, 'stream_ids': [3, 4], 'limit': 3}).json()
+        single = client.get('/api/live/epg/4', params={**CREDS, 'limit': 3}).json()
+
+    assert sorted(first['epg']) == ['1', '2', '3']
+    assert first['errors'] == {}
+    assert first['epg']['2'][0]['title'] == 'Programme 0 on 2'
+    assert again['epg']['3'] == first['epg']['3']
+    assert single == again['epg']['4']
+    assert stub.calls['get_short_epg'] == 4
+
+
+def test_batch_rejects_oversized_requests(backend):
+    with TestClient(backend.app) as client:
+        response = client.post('/api/live/epg/batch', json={**CREDS, 'stream_ids': list(range(201))})
+
+    assert response.status_code == 422
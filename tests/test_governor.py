@@ -0,0 +1,113 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+
+def test_action_semaphore_caps_concurrency(backend):
+    governor = backend.UpstreamGovernor(max_concurrency=8, rate=0, action_limits={'get_vod_streams': 2})
+    peak = 0
+
+    async def call():
+        nonlocal peak
+        async with governor.admit('get_vod_streams'):
+            peak = max(peak, governor.stats()['actions']['get_vod_streams']['in_flight'])
+            await asyncio.sleep(0.01)
+
+    async def run():
+        await asyncio.gather(*(call() for _ in range(10)))
+
+    asyncio.run(run())
+    stats = governor.stats()['actions']['get_vod_streams']
+    assert peak == 2
+    assert stats['requests'] == 10
+    assert stats['queue_wait']['max_ms'] > 0
+
+
+def test_limit_backs_off_on_errors_and_recovers():
+    from backend.server import AdaptiveLimit
+
+    limit = AdaptiveLimit(minimum=2, maximum=10, latency_target=1.0, cooldown=0)
+
+    async def run():
+        for _ in range(3):
+            await limit.acquire()
+            limit.release(0.01, failed=True)
+        backed_off = limit.limit
+        for _ in range(50):
+            await limit.acquire()
+            limit.release(0.01, failed=False)
+        return backed_off
+
+    backed_off = asyncio.run(run())
+    assert backed_off == pytest.approx(10 * 0.7 ** 3)
+    assert limit.limit > backed_off
+    assert limit.decreases == 3
+
+
+def test_slow_responses_count_as_congestion():
+    from backend.server import AdaptiveLimit
+
+    limit = AdaptiveLimit(minimum=2, maximum=10, latency_target=0.5, cooldown=0)
+
+    async def run():
+        await limit.acquire()
+        limit.release(2.0, failed=False)
+
+    asyncio.run(run())
+    assert limit.limit == pytest.approx(7)
+
+
+def test_token_bucket_paces_after_burst():
+    from backend.server import TokenBucket
+
+    bucket = TokenBucket(rate=100, burst=5)
+
+    async def run():
+        started = time.monotonic()
+        for _ in range(15):
+            await bucket.take()
+        return time.monotonic() - started
+
+    assert asyncio.run(run()) >= 0.09
+
+
+def test_throttled_upstream_shrinks_limit(backend):
+    def handler(request):
+        return httpx.Response(429)
+
+    api = backend.XtreamCodesAPI(
+        base_url='http://panel.test', transport=httpx.MockTransport(handler), per_host_concurrency=16, retries=0,
+    )
+
+    async def run():
+        try:
+            for _ in range(3):
+                with pytest.raises(httpx.HTTPStatusError):
+                    await api.get_live_categories('alice', 'secret', raise_errors=True)
+        finally:
+            await api.close()
+
+    asyncio.run(run())
+    stats = api.pool_stats()['governor']
+    assert stats['concurrency_limit'] < 16
+    assert stats['actions']['get_live_categories']['errors'] == 3
+
+
+def test_body_transfer_time_is_not_congestion(backend):
+    governor = backend.UpstreamGovernor(max_concurrency=10, rate=0, latency_target=0.05)
+
+    async def run():
+        # Headers arrive at once, then a large body takes a while to read
+        async with governor.admit('get_vod_streams') as ticket:
+            ticket.responded(200)
+            await asyncio.sleep(0.1)
+        fast_headers = governor.limit.decreases
+        async with governor.admit('get_vod_streams') as ticket:
+            await asyncio.sleep(0.1)
+            ticket.responded(200)
+        return fast_headers
+
+    assert asyncio.run(run()) == 0
+    assert governor.limit.decreases == 1
@@ -0,0 +1,121 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+CREDS = {'username': 'alice', 'password': 'secret'}
+
+
+@pytest.fixture
+def hls(backend, monkeypatch):
+    monkeypatch.setattr(backend, 'HLS_PROXY_ENABLED', True)
+    return backend
+
+
+def login(client):
+    return client.post('/api/auth/login', json=CREDS).json()['token']
+
+
+def uris(playlist):
+    return [line for line in playlist.splitlines() if line and not line.startswith('#')]
+
+
+def test_master_playlist_is_rewritten_to_proxy_paths(hls, stub):
+    with TestClient(hls.app) as client:
+        token = login(client)
+        response = client.get('/api/live/hls/7', params={'access_token': token})
+        variants = uris(response.text)
+        media = client.get(f"/api/live/hls/{variants[0]}")
+
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'application/vnd.apple.mpegurl'
+    assert len(variants) == 2
+    assert all(v.startswith('7/p/') and v.endswith(f'.m3u8?access_token={token}') for v in variants)
+    # Panel credentials and edge tokens never reach the player
+    assert 'secret' not in response.text and '?token=' not in response.text
+    assert media.status_code == 200
+    segments = uris(media.text)
+    assert len(segments) == 3
+    # Segments are relayed by the proxy, next to the variant playlist
+    assert all(s.startswith('../s/') and s.endswith(f'.ts?access_token={token}') for s in segments)
+
+
+def test_viewers_share_one_upstream_poll(hls, stub):
+    with TestClient(hls.app) as client:
+        headers = {'Authorization': f"Bearer {login(client)}"}
+        variant = uris(client.get('/api/live/hls/7', headers=headers).text)[0]
+        for _ in range(20):
+            client.get('/api/live/hls/7', headers=headers)
+            client.get(f"/api/live/hls/{variant}", headers=headers)
+
+    assert stub.calls['hls_master'] == 1
+    assert stub.calls['hls_media'] == 1
+    assert hls.hls_proxy.stats()['hits'] == 39
+
+
+def test_concurrent_playlist_requests_are_coalesced(hls, stub):
+    stub.latency = 0.05
+    proxy = hls.hls_proxy
+
+    async def run():
+        entry = await proxy.playlist(7, 'entry', 'http://stub-xtream/live/alice/secret/7.m3u8')
+        path = next(part[0] for part in entry.parts if isinstance(part, tuple))
+        name = path.split('/')[1].removesuffix('.m3u8')
+        await asyncio.gather(*[proxy.playlist(7, name, None) for _ in range(10)])
+        await hls.xtream_api.close()
+
+    asyncio.run(run())
+    assert stub.calls['hls_media'] == 1
+    assert proxy.stats()['coalesced'] == 9
+
+
+def test_media_playlist_ttl_follows_target_duration(hls, stub):
+    channel = hls.hls_proxy.channel(7)
+    media = hls.hls_proxy.rewrite(channel, stub.hls_media('720p'), 'http://edge.test/live/7/720p.m3u8')
+    master = hls.hls_proxy.rewrite(channel, stub.hls_master(7, 'abc'), 'http://edge.test/live/7.m3u8')
+
+    assert media.ttl == stub.hls_target_duration
+    assert master.ttl == hls.HLS_MASTER_TTL
+    assert media.render('../', '').count(b'\n../s/') == 3
+
+
+def test_proxy_is_off_unless_enabled(backend):
+    with TestClient(backend.app) as client:
+        headers = {'Authorization': f"Bearer {login(client)}"}
+        response = client.get('/api/live/hls/7', headers=headers)
+
+    assert response.status_code == 404
+
+
+def test_unknown_stream_and_playlist_names_are_rejected(hls):
+    with TestClient(hls.app) as client:
+        headers = {'Authorization': f"Bearer {login(client)}"}
+        unknown_stream = client.get('/api/live/hls/999999', headers=headers)
+        unknown_name = client.get('/api/live/hls/7/p/0123456789abcdef.m3u8', headers=headers)
+
+    assert unknown_stream.status_code == 404
+    assert unknown_name.status_code == 404
+
+
+@pytest.mark.parametrize('relay', [True, False])
+def test_viewers_never_see_each_others_upstream_tokens(hls, stub, monkeypatch, relay):
+    import re
+
+    monkeypatch.setattr(hls, 'hls_proxy', hls.HlsProxy(relay=relay, segments=hls.hls_proxy.segments))
+
+    def watch(client, username):
+        token = client.post('/api/auth/login', json={'username': username, 'password': 'secret'}).json()['token']
+        headers = {'Authorization': f"Bearer {token}"}
+        entry = client.get('/api/live/hls/7', headers=headers).text
+        media = client.get(f"/api/live/hls/{uris(entry)[0]}", headers=headers).text
+        return entry + media
+
+    with TestClient(hls.app) as client:
+        alice = watch(client, 'alice')
+        bob = watch(client, 'bob')
+
+    # Edge tokens are handed out in order, one per playback redirect: alice's is 1, bob's 2
+    assert set(re.findall(r'token=(\d+)', alice)) <= {'1'}
+    assert set(re.findall(r'token=(\d+)', bob)) <= {'2'}
+    assert 'secret' not in alice + bob
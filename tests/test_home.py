@@ -0,0 +1,40 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+CREDS = {'username': 'alice', 'password': 'secret'}
+
+
+def test_home_returns_trimmed_sections_in_one_payload(backend, stub):
+    with TestClient(backend.app) as client:
+        home = client.get('/api/home', params=CREDS).json()
+
+    assert home['partial'] is False
+    assert [s['stream_id'] for s in home['featured_streams']] == [s['stream_id'] for s in stub.live[:6]]
+    assert set(home['featured_streams'][0]) <= set(backend.HOME_LIVE_FIELDS)
+    assert home['live_categories'] == [
+        {'category_id': c['category_id'], 'category_name': c['category_name']} for c in stub.categories['live'][:5]
+    ]
+    assert len(home['vod_categories']) == 5
+    assert [m['name'] for m in home['latest_movies']] == [m['name'] for m in stub.vod[:4]]
+    # Live categories are shared between two sections and fetched once
+    assert stub.calls['get_live_categories'] == 1
+
+
+def test_home_returns_partial_results_at_the_deadline(backend, stub, monkeypatch):
+    monkeypatch.setattr(backend, 'HOME_DEADLINE', 0.2)
+    slow_categories = backend.xtream_api.get_vod_categories
+
+    async def slow(*args, **kwargs):
+        await asyncio.sleep(0.5)
+        return await slow_categories(*args, **kwargs)
+
+    monkeypatch.setattr(backend.xtream_api, 'get_vod_categories', slow)
+    with TestClient(backend.app) as client:
+        home = client.get('/api/home', params=CREDS).json()
+
+    assert home['partial'] is True
+    assert home['errors'] == {'vod_categories': 'timeout', 'latest_movies': 'timeout'}
+    assert home['vod_categories'] == [] and home['latest_movies'] == []
+    assert len(home['featured_streams']) == 6
+    assert home['took_ms'] < 500
@@ -0,0 +1,106 @@
+import asyncio
+import os
+
+import pytest
+
+
+def test_bootstrap_creates_unique_and_ttl_indexes(backend):
+    report = asyncio.run(backend.bootstrap_mongo())
+    cache = asyncio.run(backend.db.cache.index_information())
+    login_records = asyncio.run(backend.db.sessions.index_information())
+    versions = asyncio.run(backend.db.catalog_versions.index_information())
+
+    assert all(step['ok'] for step in report.values())
+    assert cache['key_1']['unique'] is True
+    assert cache['expires_at_1']['expireAfterSeconds'] == 0
+    assert login_records['username_1']['unique'] is True
+    assert login_records['last_activity_1']['expireAfterSeconds'] == backend.SESSION_RECORD_RETENTION
+    assert versions['key_1_seq_-1']['unique'] is True
+
+
+def test_bootstrap_replaces_indexes_whose_options_changed(backend, monkeypatch):
+    asyncio.run(backend.bootstrap_mongo())
+    monkeypatch.setattr(backend, 'CATALOG_VERSION_RETENTION', 3600)
+
+    report = asyncio.run(backend.bootstrap_mongo())
+    versions = asyncio.run(backend.db.catalog_versions.index_information())
+
+    assert report['catalog_versions']['ok'] is True
+    assert versions['created_at_1']['expireAfterSeconds'] == 3600
+
+
+def test_every_hot_query_is_served_by_an_index(backend):
+    asyncio.run(backend.bootstrap_mongo())
+    report = asyncio.run(backend.explain_hot_queries(runs=3))
+
+    assert len(report) == len(backend.hot_queries())
+    for query in report:
+        assert query['stage'] == 'IXSCAN', query
+        assert query['p50_ms'] <= query['max_ms']
+
+
+def test_ttl_changes_are_applied_in_place(backend, monkeypatch):
+    asyncio.run(backend.bootstrap_mongo())
+    monkeypatch.setattr(backend, 'CATALOG_VERSION_RETENTION', 3600)
+    commands, drops = [], []
+
+    async def command(spec):
+        commands.append(spec)
+        return {'ok': 1}
+
+    async def drop_index(name):
+        drops.append(name)
+
+    monkeypatch.setattr(backend.db, 'command', command, raising=False)
+    monkeypatch.setattr(backend.db.catalog_versions.__class__, 'drop_index', lambda self, name: drop_index(name))
+
+    report = asyncio.run(backend.bootstrap_mongo())
+
+    assert report['catalog_versions']['ok'] is True
+    assert commands == [{'collMod': 'catalog_versions', 'index': {'name': 'created_at_1', 'expireAfterSeconds': 3600}}]
+    assert drops == []
+
+
+def test_bootstrap_drops_cache_entries_that_would_never_expire(backend):
+    async def scenario():
+        await backend.db.cache.insert_many([
+            {'key': 'categories_alice', 'data': [1]},
+            {'key': 'categories_bob', 'data': [1], 'expires_at': backend.datetime.utcnow() + backend.timedelta(hours=1)},
+        ])
+        await backend.bootstrap_mongo()
+        return await backend.db.cache.distinct('key')
+
+    assert asyncio.run(scenario()) == ['categories_bob']
+
+
+@pytest.mark.skipif(not os.environ.get('MONGO_TEST_URL'), reason="set MONGO_TEST_URL to explain against a real mongod")
+def test_explain_plans_on_a_real_mongod(backend, monkeypatch):
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    async def scenario():
+        client = AsyncIOMotorClient(os.environ['MONGO_TEST_URL'])
+        db = client['luxapp_index_test']
+        monkeypatch.setattr(backend, 'db', db)
+        monkeypatch.setattr(backend, 'cache', backend.TwoTierCache(db.cache, leases=backend.MongoLease(db.cache_leases)))
+        monkeypatch.setattr(backend, 'sessions', backend.SessionStore(db.session_tokens))
+        monkeypatch.setattr(backend, 'catalog_versions', backend.CatalogVersionLog(db.catalog_versions))
+        monkeypatch.setattr(backend, 'epg_guide', backend.EpgGuide(db.epg_programmes, db.epg_meta, leases=backend.MongoLease(db.cache_leases)))
+        monkeypatch.setattr(backend, 'series_library', backend.SeriesLibrary(db.series_info, db.episodes))
+        try:
+            await backend.bootstrap_mongo()
+            return await backend.explain_hot_queries(runs=5)
+        finally:
+            await client.drop_database('luxapp_index_test')
+            client.close()
+
+    for query in asyncio.run(scenario()):
+        assert query['source'] == 'explain'
+        assert query['stage'] == 'IXSCAN', query
+
+
+def test_lease_probe_matches_the_lease_lookup(backend):
+    probe = next(q for q in backend.hot_queries() if q['name'] == 'cache lease')
+    key = probe['filter']['_id']
+
+    assert key == backend.catalog_cache_key('live', 'probe', [{'category_id': 'probe'}])
+    assert probe['filter'] == backend.MongoLease.takeover_filter(key, probe['filter']['expires_at']['$lt'])
@@ -0,0 +1,78 @@
+import asyncio
+import time
+
+import httpx
+from fastapi.testclient import TestClient
+
+from server import XtreamCodesAPI
+
+CREDS = {'username': 'alice', 'password': 'secret'}
+
+
+def login(client):
+    token = client.post('/api/auth/login', json=CREDS).json()['token']
+    return {'Authorization': f"Bearer {token}"}
+
+
+def test_redirect_chain_is_followed_to_the_edge():
+    def handler(request):
+        if request.url.host == 'panel.test':
+            return httpx.Response(302, headers={'Location': 'http://lb.test/live/7.m3u8'})
+        if request.url.path.startswith('/live/'):
+            return httpx.Response(302, headers={'Location': '/edge/7.m3u8?token=abc'})
+        return httpx.Response(200, content=b'#EXTM3U\n')
+
+    async def run():
+        api = XtreamCodesAPI(base_url='http://panel.test', transport=httpx.MockTransport(handler))
+        try:
+            return await api.resolve_redirects('http://panel.test/live/alice/secret/7.m3u8')
+        finally:
+            await api.close()
+
+    assert asyncio.run(run()) == 'http://lb.test/edge/7.m3u8?token=abc'
+
+
+def test_resolve_mode_returns_cached_edge_url(backend, stub):
+    with TestClient(backend.app) as client:
+        headers = login(client)
+        first = client.post('/api/vod/stream-url', json={'stream_id': 7, 'resolve': True}, headers=headers).json()
+        second = client.post('/api/vod/stream-url', json={'stream_id': 7, 'resolve': True}, headers=headers).json()
+        plain = client.post('/api/vod/stream-url', json={'stream_id': 7}, headers=headers).json()
+
+    assert first['resolved'] is True
+    assert first['stream_url'].startswith('http://stub-xtream/edge/movie/7.mp4?token=')
+    assert second['stream_url'] == first['stream_url']
+    assert stub.calls['playback'] == 1
+    assert plain == {'stream_url': 'http://stub-xtream/movie/alice/secret/7.mp4'}
+
+
+def test_neighbouring_channels_are_resolved_ahead_of_a_zap(backend, stub):
+    category = stub.live[10]['category_id']
+    same_category = [s['stream_id'] for s in stub.live if s['category_id'] == category]
+    current = same_category[len(same_category) // 2]
+    position = same_category.index(current)
+
+    with TestClient(backend.app) as client:
+        headers = login(client)
+        client.post('/api/live/stream-url', json={'stream_id': current, 'resolve': True}, headers=headers)
+        deadline = time.monotonic() + 5
+        while backend.edge_resolver.stats()['entries'] < 5 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        hits = backend.edge_resolver.stats()['hits']
+        zap = client.post(
+            '/api/live/stream-url', json={'stream_id': same_category[position + 1], 'resolve': True}, headers=headers
+        ).json()
+
+    assert zap['resolved'] is True
+    assert zap['stream_url'].startswith(f"http://stub-xtream/edge/live/{same_category[position + 1]}.m3u8")
+    assert backend.edge_resolver.stats()['hits'] == hits + 1
+    assert backend.edge_resolver.stats()['prefetched'] >= 4
+
+
+def test_unresolvable_url_falls_back_to_the_panel_url(backend, stub):
+    with TestClient(backend.app) as client:
+        headers = login(client)
+        stub.users = {'bob': 'other'}
+        response = client.post('/api/vod/stream-url', json={'stream_id': 3, 'resolve': True}, headers=headers).json()
+
+    assert response == {'stream_url': 'http://stub-xtream/movie/alice/secret/3.mp4', 'resolved': False}
@@ -0,0 +1,179 @@
+import asyncio
+
+import httpx
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from server import CircuitBreaker, TwoTierCache, UpstreamUnavailable, XtreamCodesAPI
+
+
+def make_api(handler, **options):
+    options.setdefault('retry_backoff', 0)
+    return XtreamCodesAPI(base_url='http://panel.test', transport=httpx.MockTransport(handler), **options)
+
+
+def test_retries_recover_from_transient_errors():
+    statuses = [503, 502, 200]
+
+    def handler(request):
+        status = statuses.pop(0)
+        return httpx.Response(status, json=[{'category_id': '1'}] if status == 200 else None)
+
+    async def run():
+        api = make_api(handler, retries=2)
+        try:
+            return await api.get_live_categories('alice', 'secret', raise_errors=True), api.pool_stats()
+        finally:
+            await api.close()
+
+    categories, stats = asyncio.run(run())
+    assert categories == [{'category_id': '1'}]
+    assert stats['retries'] == 2
+    assert stats['breakers']['get_live_categories']['state'] == 'closed'
+
+
+def test_client_errors_are_not_retried():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(404)
+
+    async def run():
+        api = make_api(handler, retries=2)
+        try:
+            with pytest.raises(httpx.HTTPStatusError):
+                await api.get_vod_categories('alice', 'secret', raise_errors=True)
+        finally:
+            await api.close()
+
+    asyncio.run(run())
+    assert len(calls) == 1
+
+
+def test_open_circuit_fails_fast():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(500)
+
+    async def run():
+        api = make_api(handler, retries=0)
+        try:
+            for _ in range(5):
+                with pytest.raises(httpx.HTTPStatusError):
+                    await api.get_live_categories('alice', 'secret', raise_errors=True)
+            with pytest.raises(UpstreamUnavailable):
+                await api.get_live_categories('alice', 'secret', raise_errors=True)
+            # Other actions keep their own circuit
+            with pytest.raises(httpx.HTTPStatusError):
+                await api.get_vod_categories('alice', 'secret', raise_errors=True)
+            return api.pool_stats()['breakers']
+        finally:
+            await api.close()
+
+    breakers = asyncio.run(run())
+    assert len(calls) == 6
+    assert breakers['get_live_categories']['state'] == 'open'
+    assert breakers['get_live_categories']['rejected'] == 1
+
+
+def test_half_open_probe_closes_or_reopens():
+    breaker = CircuitBreaker(failures=2, cooldown=0)
+    breaker.record(failed=True)
+    breaker.record(failed=True)
+    assert breaker.state == 'half_open'
+
+    breaker.check('auth')
+    with pytest.raises(UpstreamUnavailable):
+        breaker.check('auth')
+    breaker.record(failed=True)
+    assert breaker.opened == 2
+
+    breaker.check('auth')
+    breaker.record(failed=False)
+    assert breaker.state == 'closed'
+
+
+def test_hedged_request_wins_over_slow_attempt():
+    attempts = []
+
+    async def handler(request):
+        attempts.append(request)
+        if len(attempts) == 1:
+            await asyncio.sleep(5)
+        return httpx.Response(200, json={'epg_listings': [{'title': 'News'}]})
+
+    async def run():
+        api = make_api(handler, hedge_delay=0.05)
+        try:
+            listings = await asyncio.wait_for(api.get_epg('alice', 'secret', 1, raise_errors=True), 2)
+            return listings, api.pool_stats()
+        finally:
+            await api.close()
+
+    listings, stats = asyncio.run(run())
+    assert listings == [{'title': 'News'}]
+    assert stats['hedges'] == 1
+    assert stats['hedge_wins'] == 1
+    # The abandoned attempt does not count against the panel
+    assert stats['breakers']['get_short_epg']['consecutive_failures'] == 0
+
+
+def test_empty_value_does_not_replace_cached_one():
+    async def run():
+        cache = TwoTierCache(AsyncMongoMockClient()['test'].cache)
+        await cache.set('categories_alice', [{'id': 1}], ttl=60)
+        assert await cache.set('categories_alice', [], ttl=60) == [{'id': 1}]
+        doc = await cache.collection.find_one({'key': 'categories_alice'})
+        return doc['data'], cache.stats()
+
+    data, stats = asyncio.run(run())
+    assert data == [{'id': 1}]
+    assert stats['empty_rejected'] == 1
+
+
+def test_listings_may_legitimately_become_empty():
+    async def run():
+        cache = TwoTierCache(AsyncMongoMockClient()['test'].cache)
+        await cache.set('epg_7_10', [{'title': 'News'}], ttl=60)
+        assert await cache.set('epg_7_10', [], ttl=60) == []
+        return await cache.get('epg_7_10', ttl=60), cache.stats()
+
+    listings, stats = asyncio.run(run())
+    assert listings == []
+    assert stats['empty_rejected'] == 0
+
+
+def test_warmer_keeps_catalog_when_upstream_returns_nothing(backend, stub):
+    asyncio.run(backend.db.sessions.insert_one(
+        {'username': 'alice', 'password': 'secret', 'last_activity': backend.datetime.utcnow()}
+    ))
+    warmer = backend.CatalogWarmer()
+    asyncio.run(warmer.run_once())
+
+    live = stub.live[:]
+    stub.live.clear()
+    asyncio.run(warmer.run_once())
+
+    async def cached_live():
+        doc = await backend.db.cache.find_one({'key': {'$regex': '^catalog_live_'}})
+        return await backend.cache.peek(doc['key'])
+
+    view = asyncio.run(cached_live())
+    assert len(view.items) == len(live)
+    assert warmer.stats()['errors'] >= 1
+
+
+def test_unreachable_panel_is_not_cached_as_bad_credentials(backend, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    def handler(request):
+        raise httpx.ConnectError('panel down')
+
+    monkeypatch.setattr(backend, 'xtream_api', make_api(handler, retries=0))
+    with TestClient(backend.app) as client:
+        response = client.get('/api/live/categories', params={'username': 'alice', 'password': 'secret'})
+
+    assert response.status_code == 503
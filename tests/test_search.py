@@ -0,0 +1,76 @@
+import asyncio
+import gc
+import weakref
+
+from fastapi.testclient import TestClient
+
+from server import CatalogView, SearchIndex, normalize_text
+
+CREDS = {'username': 'alice', 'password': 'secret'}
+
+
+def make_index(names):
+    index = SearchIndex()
+    index.sync(CatalogView([{'stream_id': i, 'name': name} for i, name in enumerate(names)]))
+    return index
+
+
+def test_normalize_strips_accents_and_punctuation():
+    assert normalize_text('Đoković: Šampion!') == 'dokovic sampion'
+    assert normalize_text('  RTS-1  HD ') == 'rts 1 hd'
+
+
+def test_prefix_accent_and_fuzzy_matching():
+    index = make_index(['Čovek na Mesecu', 'Zvezda Granda', 'The Matrix', 'Matrix Reloaded'])
+
+    assert [doc for _, doc in index.search('cove')] == [0]
+    assert [doc for _, doc in index.search('zvezda gr')] == [1]
+    # Names starting with the query rank first
+    assert [doc for _, doc in index.search('matrix')] == [3, 2]
+    assert sorted(doc for _, doc in index.search('matrx')) == [2, 3]
+    assert index.search('matrx', fuzzy=False) == []
+
+
+def test_sync_only_reindexes_changed_items():
+    index = make_index(['Alpha', 'Beta', 'Gamma'])
+    index.sync(CatalogView([
+        {'stream_id': 0, 'name': 'Alpha'},
+        {'stream_id': 2, 'name': 'Delta'},
+        {'stream_id': 3, 'name': 'Epsilon'},
+    ]))
+
+    assert index.search('beta') == []
+    assert index.search('gamma') == []
+    assert [doc for _, doc in index.search('delta')] == [2]
+    assert [doc for _, doc in index.search('eps')] == [3]
+    assert 'beta' not in index.token_postings
+
+
+def test_search_endpoint_filters_to_entitled_items(backend, stub):
+    stub.vod[0] = {**stub.vod[0], 'name': 'Šampion'}
+    stub.vod.append({**stub._vod_item(999), 'name': 'Šampion Hidden', 'category_id': '9999'})
+
+    with TestClient(backend.app) as client:
+        body = client.get('/api/search', params={**CREDS, 'q': 'sampion', 'types': 'vod,live'}).json()
+
+    assert [(r['kind'], r['item']['stream_id']) for r in body['results']] == [('vod', stub.vod[0]['stream_id'])]
+
+
+def test_search_index_is_carried_across_versions_and_freed_with_the_view(backend):
+    key = 'catalog_live_user-0123456789abcdef'
+
+    async def run():
+        first = await backend.cache.set(key, [{'stream_id': 1, 'name': 'Alpha'}, {'stream_id': 2, 'name': 'Beta'}], 60)
+        second = await backend.cache.set(key, [{'stream_id': 1, 'name': 'Alpha'}, {'stream_id': 2, 'name': 'Gamma'}], 60)
+        return first.search, second
+
+    index, view = asyncio.run(run())
+    assert view.search is index
+    assert index.syncs == 2
+    assert [doc for _, doc in index.search('gamma')] == [2]
+
+    alive = weakref.ref(index)
+    del index, view
+    backend.cache._forget(key)
+    gc.collect()
+    assert alive() is None
@@ -0,0 +1,133 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from server import SegmentCache, SegmentRing
+
+CREDS = {'username': 'alice', 'password': 'secret'}
+
+
+@pytest.fixture
+def hls(backend, monkeypatch):
+    monkeypatch.setattr(backend, 'HLS_PROXY_ENABLED', True)
+    return backend
+
+
+def uris(playlist):
+    return [line for line in playlist.splitlines() if line and not line.startswith('#')]
+
+
+def test_viewers_fan_out_from_one_upstream_fetch(hls, stub):
+    with TestClient(hls.app) as client:
+        token = client.post('/api/auth/login', json=CREDS).json()['token']
+        headers = {'Authorization': f"Bearer {token}"}
+        variant = uris(client.get('/api/live/hls/7', headers=headers).text)[0]
+        segment = uris(client.get(f"/api/live/hls/{variant}", headers=headers).text)[0]
+        path = f"/api/live/hls/7/p/{segment}".replace('/p/../', '/')
+        bodies = [client.get(path, headers=headers) for _ in range(10)]
+
+    assert all(b.status_code == 200 for b in bodies)
+    assert bodies[0].headers['content-type'] == 'video/mp2t'
+    assert bodies[0].content.startswith(b'7/720p/')
+    assert len({b.content for b in bodies}) == 1
+    assert stub.calls['hls_segment'] == 1
+    channel = hls.hls_proxy.stats()['segments_by_channel'][7]
+    assert channel['fetched'] == 1
+    assert channel['fan_out'] == 10
+    assert channel['hit_ratio'] == 0.9
+
+
+def test_concurrent_segment_misses_are_coalesced(hls, stub):
+    proxy = hls.hls_proxy
+
+    async def run():
+        entry = await proxy.playlist(7, 'entry', 'http://stub-xtream/live/alice/secret/7.m3u8')
+        variant = next(part[0] for part in entry.parts if isinstance(part, tuple)).split('/')[1][:-5]
+        media = await proxy.playlist(7, variant, None)
+        name = next(part[0] for part in media.parts if isinstance(part, tuple) and part[0].endswith('.ts')).split('/')[1][:-3]
+        results = await asyncio.gather(*[proxy.segment(7, name) for _ in range(8)])
+        await hls.xtream_api.close()
+        return results
+
+    results = asyncio.run(run())
+    assert len(set(results)) == 1
+    assert stub.calls['hls_segment'] == 1
+    assert proxy.stats()['segment_cache']['coalesced'] == 7
+
+
+def test_memory_evictions_are_served_from_the_disk_ring(tmp_path):
+    cache = SegmentCache(memory_bytes=3000, disk_bytes=10_000, directory=str(tmp_path))
+    for i in range(3):
+        cache.put(f"seg{i}", bytes([i]) * 1000)
+    cache.put('seg3', b'\x03' * 1500)
+
+    stats = cache.stats()
+    data, tier = cache.get('seg0')
+    promoted, promoted_tier = cache.get('seg0')
+    cache.close()
+
+    assert stats['memory_evictions'] == 2
+    assert stats['memory_bytes'] == 2500
+    assert stats['disk_entries'] == 4
+    assert (data, tier) == (b'\x00' * 1000, 'disk')
+    assert (promoted, promoted_tier) == (data, 'memory')
+    # The ring file is unlinked once mapped
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_ring_overwrites_oldest_segments_when_it_wraps(tmp_path):
+    ring = SegmentRing(1000, str(tmp_path))
+    for i in range(4):
+        ring.put(f"seg{i}", bytes([i]) * 300)
+    ring.put('seg4', b'\x04' * 300)
+
+    # seg3 did not fit before the end, so it wrapped over seg0; seg4 then took seg1's place
+    assert ring.get('seg0') is None and ring.get('seg1') is None
+    assert [ring.get(f"seg{i}") for i in (2, 3, 4)] == [bytes([i]) * 300 for i in (2, 3, 4)]
+    assert ring.bytes == 900
+    assert ring.evictions == 2
+    ring.close()
+
+
+def test_keys_are_relayed_and_playlists_keep_no_edge_tokens(hls, stub):
+    with TestClient(hls.app) as client:
+        headers = {'Authorization': f"Bearer {client.post('/api/auth/login', json=CREDS).json()['token']}"}
+        variant = uris(client.get('/api/live/hls/7', headers=headers).text)[0]
+        media = client.get(f"/api/live/hls/{variant}", headers=headers).text
+        key_uri = media.split('URI="', 1)[1].split('"', 1)[0]
+        key = client.get(f"/api/live/hls/7/p/{key_uri}".replace('/p/../', '/'), headers=headers)
+
+    assert 'token=' not in media
+    assert key_uri.startswith('../s/') and key_uri.split('?')[0].endswith('.key')
+    assert key.status_code == 200 and len(key.content) == 16
+    assert stub.calls['hls_key'] == 1
+    assert hls.hls_proxy.stats()['shared'] is True
+
+
+def test_segment_fetches_bypass_the_upstream_governor(hls, stub):
+    with TestClient(hls.app) as client:
+        headers = {'Authorization': f"Bearer {client.post('/api/auth/login', json=CREDS).json()['token']}"}
+        variant = uris(client.get('/api/live/hls/7', headers=headers).text)[0]
+        for segment in uris(client.get(f"/api/live/hls/{variant}", headers=headers).text):
+            assert client.get(f"/api/live/hls/7/p/{segment}".replace('/p/../', '/'), headers=headers).status_code == 200
+
+    pool = hls.xtream_api.pool_stats()
+    assert 'hls_segment' not in pool['governor']['actions']
+    assert pool['segments']['requests'] == 3
+    assert pool['segments']['bytes'] == 3 * stub.hls_segment_size
+    assert pool['segments']['in_flight'] == 0
+
+
+def test_segments_are_only_served_on_their_own_channel(hls, stub):
+    with TestClient(hls.app) as client:
+        headers = {'Authorization': f"Bearer {client.post('/api/auth/login', json=CREDS).json()['token']}"}
+        variant = uris(client.get('/api/live/hls/7', headers=headers).text)[0]
+        segment = uris(client.get(f"/api/live/hls/{variant}", headers=headers).text)[0]
+        own = client.get(f"/api/live/hls/7/p/{segment}".replace('/p/../', '/'), headers=headers)
+        # Channel 7's segment is cached now, but channel 8 never listed it
+        other = client.get(f"/api/live/hls/8/p/{segment}".replace('/p/../', '/'), headers=headers)
+
+    assert own.status_code == 200
+    assert other.status_code == 404
+    assert stub.calls['hls_segment'] == 1
@@ -0,0 +1,121 @@
+import asyncio
+import time
+
+from fastapi.testclient import TestClient
+
+CREDS = {'username': 'alice', 'password': 'secret'}
+
+
+def login(client):
+    token = client.post('/api/auth/login', json=CREDS).json()['token']
+    return {'Authorization': f"Bearer {token}"}
+
+
+def test_prefetch_stores_series_and_episodes(backend, stub):
+    series_ids = [s['series_id'] for s in stub.series[:5]]
+
+    async def run():
+        library = backend.series_library
+        counts = await library.prefetch('alice', 'secret', series_ids)
+        again = await library.prefetch('alice', 'secret', series_ids)
+        episode = await library.episode(series_ids[0] * 100 + 12)
+        total = await library.episodes.count_documents({})
+        return counts, again, episode, total
+
+    counts, again, episode, total = asyncio.run(run())
+    assert counts['fetched'] == 5
+    assert again == {'fetched': 0, 'fresh': 5, 'empty': 0, 'errors': 0}
+    assert stub.calls['get_series_info'] == 5
+    assert episode['series_id'] == series_ids[0]
+    assert episode['title'] == 'S01E02'
+    assert total == 5 * 2 * 3
+
+
+def test_fresh_checks_read_only_fetched_at(backend, stub):
+    series_ids = [s['series_id'] for s in stub.series[:5]]
+    library = backend.series_library
+    reads = []
+    find, find_one = library.episodes.find, library.series.find_one
+    library.episodes.find = lambda *args, **kwargs: reads.append('episodes') or find(*args, **kwargs)
+
+    async def series_find_one(query, projection=None, *args, **kwargs):
+        reads.append(dict(projection) if projection else projection)
+        return await find_one(query, projection, *args, **kwargs)
+
+    library.series.find_one = series_find_one
+
+    async def run():
+        await library.prefetch('alice', 'secret', series_ids)
+        reads.clear()
+        return await library.prefetch('alice', 'secret', series_ids)
+
+    assert asyncio.run(run())['fresh'] == 5
+    assert reads == [{'fetched_at': 1}] * 5
+
+
+def test_series_info_is_served_from_the_library(backend, stub):
+    series_id = stub.series[0]['series_id']
+    asyncio.run(backend.series_library.prefetch('alice', 'secret', [series_id]))
+
+    with TestClient(backend.app) as client:
+        headers = login(client)
+        info = client.get(f'/api/series/info/{series_id}', headers=headers).json()
+        missing = client.get('/api/series/info/42', headers=headers)
+
+    assert stub.calls['get_series_info'] == 1
+    assert info == stub.series_info(series_id)
+    assert missing.status_code == 404
+    # Stored once: the library is the only copy
+    assert asyncio.run(backend.db.cache.count_documents({'key': {'$regex': '^series_info_'}})) == 0
+
+
+def test_concurrent_refetches_share_one_panel_call(backend, stub):
+    series_id = stub.series[0]['series_id']
+    library = backend.series_library
+
+    async def run():
+        return await asyncio.gather(*[library.info('alice', 'secret', series_id) for _ in range(5)])
+
+    results = asyncio.run(run())
+    assert stub.calls['get_series_info'] == 1
+    assert all(result['info']['series_id'] == series_id for result in results)
+
+
+def test_empty_refetch_keeps_stored_series(backend, stub):
+    series_id = stub.series[0]['series_id']
+    library = backend.series_library
+
+    async def run():
+        await library.prefetch('alice', 'secret', [series_id])
+        library.ttl = 0
+        stub.series.clear()
+        return await library.info('alice', 'secret', series_id)
+
+    info = asyncio.run(run())
+    assert info['info']['series_id'] == series_id
+    assert library.stats()['empty'] == 1
+
+
+def test_series_page_prefetches_visible_titles(backend, stub):
+    with TestClient(backend.app) as client:
+        headers = login(client)
+        client.get('/api/series/list', params={'limit': 4}, headers=headers)
+        deadline = time.monotonic() + 5
+        while stub.calls['get_series_info'] < 4 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    assert stub.calls['get_series_info'] == 4
+
+
+def test_episode_url_uses_stored_container(backend, stub):
+    series_id = stub.series[0]['series_id']
+    asyncio.run(backend.series_library.prefetch('alice', 'secret', [series_id]))
+    episode_id = series_id * 100 + 11
+
+    with TestClient(backend.app) as client:
+        headers = login(client)
+        known = client.post('/api/series/episode-url', json={'stream_id': episode_id}, headers=headers).json()
+        unknown = client.post('/api/series/episode-url', json={'stream_id': 7}, headers=headers).json()
+
+    assert known['stream_url'].endswith(f'/series/alice/secret/{episode_id}.mkv')
+    assert unknown['stream_url'].endswith('/series/alice/secret/7.mp4')
@@ -0,0 +1,111 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import httpx
+from fastapi.testclient import TestClient
+
+from tests.stub_xtream import STUB_BASE_URL, StubXtream
+
+CREDS = {'username': 'alice', 'password': 'secret'}
+
+
+def test_login_issues_token_expiring_with_the_subscription(backend, stub):
+    with TestClient(backend.app) as client:
+        login = client.post('/api/auth/login', json=CREDS).json()
+        headers = {'Authorization': f"Bearer {login['token']}"}
+        auth_calls = stub.calls['auth']
+        categories = client.get('/api/live/categories', headers=headers)
+        streams = client.get('/api/live/streams', params={'limit': 2}, headers=headers)
+        url = client.post('/api/live/stream-url', json={'stream_id': 7}, headers=headers).json()
+
+    assert login['success'] is True
+    # The stub's exp_date is far away, so SESSION_MAX_AGE applies
+    assert abs(login['expires_at'] - (datetime.utcnow() - datetime(1970, 1, 1)).total_seconds() - backend.SESSION_MAX_AGE) < 5
+    assert categories.status_code == streams.status_code == 200
+    assert url['stream_url'].endswith('/live/alice/secret/7.m3u8')
+    assert stub.calls['auth'] == auth_calls
+
+
+def test_expiry_follows_exp_date():
+    from server import session_expiry
+
+    soon = datetime.utcnow().replace(microsecond=0) + timedelta(days=2)
+    timestamp = int((soon - datetime(1970, 1, 1)).total_seconds())
+    assert session_expiry({'exp_date': str(timestamp)}) == soon
+    assert session_expiry({'exp_date': None}) > datetime.utcnow() + timedelta(days=29)
+
+
+def test_raw_credentials_authenticate_upstream_once(backend, stub):
+    with TestClient(backend.app) as client:
+        for _ in range(3):
+            assert client.get('/api/vod/categories', params=CREDS).status_code == 200
+
+    assert stub.calls['auth'] == 1
+
+
+def test_unknown_tokens_and_wrong_passwords_are_rejected_locally(monkeypatch, backend):
+    stub = StubXtream(users={'alice': 'secret'})
+    monkeypatch.setattr(
+        backend, 'xtream_api',
+        backend.XtreamCodesAPI(base_url=STUB_BASE_URL, transport=httpx.ASGITransport(app=stub.app))
+    )
+
+    with TestClient(backend.app) as client:
+        token = client.post('/api/auth/login', json=CREDS).json()['token']
+        bad_token = client.get('/api/live/categories', headers={'Authorization': 'Bearer nope'})
+        wrong = [client.get('/api/live/categories', params={'username': 'alice', 'password': 'x'}) for _ in range(3)]
+        anonymous = client.get('/api/live/categories')
+        client.post('/api/auth/logout', headers={'Authorization': f"Bearer {token}"})
+        revoked = client.get('/api/live/categories', headers={'Authorization': f"Bearer {token}"})
+
+    assert bad_token.status_code == 401
+    assert [r.status_code for r in wrong] == [401, 401, 401]
+    assert anonymous.status_code == 401
+    assert revoked.status_code == 401
+    # Login plus one rejected attempt; repeats of the wrong password stay local
+    assert stub.calls['auth'] == 2
+
+
+def test_sessions_survive_a_restart_through_mongo(backend):
+    async def scenario():
+        token, _ = await backend.sessions.issue('alice', 'secret', {'exp_date': None})
+        restarted = backend.SessionStore(backend.db.session_tokens)
+        return await restarted.resolve_token(token)
+
+    session = asyncio.run(scenario())
+    assert (session.username, session.password) == ('alice', 'secret')
+
+
+def test_rejected_credentials_are_bounded(monkeypatch, backend):
+    stub = StubXtream(users={'alice': 'secret'})
+    monkeypatch.setattr(
+        backend, 'xtream_api',
+        backend.XtreamCodesAPI(base_url=STUB_BASE_URL, transport=httpx.ASGITransport(app=stub.app))
+    )
+    store = backend.SessionStore(backend.db.session_tokens, max_entries=3)
+
+    async def scenario():
+        for i in range(10):
+            assert await store.resolve_credentials(f"user{i}", 'guess') is None
+        # The most recent rejection is still answered locally
+        await store.resolve_credentials('user9', 'guess')
+
+    asyncio.run(scenario())
+    assert store.stats()['rejected_cached'] == 3
+    assert stub.calls['auth'] == 10
+
+
+def test_playback_routes_keep_users_active_and_ingest_takes_a_bare_token(backend):
+    with TestClient(backend.app) as client:
+        for path in ('/api/live/stream-url', '/api/vod/stream-url', '/api/series/episode-url'):
+            assert client.post(path, json={**CREDS, 'stream_id': 7}).status_code == 200
+        batch = client.post('/api/live/epg/batch', json={**CREDS, 'stream_ids': [7]})
+        # Never logged in, so only the routes above can have written the login record
+        record = asyncio.run(backend.db.sessions.find_one({'username': 'alice'}))
+        token = client.post('/api/auth/login', json=CREDS).json()['token']
+        ingest = client.post('/api/epg/ingest', headers={'Authorization': f"Bearer {token}"})
+
+    assert batch.status_code == 200
+    assert ingest.status_code == 202
+    assert record['last_activity'] > datetime.utcnow() - timedelta(minutes=1)
+    assert backend.sessions.stats()['activity_writes'] == 1
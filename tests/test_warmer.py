@@ -0,0 +1,121 @@
+import asyncio
+from datetime import datetime
+
+
+def add_sessions(backend, *usernames):
+    async def run():
+        for username in usernames:
+            await backend.db.sessions.insert_one({
+                'username': username,
+                'password': 'secret',
+                'last_activity': datetime.utcnow(),
+            })
+
+    asyncio.run(run())
+
+
+def test_warmer_fetches_each_package_once(backend, stub):
+    add_sessions(backend, 'alice', 'bob', 'carol')
+    warmer = backend.CatalogWarmer()
+
+    results = asyncio.run(warmer.run_once())
+
+    assert len(results) == 3
+    assert stub.calls['get_live_streams'] == 1
+    assert stub.calls['get_vod_streams'] == 1
+    assert stub.calls['get_series'] == 1
+    live_key = next(key for key in results if key.startswith('catalog_live_'))
+    assert results[live_key] == {'added': len(stub.live), 'removed': 0, 'modified': 0}
+
+
+def test_warmer_diffs_against_previous_snapshot(backend, stub):
+    add_sessions(backend, 'alice')
+    warmer = backend.CatalogWarmer()
+    asyncio.run(warmer.run_once())
+
+    stub.live.append(stub._live_item(999))
+    stub.live[0] = {**stub.live[0], 'name': 'Renamed'}
+    del stub.vod[0]
+    results = asyncio.run(warmer.run_once())
+
+    by_kind = {key.split('_')[1]: changes for key, changes in results.items()}
+    assert by_kind['live'] == {'added': 1, 'removed': 0, 'modified': 1}
+    assert by_kind['vod'] == {'added': 0, 'removed': 1, 'modified': 0}
+    assert by_kind['series'] == {'added': 0, 'removed': 0, 'modified': 0}
+    assert warmer.stats()['unchanged'] == 1
+
+
+def test_warmed_catalog_serves_requests_without_upstream(backend, stub):
+    from fastapi.testclient import TestClient
+
+    add_sessions(backend, 'alice')
+    asyncio.run(backend.CatalogWarmer().run_once())
+
+    with TestClient(backend.app) as client:
+        token = client.post('/api/auth/login', json={'username': 'alice', 'password': 'secret'}).json()['token']
+        calls_before = sum(stub.calls.values())
+        response = client.get(
+            '/api/live/streams', params={'limit': 6}, headers={'Authorization': f"Bearer {token}"}
+        )
+
+    assert response.status_code == 200
+    assert len(response.json()) == 6
+    assert sum(stub.calls.values()) == calls_before
+
+
+def test_requests_keep_returning_users_in_the_warm_set(backend):
+    from fastapi.testclient import TestClient
+
+    stale = datetime.utcnow() - backend.timedelta(days=backend.CATALOG_WARMER_ACTIVE_DAYS + 1)
+    asyncio.run(backend.db.sessions.insert_one({'username': 'alice', 'password': 'secret', 'last_activity': stale}))
+    warmer = backend.CatalogWarmer()
+    assert asyncio.run(warmer._active_accounts()) == []
+
+    with TestClient(backend.app) as client:
+        params = {'username': 'alice', 'password': 'secret'}
+        assert client.get('/api/live/categories', params=params).status_code == 200
+        assert asyncio.run(warmer._active_accounts()) == [params]
+
+        # Throttled: a second request within the interval does not write again
+        asyncio.run(backend.db.sessions.update_one({'username': 'alice'}, {'$set': {'last_activity': stale}}))
+        client.get('/api/live/categories', params=params)
+
+    assert asyncio.run(warmer._active_accounts()) == []
+    assert backend.sessions.stats()['activity_writes'] == 1
+
+
+def test_stale_categories_are_refreshed_within_the_warmer_concurrency(backend, stub):
+    usernames = [f"user{i}" for i in range(6)]
+    add_sessions(backend, *usernames)
+    warmer = backend.CatalogWarmer(concurrency=2)
+    asyncio.run(warmer.run_once())
+
+    async def age_categories():
+        stale = datetime.utcnow() - backend.timedelta(seconds=backend.CATEGORIES_TTL + 60)
+        await backend.db.cache.update_many({'key': {'$regex': 'categories_'}}, {'$set': {'timestamp': stale}})
+        for entry in backend.cache._entries.values():
+            entry.timestamp = stale
+
+    asyncio.run(age_categories())
+    stub.latency = 0.02
+    inflight, peak = [0], [0]
+    for action in ('get_live_categories', 'get_vod_categories', 'get_series_categories'):
+        fetch = getattr(backend.xtream_api, action)
+
+        async def counted(*args, _fetch=fetch, **kwargs):
+            inflight[0] += 1
+            peak[0] = max(peak[0], inflight[0])
+            try:
+                return await _fetch(*args, **kwargs)
+            finally:
+                inflight[0] -= 1
+
+        setattr(backend.xtream_api, action, counted)
+    calls_before = sum(stub.calls[action] for action in ('get_live_categories', 'get_vod_categories', 'get_series_categories'))
+
+    asyncio.run(warmer.run_once())
+
+    refreshed = sum(stub.calls[action] for action in ('get_live_categories', 'get_vod_categories', 'get_series_categories'))
+    assert refreshed - calls_before == len(usernames) * 3
+    assert peak[0] <= 2
+    assert backend.cache.stats()['background_refreshes'] == 0
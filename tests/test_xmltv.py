@@ -0,0 +1,114 @@
+import asyncio
+import time
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+
+from server import EpgGuide, XmltvParser, parse_xmltv_time
+
+CREDS = {'username': 'alice', 'password': 'secret'}
+
+
+def test_parse_xmltv_time_converts_offsets_to_utc():
+    assert parse_xmltv_time('20240101120000 +0100') == datetime(2024, 1, 1, 11, 0, 0)
+    assert parse_xmltv_time('20240101120000 -0230') == datetime(2024, 1, 1, 14, 30, 0)
+    assert parse_xmltv_time('20240101120000') == datetime(2024, 1, 1, 12, 0, 0)
+    assert parse_xmltv_time('garbage') is None
+
+
+def test_parser_handles_documents_split_anywhere(stub):
+    document = stub.xmltv(hours=1).encode()
+    parser = XmltvParser()
+    channels, programmes = [], []
+    for i in range(0, len(document), 37):
+        c, p = parser.feed(document[i:i + 37])
+        channels += c
+        programmes += p
+    parser.close()
+
+    assert len(channels) == len(stub.live)
+    assert channels[0] == {'channel': 'channel1.stub', 'name': 'Channel 1', 'icon': 'http://stub-xtream/images/live/1.png'}
+    assert len(programmes) == len(stub.live) * 2
+    assert programmes[0]['title'] == 'Programme 0 on 1'
+
+
+def test_ingest_serves_now_next_and_grid(backend, stub):
+    with TestClient(backend.app) as client:
+        assert client.post('/api/epg/ingest', json=CREDS).status_code == 202
+        for _ in range(100):
+            if backend.epg_guide.stats()['ingests']:
+                break
+            time.sleep(0.05)
+        now_next = client.get('/api/epg/now-next', params={**CREDS, 'channels': 'channel3.stub,missing'}).json()
+        start = time.time()
+        grid = client.get('/api/epg/grid', params={**CREDS, 'start': start, 'end': start + 3600}).json()
+        too_wide = client.get('/api/epg/grid', params={**CREDS, 'start': start, 'end': start + 25 * 3600})
+
+    assert list(now_next) == ['channel3.stub']
+    current, following = now_next['channel3.stub']['now'], now_next['channel3.stub']['next']
+    assert current['title'] == 'Programme 0 on 3'
+    assert current['start_timestamp'] <= start < current['stop_timestamp']
+    assert following['start_timestamp'] == current['stop_timestamp']
+    assert len(grid) == len(stub.live)
+    assert [p['title'] for p in grid['channel1.stub']][:2] == ['Programme 0 on 1', 'Programme 1 on 1']
+    assert too_wide.status_code == 400
+
+
+def test_reingest_replaces_previous_guide_and_other_workers_reload(backend, stub):
+    async def scenario():
+        guide = backend.epg_guide
+        await guide.ingest_from_upstream(**CREDS)
+        stub.live = stub.live[:2]
+        second = await guide.ingest_from_upstream(**CREDS)
+        stored = await backend.db.epg_programmes.count_documents({})
+
+        other = EpgGuide(backend.db.epg_programmes, backend.db.epg_meta)
+        await other.ensure_loaded()
+        return second, stored, other
+
+    second, stored, other = asyncio.run(scenario())
+    assert second['channels'] == 2
+    assert stored == second['programmes']
+    assert other.ingest_id == second['ingest_id']
+    assert sorted(other.now_next()) == ['channel1.stub', 'channel2.stub']
+
+
+def test_guide_routes_require_a_session(backend):
+    with TestClient(backend.app) as client:
+        now_next = client.get('/api/epg/now-next')
+        grid = client.get('/api/epg/grid', headers={'Authorization': 'Bearer nope'})
+
+    assert now_next.status_code == 401
+    assert grid.status_code == 401
+
+
+def test_concurrent_ingests_and_reloads_never_mix_generations(backend, stub):
+    document = stub.xmltv().encode()
+
+    async def slowly():
+        for i in range(0, len(document), 4096):
+            await asyncio.sleep(0.001)
+            yield document[i:i + 4096]
+
+    async def scenario():
+        db = backend.db
+        workers = [EpgGuide(db.epg_programmes, db.epg_meta, leases=backend.MongoLease(db.cache_leases), lease_poll_interval=0.01)
+                   for _ in range(2)]
+        await workers[0].ingest(slowly())
+        reader = EpgGuide(db.epg_programmes, db.epg_meta)
+        second = asyncio.ensure_future(asyncio.gather(*[worker.ingest(slowly()) for worker in workers]))
+        # Reloading while the new generations are half written only sees the published one
+        while not await db.epg_programmes.count_documents({'ingest_id': {'$ne': workers[0].ingest_id}}):
+            await asyncio.sleep(0.001)
+        await reader.ensure_loaded()
+        results = await second
+        meta = await db.epg_meta.find_one({'_id': 'xmltv'})
+        stored = await db.epg_programmes.count_documents({})
+        published = await db.epg_programmes.count_documents({'ingest_id': meta['ingest_id']})
+        return workers, results, reader, meta, stored, published
+
+    workers, results, reader, meta, stored, published = asyncio.run(scenario())
+    assert [r['programmes'] for r in results] == [meta['programmes']] * 2
+    assert stored == published == meta['programmes']
+    assert workers[0].stats()['lease_waits'] + workers[1].stats()['lease_waits'] > 0
+    assert reader.stats()['programmes_in_memory'] == workers[0].stats()['programmes_in_memory']